@@ -0,0 +1,110 @@
+"""
+Import-time benchmark for gossamer's entry points.
+
+Each module is imported in fresh interpreters, and the median time is
+reported. Python 2 has no `-X importtime`, so the import is timed from
+within the interpreter. As times vary from machine to machine, what is
+checked is the modules each import loads: none may be among those that
+must stay lazy, and none may be new to the baseline in importtime.json.
+Outside gossamer, modules are counted by their top-level package, and
+only those written in Python, as whether others are built in varies.
+
+    python bench/importtime.py           # report
+    python bench/importtime.py --check   # fail on a new import
+    python bench/importtime.py --update  # rewrite the baseline
+"""
+
+# Copyright (c) 2013 contributors; see AUTHORS.
+# Licensed under the Apache License, Version 2.0
+# https://www.apache.org/licenses/LICENSE-2.0
+
+import json
+import os
+import subprocess
+import sys
+
+MODULES = ('gossamer.cli', 'gossamer.integration')
+
+# imported only when first needed
+LAZY = ('selenium', 'PIL', 'Image', 'pkg_resources')
+
+RUNS = 9
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'importtime.json')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_SCRIPT = """
+import json, sys, time
+before = set(sys.modules)
+started = time.time()
+import %s
+elapsed = time.time() - started
+print(json.dumps({'ms': elapsed * 1000, 'modules': sorted(
+    name for name, module in sys.modules.items()
+    if name not in before and
+        (getattr(module, '__file__', None) or '').endswith(('.py', '.pyc', '.pyo'))
+)}))
+"""
+
+
+def measure(module, runs=RUNS):
+    """
+    Median milliseconds to import `module`, and the modules it loaded.
+    """
+    times = []
+    loaded = set()
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    for _ in range(runs + 1):
+        output = subprocess.check_output(
+            [sys.executable, '-c', _SCRIPT % module], env=env, cwd=ROOT
+        )
+        result = json.loads(output.splitlines()[-1])
+        times.append(result['ms'])
+        loaded.update(
+            name if name.split('.')[0] == 'gossamer' else name.split('.')[0]
+            for name in result['modules']
+        )
+    # the first run may compile gossamer's .pyc files
+    times = sorted(times[1:])
+    return (times[len(times) // 2], sorted(loaded))
+
+
+def main(argv):
+    """
+    Report import times, and check or update the modules imported.
+    """
+    try:
+        with open(BASELINE, 'r') as fp:
+            baseline = json.loads(fp.read())
+    except (IOError, ValueError):
+        baseline = {}
+    failed = False
+    results = {}
+    for module in MODULES:
+        elapsed, loaded = measure(module)
+        results[module] = loaded
+        line = '%-24s %7.1f ms  %3d modules' % (module, elapsed, len(loaded))
+        lazy = [name for name in loaded if name.split('.')[0] in LAZY]
+        if lazy:
+            line += '  imports %s' % ', '.join(lazy)
+            failed = True
+        if module in baseline:
+            new = [name for name in loaded if name not in baseline[module]]
+            if new:
+                line += '  newly imports %s' % ', '.join(new)
+                failed = True
+        sys.stdout.write(line + '\n')
+    if '--update' in argv:
+        with open(BASELINE, 'w') as fp:
+            fp.write(json.dumps(
+                results, indent=2, sort_keys=True, separators=(',', ': ')
+            ) + '\n')
+        sys.stdout.write('Baseline written to %s\n' % BASELINE)
+    elif '--check' in argv and failed:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,178 @@
+"""
+Orchestration benchmark: plays back synthetic tests on fake WebDrivers and
+reports the suite's wall time, WebDriver round trips per step and CPU time
+per step, for tests of several sizes.
+
+Steps' fixed delays are skipped, so what is measured is Gossamer's own
+overhead. With `--http`, the fake sessions are served over HTTP to the
+W3C client. Round trips don't depend on the machine, so `--check` fails
+if they grow beyond the baseline in orchestration.json.
+
+    python bench/orchestration.py                # report
+    python bench/orchestration.py --http         # through gossamer.w3c
+    python bench/orchestration.py --check        # fail on more round trips
+    python bench/orchestration.py --update       # rewrite the baseline
+"""
+
+# Copyright (c) 2013 contributors; see AUTHORS.
+# Licensed under the Apache License, Version 2.0
+# https://www.apache.org/licenses/LICENSE-2.0
+
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# pylint: disable=C0413
+from gossamer import fake, pool, step, w3c
+from gossamer.constant import modes
+from gossamer.data import Point, Settings, Test
+from gossamer.pool import SessionPool
+from gossamer import util
+
+# steps per test
+SIZES = (10, 100, 1000)
+
+TESTS = 8
+
+JOBS = 4
+
+# a screenshot every this many steps
+SCREENSHOT_EVERY = 10
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'orchestration.json')
+
+
+@contextlib.contextmanager
+def no_delays():
+    """
+    Skip every step's fixed delay.
+    """
+    classes = [step.TestStep] + [
+        cls for cls in vars(step).values()
+        if isinstance(cls, type) and issubclass(cls, step.TestStep)
+    ]
+    originals = dict(
+        (cls, cls.__dict__['delayer']) for cls in classes if 'delayer' in cls.__dict__
+    )
+    for cls in originals:
+        cls.delayer = lambda self, driver: None
+    try:
+        yield
+    finally:
+        for cls, delayer in originals.items():
+            cls.delayer = delayer
+
+
+def synthetic_test(path, name, size):
+    """
+    A test of `size` steps, clicking, scrolling and typing, with a
+    screenshot every :data:`SCREENSHOT_EVERY` steps and at the end.
+    """
+    directory = os.path.join(path, name)
+    os.makedirs(os.path.join(directory, 'last'))
+    steps, screenshots = [], 0
+    for num in range(1, size + 1):
+        if num % SCREENSHOT_EVERY == 0 or num == size:
+            screenshots += 1
+            steps.append(step.Screenshot(num, screenshots))
+            with open(os.path.join(directory, 'screenshot%d.png' % screenshots), 'wb') as fp:
+                fp.write(fake.png())
+        elif num % 3 == 0:
+            steps.append(step.Text(num, 'field%d' % num, 'id', 'text'))
+        elif num % 3 == 1:
+            steps.append(step.Click(num, Point(num % 800, num % 600)))
+        else:
+            steps.append(step.Scroll(num, Point(0, 10)))
+    settings = Settings(
+        name, 'http://example.com/', modes.PLAYBACK, directory, 'chrome',
+        (1024, 768), None, (0, 255, 0), False
+    )
+    return Test(1, settings, steps)
+
+
+def measure(size, http=False, tests=TESTS, jobs=JOBS):
+    """
+    Play back `tests` synthetic tests of `size` steps, `jobs` at once,
+    returning a dictionary of the measurements.
+    """
+    path = tempfile.mkdtemp()
+    server = fake.Server().start() if http else None
+    try:
+        suite = dict(
+            ('test%d' % i, synthetic_test(path, 'test%d' % i, size)) for i in range(tests)
+        )
+        if http:
+            sessions = SessionPool(jobs, server.url, client='w3c')
+        else:
+            sessions = fake.SessionPool(jobs)
+        before, started = os.times(), time.time()
+        with no_delays():
+            results = pool.run_tests(
+                suite, modes.PLAYBACK, sessions, output=util.null_writer
+            )
+        wall, after = time.time() - started, os.times()
+        sessions.close()
+        failed = [name for name, (state, _) in results.items() if str(state) != 'ok']
+        if failed:
+            raise RuntimeError('Tests failed: %s' % ', '.join(sorted(failed)))
+        steps = float(tests * size)
+        drivers = server.drivers if http else sessions.drivers
+        return {
+            'wall': wall,
+            'round_trips': sum(driver.round_trips for driver in drivers) / steps,
+            'cpu': (after[0] + after[1] - before[0] - before[1]) / steps,
+        }
+    finally:
+        if server:
+            w3c.connection_pool(server.url).close()
+            server.stop()
+        shutil.rmtree(path)
+
+
+def main(argv):
+    """
+    Report, check or update the measurements.
+    """
+    http = '--http' in argv
+    key = 'http' if http else 'in-process'
+    try:
+        with open(BASELINE, 'r') as fp:
+            baseline = json.loads(fp.read())
+    except (IOError, ValueError):
+        baseline = {}
+    failed = False
+    results = {}
+    sys.stdout.write('%d tests, %d at once, %s\n' % (TESTS, JOBS, key))
+    sys.stdout.write('%6s %10s %14s %14s\n' % ('steps', 'wall s', 'trips/step', 'cpu ms/step'))
+    for size in SIZES:
+        result = measure(size, http)
+        results[str(size)] = round(result['round_trips'], 2)
+        line = '%6d %10.2f %14.2f %14.3f' % (
+            size, result['wall'], result['round_trips'], result['cpu'] * 1000
+        )
+        known = baseline.get(key, {}).get(str(size))
+        if known is not None and round(result['round_trips'], 2) > known:
+            line += '  MORE ROUND TRIPS (baseline %.2f)' % known
+            failed = True
+        sys.stdout.write(line + '\n')
+    if '--update' in argv:
+        baseline[key] = results
+        with open(BASELINE, 'w') as fp:
+            fp.write(json.dumps(
+                baseline, indent=2, sort_keys=True, separators=(',', ': ')
+            ) + '\n')
+        sys.stdout.write('Baseline written to %s\n' % BASELINE)
+    elif '--check' in argv and failed:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,84 @@
+"""
+Run a whole suite of tests concurrently through one call, for use from
+other Python programs.
+
+Gossamer runs on Python 2, which has no `asyncio`; Selenium's client
+blocks on every command, so each browser session is driven by a thread of
+its own from :mod:`gossamer.pool`. Screenshot comparisons run on a
+separate, smaller :class:`gossamer.pool.Executor`, so that a session moves
+on to its next steps while its screenshots are compared.
+"""
+
+# Copyright (c) 2013 contributors; see AUTHORS.
+# Licensed under the Apache License, Version 2.0
+# https://www.apache.org/licenses/LICENSE-2.0
+
+from gossamer.constant import modes
+from gossamer.pool import SessionPool, Executor, run_tests
+from gossamer import util
+
+__all__ = ['run_suite', ]
+
+
+def run_suite(
+        tests, concurrency=4, selenium=None, mode=modes.PLAYBACK,
+        reuse=1, compare_workers=2, pool=None, output=None, stop_on_error=False,
+        client=None
+    ): # pylint: disable=R0913
+    """
+    Run `tests`, as made by :func:`gossamer.util.make_tests`, with up to
+    `concurrency` browser sessions at once, and return a dictionary of test
+    name to `(state, err)` as returned by :func:`gossamer.main.dispatch`.
+
+    Parameters:
+
+        tests, dict:
+            Test names to :class:`gossamer.data.Test`.
+
+        concurrency (optional), int:
+            The number of browser sessions to drive at once.
+
+        selenium (optional), str:
+            The Selenium Server URL to use. This can be a local stand-in
+            WebDriver server for testing.
+
+        mode (optional):
+            :data:`gossamer.constant.modes.PLAYBACK` or `RERECORD`.
+
+        reuse (optional), int:
+            Reuse each session for up to this many tests; see
+            :class:`gossamer.pool.SessionPool`.
+
+        compare_workers (optional), int:
+            The number of threads comparing screenshots.
+
+        pool (optional), :class:`gossamer.pool.SessionPool`:
+            Sessions to use instead of a new pool from `concurrency`,
+            `selenium`, `reuse` and `client`. It is not closed afterwards.
+
+        output (optional), callable:
+            Writer for test output, e.g., :func:`gossamer.util.stdout_writer`.
+            Each test's output is written as a whole. Default no output.
+
+        stop_on_error (optional), bool:
+            Start no further tests after one fails or errors.
+
+        client (optional), str:
+            The WebDriver client, 'selenium' (the default) or 'w3c'.
+
+    """
+    if mode == modes.RECORD:
+        raise ValueError('Recording is interactive and cannot be run as a suite')
+    sessions = pool or SessionPool(concurrency, selenium, reuse=reuse, client=client)
+    executor = Executor(compare_workers)
+    try:
+        return run_tests(
+            tests, mode, sessions,
+            output=output or util.null_writer,
+            stop_on_error=stop_on_error,
+            executor=executor
+        )
+    finally:
+        executor.shutdown()
+        if pool is None:
+            sessions.close()
@@ -0,0 +1,99 @@
+"""
+A catalog of the tests in Gossamerfiles, cached in the data directory so
+that a large suite isn't re-parsed every run.
+
+Each Gossamerfile's sections are kept with the file's modification time
+and size, and a file is parsed again only when either changes.
+"""
+
+# Copyright (c) 2013 contributors; see AUTHORS.
+# Licensed under the Apache License, Version 2.0
+# https://www.apache.org/licenses/LICENSE-2.0
+
+import ConfigParser
+import json
+import os
+
+__all__ = ['Catalog', ]
+
+FILENAME = 'catalog.json'
+
+CATALOG_VERSION = 1
+
+
+class Catalog(object):
+    """
+    Tests in Gossamerfiles, cached in `data_dir`.
+    """
+
+    def __init__(self, data_dir):
+        self.filename = os.path.join(data_dir, FILENAME)
+        self.files = {}
+        self._changed = False
+        try:
+            with open(self.filename, 'r') as fp:
+                catalog = json.loads(fp.read())
+            if catalog.get('version') == CATALOG_VERSION:
+                self.files = catalog['files']
+        except (IOError, ValueError, KeyError):
+            pass
+
+    def sections(self, test_files):
+        """
+        List of `(name, Gossamerfile, options)` for each test in
+        `test_files`, in order, where `options` is a dictionary of the
+        test's section. Saves the catalog if any file had changed.
+        """
+        ret = []
+        for file_name in test_files:
+            ret.extend(
+                (name, file_name, options) for name, options in self._read(file_name)
+            )
+        if self._changed:
+            self.save()
+        return ret
+
+    def names(self, test_files):
+        """
+        Names of the tests in `test_files`, in order.
+        """
+        return [name for name, _, _ in self.sections(test_files)]
+
+    def _read(self, file_name):
+        """
+        Sections of a Gossamerfile, parsed only if it has changed.
+        """
+        try:
+            stat = os.stat(file_name)
+        except OSError:
+            if self.files.pop(file_name, None) is not None:
+                self._changed = True
+            return []
+        entry = self.files.get(file_name)
+        if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            return entry['sections']
+        config = ConfigParser.SafeConfigParser(allow_no_value=True)
+        config.read([file_name])
+        sections = [
+            (name, dict(config.items(name))) for name in config.sections()
+        ]
+        self.files[file_name] = {
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'sections': sections,
+        }
+        self._changed = True
+        return sections
+
+    def save(self):
+        """
+        Write the catalog, if the data directory exists.
+        """
+        temporary = '%s.%d' % (self.filename, os.getpid())
+        try:
+            with open(temporary, 'w') as fp:
+                fp.write(json.dumps({'version': CATALOG_VERSION, 'files': self.files}))
+            os.rename(temporary, self.filename)
+        except (IOError, OSError):
+            return
+        self._changed = False
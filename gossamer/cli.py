@@ -8,22 +8,40 @@ Command-line interface to the app.
 
 import glob
 import os
+import sqlite3
 import sys
 
 import plac # pylint: disable=F0401
 
-from gossamer.main import dispatch
 from gossamer.constant import modes, exits, states, \
     DEFAULT_WEBDRIVER, DEFAULT_TESTFILE, \
     DEFAULT_DIFFCOLOR, DEFAULT_SCREENSIZE, \
     DEFAULT_BROWSER
-from gossamer import util, exc
+from gossamer import util, exc, pool, run, journal, report as reports, \
+    trace as tracing, hooks as plugins
+from gossamer.pool import RESETS
+from gossamer.shard import parse_shard, select, read_durations, \
+    write_results, merge_results
+from gossamer.history import History, schedule
+from gossamer.impact import URLIndex, read_changes
+from gossamer.step import Screenshot
 from gossamer import __version__
 
+_MODE_NAMES = {
+    modes.RECORD: 'record', modes.RERECORD: 'rerecord', modes.PLAYBACK: 'playback'
+}
+
+# ways to verify recordings
+_VERIFY = ('now', 'background', 'skip')
+
+_RECORDED_RUN_ERRORS = (
+    exc.RecordedRunDoesNotExist, exc.RecordedRunEmpty, exc.CouldNotParseRecordedRun
+)
 
 @plac.annotations(
     names = plac.Annotation(
-        'Test case name(s) to use, comma-separated',
+        'Test case name(s) to use, comma-separated; when rerecording, '
+        'name:N,N selects screenshots of a test',
     ),
     postdata = plac.Annotation(
         'File for POST data or - for stdin'
@@ -48,6 +66,11 @@ from gossamer import __version__
         'option', 's',
         metavar=DEFAULT_WEBDRIVER
     ),
+    client = plac.Annotation(
+        'WebDriver client to use, either selenium or w3c',
+        'option', 'client', str,
+        metavar='selenium'
+    ),
 
     browser = plac.Annotation(
         'Browser to use, either firefox, chrome, phantomjs, ie, or opera',
@@ -70,6 +93,12 @@ from gossamer import __version__
         'flag', 'e'
     ),
 
+    fingerprint = plac.Annotation(
+        'When recording, fingerprint the page with each screenshot, to skip '
+        'comparing screenshots whose pages match',
+        'flag', 'fingerprint'
+    ),
+
     overwrite = plac.Annotation(
         'Overwrite existing tests without asking',
         'flag', 'o'
@@ -90,9 +119,124 @@ from gossamer import __version__
         'flag', 'v', 'verbose'
     ),
 
+    verify = plac.Annotation(
+        'When recording, verify each test by playing it back: now, in the '
+        'background on another session while the next is recorded, or skip',
+        'option', 'verify', str,
+        metavar='now'
+    ),
+
+    failed = plac.Annotation(
+        'When rerecording, rerecord only the screenshots which differed in '
+        'the last run',
+        'flag', 'failed'
+    ),
+
     stop_on_error = plac.Annotation(
         'During playback, stop on error',
         'flag', 't', 'stop'
+    ),
+
+    failed_first = plac.Annotation(
+        'Play back the tests which failed in the last run first',
+        'flag', 'failed_first'
+    ),
+
+    jobs = plac.Annotation(
+        'Number of tests to play back or rerecord at once',
+        'option', 'j', int,
+        metavar='N'
+    ),
+
+    reuse = plac.Annotation(
+        'Reuse each WebDriver session for up to N tests',
+        'option', 'u', int,
+        metavar='N'
+    ),
+
+    resets = plac.Annotation(
+        'State to clear between tests on a reused WebDriver session',
+        'option', 'x', str,
+        metavar=','.join(RESETS)
+    ),
+
+    shard = plac.Annotation(
+        'Run only shard I of N of the tests, e.g., 2/4',
+        'option', 'shard', str,
+        metavar='I/N'
+    ),
+    results = plac.Annotation(
+        'Write results as JSON to FILE',
+        'option', 'results', str,
+        metavar='FILE'
+    ),
+    durations = plac.Annotation(
+        'Results FILE from an earlier run whose durations weigh shards',
+        'option', 'durations', str,
+        metavar='FILE'
+    ),
+    merge = plac.Annotation(
+        'Merge the results FILE(s) of every shard into one verdict',
+        'option', 'merge', str,
+        metavar='GLOB'
+    ),
+
+    report = plac.Annotation(
+        'Write a JSON report of the run with the time in each phase to FILE',
+        'option', 'report', str,
+        metavar='FILE'
+    ),
+    junit = plac.Annotation(
+        'Write a JUnit XML report of the run to FILE',
+        'option', 'junit', str,
+        metavar='FILE'
+    ),
+
+    hooks = plac.Annotation(
+        'Hooks to call, comma-separated, each an installed gossamer.hooks '
+        'entry point or module:attribute',
+        'option', 'hooks', str,
+        metavar='NAMES'
+    ),
+
+    trace = plac.Annotation(
+        'Write a Chrome trace of the run, for Perfetto or about:tracing, to FILE',
+        'option', 'trace', str,
+        metavar='FILE'
+    ),
+    trace_memory = plac.Annotation(
+        'Include the memory in use at the start and end of each test in the trace',
+        'flag', 'trace_memory'
+    ),
+
+    slowest = plac.Annotation(
+        'Report the N slowest tests and steps from the run history',
+        'option', 'slowest', int,
+        metavar='N'
+    ),
+
+    changed = plac.Annotation(
+        'Run only tests visiting URLs with these prefixes or patterns, '
+        'comma-separated, e.g., /checkout,/users/*/edit',
+        'option', 'changed', str,
+        metavar='PREFIXES'
+    ),
+    changed_from = plac.Annotation(
+        'Run only tests visiting URLs with the prefixes or patterns in FILE, '
+        'one per line',
+        'option', 'changed_from', str,
+        metavar='FILE'
+    ),
+
+    convert = plac.Annotation(
+        'Convert the tests\' recorded runs to FORMAT, json or binary',
+        'option', 'convert', str,
+        metavar='FORMAT'
+    ),
+
+    salvage = plac.Annotation(
+        'Make records of the tests from the journals of interrupted recordings',
+        'flag', 'salvage'
     ) # pylint: disable=R0915,R0912,R0911,R0914
 )
 
@@ -103,16 +247,38 @@ def initialize(
         record=False,
         rerecord=False,
         selenium=None,
+        client=None,
         postdata=None,
         browser=None,
         screensize=None,
         diffcolor=None,
         save_diff=False,
+        fingerprint=False,
+        verify=None,
+        failed=False,
         overwrite=False,
         data_dir=None,
         version=False,
         verbose=False,
-        stop_on_error=False
+        stop_on_error=False,
+        failed_first=False,
+        jobs=None,
+        reuse=None,
+        resets=None,
+        shard=None,
+        results=None,
+        durations=None,
+        merge=None,
+        report=None,
+        junit=None,
+        hooks=None,
+        trace=None,
+        trace_memory=False,
+        slowest=None,
+        changed=None,
+        changed_from=None,
+        convert=None,
+        salvage=False
     ): # pylint: disable=R0913,W0613
     """
     Gossamer CLI.
@@ -123,13 +289,19 @@ def initialize(
         sys.stdout.flush()
         return exits.OK
 
+    if merge:
+        return _merge(merge, results)
+
+    if slowest:
+        return _slowest(slowest, data_dir or os.path.join(os.getcwd(), 'gossamer'))
+
     sys.stdout.write('Initializing gossamer and opening WebDriver...\n')
     sys.stdout.flush()
 
     if verbose:
         util.log = util.logger(__name__, 'DEBUG')
 
-    names = names.split(',') if names else None
+    names, screenshots = _select_screenshots(names) if names else (None, {})
     browser = browser or DEFAULT_BROWSER
 
     cwd = os.getcwd()
@@ -151,11 +323,42 @@ def initialize(
         if not os.path.isabs(data_dir):
             data_dir = os.path.join(os.getcwd(), data_dir)
 
+    if convert or salvage:
+        names = names or util.read_test_names(test_files, data_dir)
+        if convert:
+            return _convert(convert, data_dir, names)
+        return _salvage(data_dir, names)
+
     # mode
     if record and rerecord:
         sys.stdout.write('Cannot specify both -r and -rr\n')
         sys.stdout.flush()
         return exits.ARGUMENT_ERROR
+    jobs = jobs or 1
+    if jobs < 1:
+        sys.stdout.write('-j must be at least 1\n')
+        sys.stdout.flush()
+        return exits.ARGUMENT_ERROR
+    verify = verify or 'now'
+    if verify not in _VERIFY:
+        sys.stdout.write('--verify must be one of %s\n' % ', '.join(_VERIFY))
+        sys.stdout.flush()
+        return exits.ARGUMENT_ERROR
+    if record and jobs > 1 and verify != 'background':
+        sys.stdout.write('Cannot record more than one test at once\n')
+        sys.stdout.flush()
+        return exits.ARGUMENT_ERROR
+    if record and shard:
+        sys.stdout.write('Cannot record a shard of tests\n')
+        sys.stdout.flush()
+        return exits.ARGUMENT_ERROR
+    if shard:
+        try:
+            shard = parse_shard(shard)
+        except ValueError as exception:
+            sys.stdout.write('%s\n' % exception)
+            sys.stdout.flush()
+            return exits.ARGUMENT_ERROR
     if record:
         mode = modes.RECORD
     elif rerecord:
@@ -163,9 +366,75 @@ def initialize(
     else:
         mode = modes.PLAYBACK
 
+    if (screenshots or failed) and mode != modes.RERECORD:
+        sys.stdout.write('Screenshots can be selected only when rerecording\n')
+        sys.stdout.flush()
+        return exits.ARGUMENT_ERROR
+    if failed:
+        try:
+            past = History(data_dir)
+            differed = past.differed()
+            past.close()
+        except (sqlite3.Error, OSError) as exception:
+            sys.stdout.write('Cannot read the run history: %s\n' % exception)
+            sys.stdout.flush()
+            return exits.ERROR
+        known = names or util.read_test_names(test_files, data_dir)
+        names = [name for name in known if name in differed]
+        for name in names:
+            if differed[name] and name not in screenshots:
+                screenshots[name] = set(differed[name])
+        sys.stdout.write('%d tests failed in their last run\n' % len(names))
+        sys.stdout.flush()
+        if not names:
+            return exits.OK
+
+    try:
+        sessions = pool.SessionPool(
+            1 if mode == modes.RECORD else jobs, selenium, reuse=reuse or 1,
+            resets=resets.split(',') if resets is not None else RESETS,
+            client=client
+        )
+        verifier = None
+        if mode == modes.RECORD and verify == 'background':
+            verifier = pool.Verifier(pool.SessionPool(
+                jobs, selenium, reuse=reuse or 1, resets=sessions.resets, client=client
+            ))
+    except ValueError as exception:
+        sys.stdout.write('%s\n' % exception)
+        sys.stdout.flush()
+        return exits.ARGUMENT_ERROR
+
+    try:
+        for name in (hooks.split(',') if hooks else []):
+            plugins.register(plugins.load(name))
+    except ValueError as exception:
+        sys.stdout.write('%s\n' % exception)
+        sys.stdout.flush()
+        return exits.ARGUMENT_ERROR
+
+    if changed or changed_from:
+        if mode == modes.RECORD:
+            sys.stdout.write('Cannot record only changed tests\n')
+            sys.stdout.flush()
+            return exits.ARGUMENT_ERROR
+        try:
+            changes = changed.split(',') if changed else []
+            if changed_from:
+                changes.extend(read_changes(changed_from))
+        except IOError as exception:
+            sys.stdout.write('%s\n' % exception)
+            sys.stdout.flush()
+            return exits.ARGUMENT_ERROR
+        names = _affected(test_files, data_dir, names, changes)
+        sys.stdout.write('%d tests affected by changes\n' % len(names))
+        sys.stdout.flush()
+        if not names:
+            return exits.OK
+
     attrs = (
         'names', 'selenium', 'postdata',
-        'browser', 'screensize', 'diffcolor', 'save_diff', 'overwrite'
+        'browser', 'screensize', 'diffcolor', 'save_diff', 'fingerprint', 'overwrite'
     )
     options = {
         key: val for key, val in \
@@ -180,13 +449,55 @@ def initialize(
         sys.stdout.write('\n')
         sys.stdout.flush()
         return exits.ERROR
-    except (exc.RecordedRunDoesNotExist, exc.RecordedRunEmpty,
-        exc.CouldNotParseRecordedRun) as exception:
+    except _RECORDED_RUN_ERRORS as exception:
         sys.stdout.write(str(exception))
         sys.stdout.write('\n')
         sys.stdout.flush()
         return exits.RECORDED_RUN_ERROR
 
+    if screenshots:
+        try:
+            unknown = _unknown_screenshots(tests, screenshots)
+        except _RECORDED_RUN_ERRORS as exception:
+            sys.stdout.write('%s\n' % exception)
+            sys.stdout.flush()
+            return exits.RECORDED_RUN_ERROR
+        if unknown:
+            sys.stdout.write('No such screenshots recorded: %s\n' % ', '.join(unknown))
+            sys.stdout.flush()
+            return exits.ARGUMENT_ERROR
+
+    history = None
+    if mode != modes.RECORD:
+        try:
+            history = History(data_dir)
+        except (sqlite3.Error, OSError) as exception:
+            util.log.warning('Not keeping run history: %s', exception)
+
+    if shard:
+        try:
+            # only durations every shard shares, so each splits them alike
+            known = read_durations(durations) if durations else None
+            tests = select(tests, shard, known)
+        except ValueError as exception:
+            sys.stdout.write('%s\n' % exception)
+            sys.stdout.flush()
+            return exits.ERROR
+        except _RECORDED_RUN_ERRORS as exception:
+            sys.stdout.write('%s\n' % exception)
+            sys.stdout.flush()
+            return exits.RECORDED_RUN_ERROR
+        sys.stdout.write('Shard %d/%d has %d tests\n' % (shard + (len(tests), )))
+        if results is None:
+            results = os.path.join(data_dir, 'results-%d-of-%d.json' % shard)
+    if history and (failed_first or jobs > 1):
+        try:
+            tests = schedule(tests, history, failed_first, longest_first=jobs > 1)
+        except _RECORDED_RUN_ERRORS as exception:
+            sys.stdout.write('%s\n' % exception)
+            sys.stdout.flush()
+            return exits.RECORDED_RUN_ERROR
+
     if mode == modes.RECORD:
         sys.stdout.write('Recording...\n\n')
     elif mode == modes.RERECORD:
@@ -195,58 +506,302 @@ def initialize(
         sys.stdout.write('Playing back tests...\n\n')
     sys.stdout.flush()
 
-    results = {}
-    errs = {}
-    driver = None
-
+    filename, times, timings, startup = results, {}, {}, {}
+    recorded = False
+    if trace:
+        tracing.start(memory=trace_memory)
     try:
-        for key, test in tests.items():
-            if driver is not None:
-                util.close_driver(driver)
-            try:
-                driver = util.get_driver(test.settings.browser, selenium)
-            except exc.WebDriverConnectionFailed:
-                sys.stderr.write(
-                    'We cannot connect to the WebDriver %s -- is it running?\n' % selenium
-                )
-                return exits.ERROR
-            # run the tests
-            try:
-                result, err = dispatch(driver, mode, test)
-                results[key] = result
-                errs[key] = err
-                if (not result or result in (states.FAIL, states.ERROR)) and stop_on_error:
-                    break
-            except exc.NoScreenshotsRecorded as exception:
-                sys.stdout.write(str(exception))
-                sys.stdout.flush()
-                return exits.ERROR
-            sys.stdout.write('\n')
-            sys.stdout.flush()
+        results = pool.run_tests(
+            tests, mode, sessions, stop_on_error=stop_on_error, durations=times,
+            timings=timings, startup=startup,
+            verify=verifier or (False if verify == 'skip' else None),
+            screenshots=screenshots
+        )
+        recorded = True
+    except exc.WebDriverConnectionFailed:
+        sys.stderr.write(
+            'We cannot connect to the WebDriver %s -- is it running?\n' % selenium
+        )
+        return exits.ERROR
+    except exc.NoScreenshotsRecorded as exception:
+        sys.stdout.write(str(exception))
+        sys.stdout.flush()
+        return exits.ERROR
+    except _RECORDED_RUN_ERRORS as exception:
+        # records are loaded as they're run
+        sys.stdout.write('%s\n' % exception)
+        sys.stdout.flush()
+        return exits.RECORDED_RUN_ERROR
     finally:
-        util.close_driver(driver)
-
-    if mode == modes.PLAYBACK:
-        fails = sum(x is states.FAIL for _, x in results.items())
-        errors = sum(x is states.ERROR for _, x in results.items())
-        if fails > 0 or errors > 0:
-            msg = []
-            if fails > 0:
-                msg.append('failed=%s' % fails)
-            if errors > 0:
-                msg.append('errors=%s' % errors)
-            sys.stdout.write(
-                '\nFAILED (%s)\n' % ', '.join(msg)
-            )
+        sessions.close()
+        if verifier:
+            results = _stop_verifying(verifier, recorded)
+        if trace:
+            tracing.stop().write(trace)
+            sys.stdout.write('Trace written to %s\n' % trace)
             sys.stdout.flush()
-            return exits.FAILED
+    if verbose and client == 'w3c':
+        _latency()
+    if history:
+        try:
+            history.record(mode, results, times, timings)
+        except sqlite3.Error as exception:
+            util.log.warning('Could not save run history: %s', exception)
+        history.close()
+    if filename:
+        write_results(filename, results, times, shard)
+        sys.stdout.write('Results written to %s\n' % filename)
+        sys.stdout.flush()
+    if report:
+        reports.write_json(
+            report, results, times, timings, startup, mode=_MODE_NAMES[mode]
+        )
+        sys.stdout.write('Report written to %s\n' % report)
+    if junit:
+        reports.write_junit(junit, results, times, timings, startup)
+        sys.stdout.write('JUnit report written to %s\n' % junit)
+    if verbose or report or junit:
+        _phases(reports.totals(timings, startup))
+
+    if mode == modes.PLAYBACK or verifier:
+        return _verdict(results)
+    return exits.OK
+
+
+def _stop_verifying(verifier, recorded):
+    """
+    Wait for the recordings being verified, and if not every test was
+    `recorded`, skip those not yet begun and write the verdict so far.
+    Returns the verifications made.
+    """
+    if recorded:
+        sys.stdout.write('Waiting for recordings to be verified...\n')
+        sys.stdout.flush()
+    verified = verifier.close(cancel=not recorded)
+    if not recorded and verified:
+        sys.stdout.write('\n%d recordings verified before stopping' % len(verified))
+        _verdict(verified)
+    return verified
+
+
+def _affected(test_files, data_dir, names, changes):
+    """
+    Names of the tests `names`, or of every test in `test_files`, which
+    visit a URL matching any of `changes`, in order.
+    """
+    names = names or util.read_test_names(test_files, data_dir)
+    affected = URLIndex(data_dir).update(names).affected(changes, names=names)
+    return [name for name in names if name in affected]
+
+
+def _select_screenshots(names):
+    """
+    Test names, and a dictionary of test name to the set of its
+    screenshots selected, from comma-separated `names` such as
+    `checkout:7,9,login`, where numbers following `name:N` select more of
+    that test's screenshots.
+    """
+    tests, screenshots, current = [], {}, None
+    for each in names.split(','):
+        if current is not None and each.isdigit():
+            screenshots[current].add(int(each))
+            continue
+        name, _, num = each.rpartition(':')
+        if name and num.isdigit():
+            current = name
+            screenshots.setdefault(name, set()).add(int(num))
         else:
-            sys.stdout.write('\nOK\n')
+            name, current = each, None
+        if name not in tests:
+            tests.append(name)
+    return (tests, screenshots)
+
+
+def _unknown_screenshots(tests, screenshots):
+    """
+    The screenshots selected by number, as `name:N`, which aren't in their
+    tests' records.
+    """
+    unknown = []
+    for name in sorted(screenshots):
+        if name in tests:
+            nums = set(
+                step.num for step in tests[name].steps if isinstance(step, Screenshot)
+            )
+            unknown.extend('%s:%d' % (name, num) for num in sorted(screenshots[name] - nums))
+    return unknown
+
+
+def _phases(totals):
+    """
+    Write the time spent in each phase over the run, longest first.
+    """
+    total = sum(totals.values())
+    if not total:
+        return
+    sys.stdout.write('\nTime by phase:\n')
+    for phase, seconds in sorted(totals.items(), key=lambda item: -item[1]):
+        sys.stdout.write('%10.2f s  %5.1f%%  %s\n' % (
+            seconds, 100.0 * seconds / total, phase
+        ))
+    sys.stdout.flush()
+
+
+def _latency():
+    """
+    Write the latency of each WebDriver command made by the W3C client.
+    """
+    from gossamer import w3c
+    latency = w3c.latency()
+    if not latency:
+        return
+    sys.stdout.write('\nWebDriver command latency:\n')
+    for name, (count, mean, longest) in sorted(
+            latency.items(), key=lambda item: -item[1][0] * item[1][1]
+        ):
+        sys.stdout.write('%8d  %8.1f ms mean  %8.1f ms max  %s\n' % (
+            count, mean * 1000, longest * 1000, name
+        ))
+    sys.stdout.flush()
+
+
+def _verdict(results):
+    """
+    Write the verdict for playback `results`, a dictionary of test name to
+    `(state, err)`, and return the exit code.
+    """
+    fails = sum(x is states.FAIL for _, (x, _) in results.items())
+    errors = sum(x is states.ERROR for _, (x, _) in results.items())
+    if fails > 0 or errors > 0:
+        msg = []
+        if fails > 0:
+            msg.append('failed=%s' % fails)
+        if errors > 0:
+            msg.append('errors=%s' % errors)
+        sys.stdout.write(
+            '\nFAILED (%s)\n' % ', '.join(msg)
+        )
+        sys.stdout.flush()
+        return exits.FAILED
+    else:
+        sys.stdout.write('\nOK\n')
+        sys.stdout.flush()
+        return exits.OK
+
+
+def _slowest(count, data_dir):
+    """
+    Write the `count` slowest tests and steps in the history in `data_dir`.
+    """
+    try:
+        history = History(data_dir)
+    except (sqlite3.Error, OSError) as exception:
+        sys.stdout.write('Cannot read run history: %s\n' % exception)
+        sys.stdout.flush()
+        return exits.ERROR
+    try:
+        sys.stdout.write('Slowest tests:\n')
+        for name, duration in history.slowest_tests(count):
+            sys.stdout.write('  %8.2fs  %s\n' % (duration, name))
+        sys.stdout.write('\nSlowest steps (waiting + executing):\n')
+        for name, num, step, wait, execute in history.slowest_steps(count):
+            sys.stdout.write('  %8.2fs  %s step %d (%s): %.2fs + %.2fs\n' % (
+                wait + execute, name, num, step, wait, execute
+            ))
+        sys.stdout.flush()
+    finally:
+        history.close()
+    return exits.OK
+
+
+def _convert(fmt, data_dir, names):
+    """
+    Rewrite the recorded runs of the tests `names` in `data_dir` as `fmt`,
+    'json' or 'binary'.
+    """
+    if fmt not in ('json', 'binary'):
+        sys.stdout.write('Cannot convert to %s; use json or binary\n' % fmt)
+        sys.stdout.flush()
+        return exits.ARGUMENT_ERROR
+    for name in names:
+        try:
+            filename = util.convert_recorded_run(
+                os.path.join(data_dir, name), fmt == 'binary'
+            )
+        except _RECORDED_RUN_ERRORS as exception:
+            sys.stdout.write('%s\n' % exception)
             sys.stdout.flush()
-            return exits.OK
+            return exits.RECORDED_RUN_ERROR
+        sys.stdout.write('Converted %s to %s\n' % (name, filename))
+    sys.stdout.flush()
+    return exits.OK
+
+
+def _salvage(data_dir, names):
+    """
+    Write records for the tests `names` in `data_dir` from the journals of
+    their interrupted recordings.
+    """
+    salvaged = 0
+    for name in names:
+        directory = os.path.join(data_dir, name)
+        if not os.path.exists(os.path.join(directory, journal.FILENAME)):
+            continue
+        try:
+            test = run.compact(directory)
+        except (ValueError, IOError, exc.NoScreenshotsRecorded) as exception:
+            sys.stdout.write('Cannot salvage %s: %s\n' % (name, str(exception).strip()))
+            continue
+        util.write_recorded_run(directory, test)
+        journal.remove_journal(directory)
+        salvaged += 1
+        sys.stdout.write('Salvaged %s with %d steps\n' % (name, len(test.steps)))
+    if salvaged:
+        sys.stdout.write(
+            'Rerecord salvaged tests with -rr to verify their screenshots.\n'
+        )
+    else:
+        sys.stdout.write('No interrupted recordings to salvage\n')
+    sys.stdout.flush()
     return exits.OK
 
 
+def _merge(pattern, filename=None):
+    """
+    Merge the results files of a sharded run matching the comma-separated
+    glob `pattern`, optionally writing the merged results to `filename`,
+    and return the exit code of the combined run.
+    """
+    filenames = []
+    for each in pattern.split(','):
+        filenames.extend(sorted(glob.glob(each)))
+    if not filenames:
+        sys.stdout.write('No results found.\n')
+        sys.stdout.flush()
+        return exits.ERROR
+    try:
+        results, times, missing = merge_results(filenames)
+    except ValueError as exception:
+        sys.stdout.write('%s\n' % exception)
+        sys.stdout.flush()
+        return exits.ERROR
+    for name, (state, err) in sorted(results.items()):
+        if state is not states.OK:
+            sys.stdout.write('%s ... %s%s\n' % (name, state, ': %s' % err if err else ''))
+    if filename:
+        write_results(filename, results, times)
+    if missing:
+        sys.stdout.write(
+            'Missing results for shard%s %s\n' % (
+                's' if len(missing) > 1 else '', ', '.join(str(x) for x in missing)
+            )
+        )
+        sys.stdout.flush()
+        return exits.ERROR
+    sys.stdout.write('Merged results of %d tests\n' % len(results))
+    return _verdict(results)
+
+
 def main():
     """
     Defined as the `gossamer` command in setup.py.
@@ -6,6 +6,10 @@ Data structures that do not represent user actions. For those, see `step`.
 # Licensed under the Apache License, Version 2.0
 # https://www.apache.org/licenses/LICENSE-2.0
 
+import threading
+
+from collections import namedtuple
+
 
 class Test(object): # pylint: disable=R0903
     """
@@ -34,16 +38,59 @@ class Test(object): # pylint: disable=R0903
         )
 
 
+class RecordedTest(Test): # pylint: disable=R0903,W0231
+    """
+    A :class:`.Test` whose record is loaded by calling `load` when it is
+    first used, e.g., when it's run.
+    """
+
+    def __init__(self, name, load):
+        self.name = name
+        self._load = load
+        self._test = None
+        self._lock = threading.Lock()
+
+    def _get(self):
+        """
+        Load the test once.
+        """
+        if self._test is None:
+            with self._lock:
+                if self._test is None:
+                    self._test = self._load()
+        return self._test
+
+    @property
+    def loaded(self):
+        """
+        Whether the record has been loaded.
+        """
+        return self._test is not None
+
+    version = property(lambda self: self._get().version)
+    settings = property(lambda self: self._get().settings)
+    steps = property(lambda self: self._get().steps)
+
+    def __repr__(self): # pragma: no cover
+        return "<%s %r>" % (self.__class__.__name__, self.name)
+
+
 class Settings(object): # pylint: disable=R0903,R0902
     """
     Hold validated settings for a specific test run.
     """
 
+    __slots__ = (
+        'name', 'url', 'mode', 'path', 'browser', 'screensize', 'postdata',
+        'diffcolor', 'save_diff', 'desc', 'cookies', 'expect_redirect',
+        'fingerprint'
+    )
+
     def __init__(self,
             name, url, mode, path, browser,
             screensize, postdata,
             diffcolor, save_diff, cookies=None, desc=None,
-            expect_redirect=None
+            expect_redirect=None, fingerprint=False
         ): # pylint: disable=R0913
         self.name = name
         self.url = url
@@ -59,6 +106,9 @@ class Settings(object): # pylint: disable=R0903,R0902
         if self.cookies:
             self._validate_cookies()
         self.expect_redirect = expect_redirect
+        # take fingerprints of the page with screenshots; see
+        # gossamer.fingerprint
+        self.fingerprint = fingerprint
 
     def navigate(self):
         """
@@ -83,10 +133,10 @@ class Settings(object): # pylint: disable=R0903,R0902
                     raise ValueError('Cookie missing required attribute %s' % attr)
 
     def __json__(self):
-        return self.__dict__
+        return dict((attr, getattr(self, attr)) for attr in self.__slots__)
 
     def __repr__(self): # pragma: no cover
-        return '<%s %r>' % (self.__class__.__name__, self.__dict__)
+        return '<%s %r>' % (self.__class__.__name__, self.__json__())
 
 
 class Point(object): # pylint: disable=R0903
@@ -94,6 +144,8 @@ class Point(object): # pylint: disable=R0903
     Contains validated x, y coordinates for screen position.
     """
 
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):
         """
         Stores x and y coordinates. They cannot be negative.
@@ -106,7 +158,18 @@ class Point(object): # pylint: disable=R0903
         self.y = y
 
     def __json__(self):
-        return self.__dict__
+        return {'x': self.x, 'y': self.y}
 
     def __repr__(self): # pragma: no cover
         return '<Point %s, %s>' % (self.x, self.y)
+
+
+# Time in seconds spent on a step in playback: `delay` in its delayer,
+# `wait` for the page to be static, `execute` in the step itself, and for a
+# screenshot, `capture` taking it and `compare` comparing it. Step 0 is
+# beginning the test, with `execute` preparing the browser and navigating
+# and `wait` for the page to load.
+StepTiming = namedtuple(
+    'StepTiming', ['num', 'step', 'wait', 'execute', 'delay', 'capture', 'compare']
+)
+StepTiming.__new__.__defaults__ = (0.0, 0.0, 0.0)
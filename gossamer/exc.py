@@ -78,7 +78,17 @@ class ImageNotFound(Exception):
 
 class ScreenshotsDiffer(Exception):
     """
-    Screenshots are different... failed.
+    Screenshots are different... failed. `num` is the screenshot's number,
+    if known.
+    """
+
+    def __init__(self, message, num=None):
+        super(ScreenshotsDiffer, self).__init__(message)
+        self.num = num
+
+class EmptyScreenshot(Exception):
+    """
+    A screenshot's element or region has no width or height.
     """
 
 class PlaybackTimeout(Exception):
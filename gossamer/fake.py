@@ -0,0 +1,471 @@
+"""
+A fake WebDriver, for exercising and benchmarking Gossamer without a
+browser.
+
+:class:`.Driver` answers the commands Gossamer makes, each after a
+configurable latency, with canned screenshots, and counts them.
+:class:`.SessionPool` hands out fake drivers in place of WebDriver
+sessions, and :class:`.Server` serves them over the W3C WebDriver protocol
+for :mod:`gossamer.w3c`, to include HTTP in what is measured.
+"""
+
+# Copyright (c) 2013 contributors; see AUTHORS.
+# Licensed under the Apache License, Version 2.0
+# https://www.apache.org/licenses/LICENSE-2.0
+
+import base64
+import json
+import re
+import struct
+import threading
+import time
+import zlib
+
+import BaseHTTPServer
+import SocketServer
+
+from gossamer import pool, util, w3c
+
+__all__ = ['png', 'Driver', 'Element', 'SessionPool', 'Server', ]
+
+
+def png(width=16, height=16, color=(255, 255, 255)):
+    """
+    Bytes of a PNG image of one RGB `color`.
+    """
+    def chunk(kind, data):
+        """
+        A PNG chunk.
+        """
+        return struct.pack('>I', len(data)) + kind + data + \
+            struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    row = '\x00' + struct.pack('BBB', *color) * width
+    return ''.join([
+        '\x89PNG\r\n\x1a\n',
+        chunk('IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)),
+        chunk('IDAT', zlib.compress(row * height)),
+        chunk('IEND', ''),
+    ])
+
+
+class Element(object):
+    """
+    An element found by a :class:`.Driver`.
+    """
+
+    def __init__(self, driver, selector):
+        self.driver = driver
+        self.selector = selector
+
+    def send_keys(self, text): # pylint: disable=W0613
+        """
+        Type into the element.
+        """
+        self.driver._command('sendKeys') # pylint: disable=W0212
+
+    def click(self):
+        """
+        Click the element.
+        """
+        self.driver._command('click') # pylint: disable=W0212
+
+    @property
+    def screenshot_as_png(self):
+        """
+        A screenshot of the element, a quarter of the page's.
+        """
+        self.driver._command('takeElementScreenshot') # pylint: disable=W0212
+        if not self.driver.element_screenshots:
+            raise w3c._error('unknown command: takeElementScreenshot') # pylint: disable=W0212
+        return png(8, 8)
+
+    def select_by_visible_text(self, text): # pylint: disable=W0613
+        """
+        Select an option of the element.
+        """
+        self.driver._command('executeScript') # pylint: disable=W0212
+
+
+class Driver(object): # pylint: disable=R0902
+    """
+    A fake WebDriver session. Each command takes `latency` seconds, and
+    screenshots are the PNG bytes `screenshot`. After each navigation, the
+    page is changing for the first `changing` times it is asked, and its
+    fingerprint is `fingerprint`, by default none. Unless
+    `element_screenshots`, the driver lacks the command to take an
+    element's screenshot. :attr:`commands` counts each command by name, and
+    :attr:`last_script` is the last script run and its arguments.
+    """
+
+    def __init__( # pylint: disable=R0913
+            self, latency=0.0, screenshot=None, changing=0, fingerprint=None,
+            element_screenshots=True
+        ):
+        self.latency = latency
+        self.screenshot = screenshot or png()
+        self.changing = changing
+        self.fingerprint = fingerprint
+        self.element_screenshots = element_screenshots
+        self.commands = {}
+        self.last_script = None
+        self.cookies = []
+        self.window_size = None
+        self.closed = False
+        self._url = 'about:blank'
+        self._changes = 0
+
+    def _command(self, name):
+        """
+        Count and wait for a command, which fails once the session has
+        ended.
+        """
+        if self.closed:
+            raise w3c._error('No active session; it was ended') # pylint: disable=W0212
+        self.commands[name] = self.commands.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def round_trips(self):
+        """
+        Count of every command.
+        """
+        return sum(self.commands.values())
+
+    def get(self, url):
+        """
+        Navigate to `url`.
+        """
+        self._command('get')
+        self._url = url
+        self._changes = self.changing
+
+    def refresh(self):
+        """
+        Reload the page.
+        """
+        self._command('refresh')
+        self._changes = self.changing
+
+    @property
+    def current_url(self):
+        """
+        URL of the page.
+        """
+        self._command('getCurrentUrl')
+        return self._url
+
+    def execute_script(self, script, *args): # pylint: disable=W0613
+        """
+        Run a script: the page is static once it has changed as many times
+        as configured, the time is the time, and the fingerprint is as
+        configured.
+        """
+        self._command('executeScript')
+        self.last_script = (script, args)
+        if '_gossamerIsPageChanging' in script:
+            if self._changes:
+                self._changes -= 1
+                return True
+            return False
+        if 'Date.now()' in script:
+            return int(time.time() * 1000)
+        if '_getGossamerEvents' in script:
+            return {'events': [], 'overflow': 0}
+        if '_gossamerClientRect' in script:
+            return [0, 0, 16, 16, 1]
+        if '_gossamerFingerprint' in script:
+            return dict(self.fingerprint) if self.fingerprint else None
+        return None
+
+    def execute_async_script(self, script, *args): # pylint: disable=W0613
+        """
+        Run an asynchronous script.
+        """
+        self._command('executeAsyncScript')
+
+    def set_script_timeout(self, seconds): # pylint: disable=W0613
+        """
+        Time asynchronous scripts out.
+        """
+        self._command('setTimeouts')
+
+    def set_window_size(self, width, height):
+        """
+        Resize the window.
+        """
+        self._command('setWindowRect')
+        self.window_size = (width, height)
+
+    def save_screenshot(self, filename):
+        """
+        Save the canned screenshot to `filename`.
+        """
+        self._command('takeScreenshot')
+        with open(filename, 'wb') as fp:
+            fp.write(self.screenshot)
+        return True
+
+    def get_screenshot_as_png(self):
+        """
+        The canned screenshot.
+        """
+        self._command('takeScreenshot')
+        return self.screenshot
+
+    def delete_all_cookies(self):
+        """
+        Delete the cookies.
+        """
+        self._command('deleteAllCookies')
+        self.cookies = []
+
+    def add_cookie(self, cookie):
+        """
+        Add a cookie.
+        """
+        self._command('addCookie')
+        self.cookies.append(cookie)
+
+    def find_element_by_css_selector(self, selector):
+        """
+        An element, whatever the selector.
+        """
+        self._command('findElement')
+        return Element(self, selector)
+
+    def find_element_by_id(self, element_id):
+        """
+        An element, whatever the id.
+        """
+        return self.find_element_by_css_selector('#%s' % element_id)
+
+    def find_element_by_class_name(self, name):
+        """
+        An element, whatever the class.
+        """
+        return self.find_element_by_css_selector('.%s' % name)
+
+    def quit(self):
+        """
+        End the session.
+        """
+        self._command('deleteSession')
+        self.closed = True
+
+
+class SessionPool(pool.SessionPool):
+    """
+    A :class:`gossamer.pool.SessionPool` of fake :class:`.Driver` sessions,
+    made with `options` such as `latency`. :attr:`drivers` are those made.
+    """
+
+    def __init__(self, size=1, reuse=1, resets=pool.RESETS, **options):
+        super(SessionPool, self).__init__(size, reuse=reuse, resets=resets)
+        self.options = options
+        self.drivers = []
+
+    def _new_driver(self, browser):
+        driver = Driver(**self.options)
+        # like a new WebDriver session, it is on a blank page
+        util.session_state(driver)['clean'] = True
+        with self._lock:
+            self.drivers.append(driver)
+        return driver
+
+    @property
+    def round_trips(self):
+        """
+        Count of every command made on the pool's sessions.
+        """
+        return sum(driver.round_trips for driver in self.drivers)
+
+
+class _HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    HTTP server handling each connection on its own thread.
+    """
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Handles W3C WebDriver requests to a :class:`.Server`.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    # send each response whole, not a header at a time
+    wbufsize = -1
+
+    _SESSION = re.compile(r'^/session/([^/]+)(/.*)?$')
+
+    def log_message(self, *args): # pylint: disable=W0221
+        pass
+
+    def _reply(self, status, value):
+        """
+        Reply with `value` as JSON.
+        """
+        data = json.dumps({'value': value})
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self):
+        """
+        Handle a request.
+        """
+        server = self.server.fake
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else {}
+        server.count(self.command, self.path)
+        path = self.path[len(server.prefix):] if self.path.startswith(server.prefix) else None
+        if self.command == 'GET' and path in ('/', '/status'):
+            return self._reply(200, {'ready': True, 'message': 'fake'})
+        if self.command == 'POST' and path == '/session':
+            session_id, _ = server.new_session()
+            return self._reply(200, {'sessionId': session_id, 'capabilities': {}})
+        match = self._SESSION.match(path or '')
+        driver = server.sessions.get(match.group(1)) if match else None
+        if driver is None:
+            return self._reply(404, {
+                'error': 'invalid session id', 'message': 'No session %s' % self.path
+            })
+        route = (self.command, match.group(2) or '')
+        if route == ('POST', '/element'):
+            element = driver.find_element_by_css_selector(body['value'])
+            return self._reply(200, {w3c.ELEMENT_KEY: server.add_element(element)})
+        handler = _ROUTES.get(route)
+        if handler is None and route[1].startswith('/element/'):
+            element_id, _, command = route[1][len('/element/'):].partition('/')
+            element = server.elements.get(element_id)
+            if element is None:
+                return self._reply(404, {
+                    'error': 'no such element', 'message': 'No element %s' % element_id
+                })
+            return self._reply(200, _element(element, body, command))
+        if handler is None:
+            return self._reply(404, {
+                'error': 'unknown command', 'message': 'Unknown command %s %s' % route
+            })
+        if route == ('DELETE', ''):
+            server.end_session(match.group(1))
+        return self._reply(200, handler(driver, body, route[1]))
+
+    do_GET = do_POST = do_DELETE = _handle
+
+
+def _element(element, body, command):
+    """
+    A `command` on an element.
+    """
+    if command == 'click':
+        element.click()
+    elif command == 'screenshot':
+        return base64.b64encode(element.screenshot_as_png)
+    else:
+        element.send_keys(body.get('text'))
+
+
+_ROUTES = {
+    ('DELETE', ''): lambda driver, body, path: driver.quit(),
+    ('POST', '/url'): lambda driver, body, path: driver.get(body['url']),
+    ('GET', '/url'): lambda driver, body, path: driver.current_url,
+    ('POST', '/refresh'): lambda driver, body, path: driver.refresh(),
+    ('POST', '/execute/sync'):
+        lambda driver, body, path: driver.execute_script(body['script'], *body['args']),
+    ('POST', '/execute/async'):
+        lambda driver, body, path: driver.execute_async_script(body['script']),
+    ('POST', '/timeouts'):
+        lambda driver, body, path: driver.set_script_timeout(body.get('script')),
+    ('POST', '/window/rect'):
+        lambda driver, body, path: driver.set_window_size(body['width'], body['height']),
+    ('GET', '/screenshot'):
+        lambda driver, body, path: base64.b64encode(driver.get_screenshot_as_png()),
+    ('DELETE', '/cookie'): lambda driver, body, path: driver.delete_all_cookies(),
+    ('POST', '/cookie'): lambda driver, body, path: driver.add_cookie(body['cookie']),
+}
+
+
+class Server(object):
+    """
+    A W3C WebDriver server of fake :class:`.Driver` sessions made with
+    `options`, on `host` and `port`, by default any free port, and under
+    the path `prefix`, e.g., '/wd/hub'. Elements found are given opaque
+    ids. :attr:`requests` counts requests by method and path.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, prefix='', **options):
+        self.options = options
+        self.prefix = prefix.rstrip('/')
+        self.sessions = {}
+        self.drivers = []
+        self.elements = {}
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = _HTTPServer((host, port), _Handler)
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        """
+        URL of the server, for `--selenium`.
+        """
+        return 'http://%s:%d%s' % (self._server.server_address + (self.prefix, ))
+
+    def start(self):
+        """
+        Serve in the background, returning the server.
+        """
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='gossamer-fake-webdriver'
+        )
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, method, path):
+        """
+        Count a request.
+        """
+        with self._lock:
+            self.requests.append((method, path))
+
+    def add_element(self, element):
+        """
+        Give the :class:`.Element` `element` an id, returning it.
+        """
+        with self._lock:
+            element_id = 'element-%d' % (len(self.elements) + 1)
+            self.elements[element_id] = element
+        return element_id
+
+    def new_session(self):
+        """
+        Start a session, returning its id and :class:`.Driver`.
+        """
+        driver = Driver(**self.options)
+        with self._lock:
+            self.drivers.append(driver)
+            session_id = '%d' % len(self.drivers)
+            self.sessions[session_id] = driver
+        return (session_id, driver)
+
+    def end_session(self, session_id):
+        """
+        End a session.
+        """
+        with self._lock:
+            self.sessions.pop(session_id, None)
@@ -0,0 +1,118 @@
+// Fingerprint of what the page renders in the viewport: each visible
+// element's tag, attributes, form value, own text and computed styles,
+// hashed, with its bounding box; the viewport and scroll position; and the
+// images and fonts loaded. Content that can change without the DOM
+// changing, such as a canvas, video or an image still loading, makes the
+// fingerprint opaque.
+return (function _gossamerFingerprint() {
+    var width = window.innerWidth;
+    var height = window.innerHeight;
+    var opaque = false;
+    var resources = {};
+    var elements = [];
+
+    // FNV-1a, 32 bits
+    function hash(text) {
+        var h = 0x811c9dc5;
+        for (var i = 0; i < text.length; i++) {
+            h ^= text.charCodeAt(i);
+            h = (h + (h << 1) + (h << 4) + (h << 7) + (h << 8) + (h << 24)) >>> 0;
+        }
+        return ('0000000' + h.toString(16)).slice(-8);
+    }
+
+    function path(element) {
+        var parts = [];
+        for (; element && element.nodeType === 1; element = element.parentNode) {
+            var index = 1;
+            for (var sibling = element.previousElementSibling; sibling;
+                    sibling = sibling.previousElementSibling) {
+                if (sibling.tagName === element.tagName) {
+                    index++;
+                }
+            }
+            parts.unshift(element.tagName.toLowerCase() + '[' + index + ']');
+        }
+        return '/' + parts.join('/');
+    }
+
+    function styles(style) {
+        var declarations = [];
+        for (var i = 0; i < style.length; i++) {
+            declarations.push(style[i] + ':' + style.getPropertyValue(style[i]));
+        }
+        return declarations.join(';');
+    }
+
+    var all = document.getElementsByTagName('*');
+    for (var i = 0; i < all.length; i++) {
+        var element = all[i];
+        var rect = element.getBoundingClientRect();
+        if ((rect.width === 0 && rect.height === 0) || rect.right <= 0 ||
+                rect.bottom <= 0 || rect.left >= width || rect.top >= height) {
+            continue;
+        }
+        var tag = element.tagName.toLowerCase();
+        if (tag === 'canvas' || tag === 'video' || tag === 'iframe' ||
+                tag === 'embed' || tag === 'object') {
+            opaque = true;
+        }
+        if (tag === 'img') {
+            if (!element.complete) {
+                opaque = true;
+            }
+            resources[element.currentSrc || element.src] = true;
+        }
+        var attributes = [];
+        for (var j = 0; j < element.attributes.length; j++) {
+            attributes.push(element.attributes[j].name + '=' + element.attributes[j].value);
+        }
+        attributes.sort();
+        var text = [];
+        for (var child = element.firstChild; child; child = child.nextSibling) {
+            if (child.nodeType === 3) {
+                text.push(child.nodeValue);
+            }
+        }
+        var value = 'value' in element && tag !== 'li' && tag !== 'button' ?
+            String(element.value) + (element.checked ? ':checked' : '') : '';
+        elements.push([
+            path(element),
+            hash([
+                tag, attributes.join('\n'), value, text.join(''),
+                element.scrollLeft + ',' + element.scrollTop,
+                styles(window.getComputedStyle(element)),
+                window.getComputedStyle(element, '::before').content,
+                window.getComputedStyle(element, '::after').content
+            ].join('|')),
+            [rect.left, rect.top, rect.width, rect.height]
+        ]);
+    }
+
+    if (window.performance && window.performance.getEntriesByType) {
+        var entries = window.performance.getEntriesByType('resource');
+        for (var k = 0; k < entries.length; k++) {
+            if (/\.(woff2?|ttf|otf|eot|png|jpe?g|gif|webp|svg)(\?|#|$)/i.test(entries[k].name)) {
+                resources[entries[k].name] = true;
+            }
+        }
+    }
+    if (document.fonts && document.fonts.forEach) {
+        document.fonts.forEach(function(font) {
+            if (font.status === 'loaded') {
+                resources['font:' + font.family + ' ' + font.weight + ' ' + font.style] = true;
+            } else if (font.status === 'loading') {
+                opaque = true;
+            }
+        });
+    }
+
+    return {
+        version: 1,
+        viewport: [width, height, window.devicePixelRatio || 1],
+        scroll: [window.pageXOffset, window.pageYOffset],
+        resources: Object.keys(resources).sort(),
+        opaque: opaque,
+        elements: elements
+    };
+})();
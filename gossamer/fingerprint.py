@@ -0,0 +1,113 @@
+"""
+Fingerprints of what a page renders, as a fast check before comparing
+screenshots.
+
+With `fingerprint` set on a test, a fingerprint is taken in the page with
+each screenshot and kept beside it: each visible element's hashed tag,
+attributes, text and computed styles with its bounding box, the viewport
+and scroll position, and the images and fonts loaded. When a playback's
+fingerprint matches the original's, the screenshots are taken to match
+without comparing their pixels. Pages with content outside the DOM, such
+as a canvas or video, have opaque fingerprints, which never match. When
+the screenshots differ, the boxes of the elements whose fingerprints
+changed narrow down where.
+"""
+
+# Copyright (c) 2013 contributors; see AUTHORS.
+# Licensed under the Apache License, Version 2.0
+# https://www.apache.org/licenses/LICENSE-2.0
+
+import hashlib
+import json
+import os
+
+from gossamer import js, util
+
+__all__ = ['capture', 'read', 'matches', 'changed', ]
+
+VERSION = 1
+
+
+def _digest(fingerprint):
+    """
+    Digest of a fingerprint's canonical JSON.
+    """
+    data = dict((key, value) for key, value in fingerprint.items() if key != 'digest')
+    return hashlib.sha1(json.dumps(data, sort_keys=True, separators=(',', ':'))).hexdigest()
+
+
+def capture(driver, filename):
+    """
+    Take the page's fingerprint and write it to `filename`, returning it.
+    If the page gives none, any file is removed and None returned.
+    """
+    fingerprint = driver.execute_script(js.fingerprint())
+    if not isinstance(fingerprint, dict):
+        util.log.debug('fingerprint: none from the page')
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+        return None
+    fingerprint['digest'] = _digest(fingerprint)
+    with open(filename, 'w') as fp:
+        fp.write(json.dumps(fingerprint, sort_keys=True))
+    return fingerprint
+
+
+def read(filename):
+    """
+    The fingerprint in `filename`, or None if there is none.
+    """
+    try:
+        with open(filename, 'r') as fp:
+            return json.loads(fp.read())
+    except (IOError, ValueError):
+        return None
+
+
+def matches(original, new):
+    """
+    Whether fingerprints `original` and `new` show the page rendered the
+    same. Missing or opaque fingerprints never match.
+    """
+    if original is None or new is None:
+        return False
+    if original.get('opaque') or new.get('opaque'):
+        return False
+    return original.get('version') == new.get('version') == VERSION and \
+        original.get('digest') == new.get('digest')
+
+
+def changed(original, new):
+    """
+    Boxes `(x, y, width, height)`, in screenshot pixels, of the elements
+    added, removed or changed between fingerprints `original` and `new`,
+    or of the whole viewport if it or the scroll position changed. Boxes
+    within others are left out.
+    """
+    if original is None or new is None:
+        return []
+    viewport = new.get('viewport') or [0, 0, 1]
+    ratio = viewport[2]
+    if original.get('viewport') != viewport or original.get('scroll') != new.get('scroll'):
+        return [(0, 0, int(viewport[0] * ratio), int(viewport[1] * ratio))]
+    before = dict((path, (signature, box)) for path, signature, box in original['elements'])
+    after = dict((path, (signature, box)) for path, signature, box in new['elements'])
+    boxes = set()
+    for path in set(before) | set(after):
+        if before.get(path) != after.get(path):
+            for entry in (before.get(path), after.get(path)):
+                if entry is not None:
+                    boxes.add(tuple(int(round(value * ratio)) for value in entry[1]))
+    return sorted(box for box in boxes if not any(
+        other != box and _within(box, other) for other in boxes
+    ))
+
+
+def _within(box, other):
+    """
+    Whether `box` is within `other`.
+    """
+    return other[0] <= box[0] and other[1] <= box[1] and \
+        box[0] + box[2] <= other[0] + other[2] and box[1] + box[3] <= other[1] + other[3]
@@ -1,74 +1,141 @@
 // getGossamerEvents
 // Store events we're interested in reproducing.
+//
+// Events are kept in a bounded ring buffer so that recording overhead stays
+// flat during long sessions; if the buffer wraps, the oldest events are
+// dropped and counted in `overflow`. Scrolls are sampled once per animation
+// frame and coalesced to a final position per idle window, and keystrokes
+// are folded into a single field-level 'text' event per run of typing.
+// Events already read are never coalesced into, so each is read once as
+// it was.
 (function() {
     "use strict";
 
-    var events = [];
+    var CAPACITY = 10000;
+    var SCROLL_IDLE = 250; // milliseconds
+
+    var events = new Array(CAPACITY);
+    var start = 0;
+    var length = 0;
+    var overflow = 0;
+    var read = null; // the last event when events were last read
+
+    function last() {
+        return length ? events[(start + length - 1) % CAPACITY] : null;
+    }
+
+    // The last event, if it is of `kind` and not yet read.
+    function unread(kind) {
+        var event = last();
+        return event !== null && event !== read && event[1] === kind ? event : null;
+    }
+
+    function push(event) {
+        if (length < CAPACITY) {
+            events[(start + length) % CAPACITY] = event;
+            length++;
+        } else {
+            events[start] = event;
+            start = (start + 1) % CAPACITY;
+            overflow++;
+        }
+    }
+
+    function identifiers(target, value) {
+        var classList = target.classList ? target.classList.toString() : '';
+        return [
+            [target.id, target.id ? value : null],
+            [target.className, target.className ? value : null],
+            [target.classList, classList ? value : null]
+        ];
+    }
 
     window.addEventListener(
         'click',
         function (e) {
             var isSelect = false;
-            var idText, classNameText, classListText, elm = null;
+            var text;
             if (e.target.nodeName === "SELECT") { // dropdown
                 isSelect = true;
-                if (e.target.id) {
-                    elm = document.querySelector('#' + e.target.id);
-                    idText = elm.options[elm.selectedIndex].text;
-                } else {};
-                if (e.target.className) {
-                    elm = document.querySelector('.' + e.target.className);
-                    classNameText = elm.options[elm.selectedIndex].text;
-                } else {};
-                if (e.target.classList.toString()) {
-                    elm = document.querySelector('.' + e.target.classList.toString());
-                    classListText = elm.options[elm.selectedIndex].text;
-                } else {};
+                text = e.target.selectedIndex >= 0 ?
+                    e.target.options[e.target.selectedIndex].text : null;
             };
-            events.push([
+            push([
                 Date.now(),
                 'click', [
                     [e.clientX, e.clientY],
                     isSelect,
-                    [e.target.id, idText],
-                    [e.target.className, classNameText],
-                    [e.target.classList, classListText]
+                    [e.target.id, e.target.id ? text : undefined],
+                    [e.target.className, e.target.className ? text : undefined],
+                    [e.target.classList,
+                        e.target.classList.toString() ? text : undefined]
                 ]
             ]);
         },
         true
     );
 
+    // A run of keystrokes into one field is folded into one 'text' event
+    // carrying the field's current value. A tab keyup fires on the field
+    // being tabbed into, so it only ends the run.
+    var typing = null;
+
     window.addEventListener(
         'keyup',
         function (e) {
-            var idVal = e.target.id ?
-                        document.querySelector('#' + e.target.id).value : null;
-            var classNameVal = e.target.className ?
-                        document.querySelector('.' + e.target.className).value : null;
-            var classListVal = e.target.classList.toString() ?
-                        document.querySelector('.' + e.target.classList.toString()).value : null;
-            events.push([
-                Date.now(),
-                'keyup', [
-                    String.fromCharCode(e.keyCode),
-                    e.shiftKey,
-                    [e.target.id, idVal],
-                    [e.target.className, classNameVal],
-                    [e.target.classList, classListVal]
-                ]
-            ]);
+            if (e.keyCode === 9) {
+                typing = null;
+                return;
+            }
+            var event = unread('text');
+            if (typing !== e.target || event === null) {
+                typing = e.target;
+                push([Date.now(), 'text', identifiers(e.target, e.target.value)]);
+            } else {
+                event[0] = Date.now();
+                event[2] = identifiers(e.target, e.target.value);
+            }
         },
         true
     );
 
+    var requestFrame = window.requestAnimationFrame || function(callback) {
+        return window.setTimeout(callback, 16);
+    };
+    var scrollPending = false;
+
+    function sampleScroll() {
+        scrollPending = false;
+        var now = Date.now();
+        var event = unread('scroll');
+        if (event !== null && now - event[0] < SCROLL_IDLE) {
+            event[0] = now;
+            event[2] = [window.pageXOffset, window.pageYOffset];
+        } else {
+            push([now, 'scroll', [window.pageXOffset, window.pageYOffset]]);
+        }
+    }
+
     window.addEventListener(
         'scroll',
         function(e) {
-            events.push([Date.now(), 'scroll', [this.pageXOffset, this.pageYOffset]]);
+            if (!scrollPending) {
+                scrollPending = true;
+                requestFrame(sampleScroll);
+            }
         },
         true
     );
 
-    window._getGossamerEvents = function() { return events };
+    window._getGossamerEvents = function(since) {
+        var ret = [];
+        for (var i = 0; i < length; i++) {
+            var event = events[(start + i) % CAPACITY];
+            if (!since || event[0] > since) {
+                ret.push(event);
+            }
+        }
+        read = last();
+        return {'events': ret, 'overflow': overflow};
+    };
 })();
@@ -0,0 +1,204 @@
+"""
+Remember how long tests and their steps took, and whether they passed, in
+a SQLite database in the data directory.
+
+The history orders later runs, with tests which failed last time first and
+then the longest tests first, and reports the slowest tests and steps.
+"""
+
+# Copyright (c) 2013 contributors; see AUTHORS.
+# Licensed under the Apache License, Version 2.0
+# https://www.apache.org/licenses/LICENSE-2.0
+
+import os
+import sqlite3
+import time
+
+from collections import OrderedDict
+
+from gossamer.constant import states
+from gossamer.shard import weight
+
+__all__ = ['History', 'schedule', ]
+
+FILENAME = 'history.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    mode INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tests (
+    run INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    state TEXT NOT NULL,
+    duration REAL,
+    wait REAL
+);
+CREATE INDEX IF NOT EXISTS tests_name ON tests (name, run);
+CREATE TABLE IF NOT EXISTS steps (
+    run INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    num INTEGER NOT NULL,
+    step TEXT NOT NULL,
+    wait REAL NOT NULL,
+    execute REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS steps_name ON steps (name, num, run);
+CREATE TABLE IF NOT EXISTS differed (
+    run INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    screenshot INTEGER NOT NULL
+);
+"""
+
+
+class History(object):
+    """
+    Durations and outcomes of earlier runs, stored in `data_dir`. Keeps the
+    last `keep` runs.
+    """
+
+    def __init__(self, data_dir, keep=100):
+        if not os.path.exists(data_dir):
+            os.makedirs(data_dir)
+        self.filename = os.path.join(data_dir, FILENAME)
+        self.keep = keep
+        self._db = sqlite3.connect(self.filename)
+        self._db.execute('PRAGMA foreign_keys = ON')
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        """
+        Close the database.
+        """
+        self._db.close()
+
+    def record(self, mode, results, durations, timings=None):
+        """
+        Store a run in `mode` with `results`, a dictionary of test name to
+        `(state, err)`, and dictionaries of test name to duration in
+        seconds and to a list of :class:`gossamer.data.StepTiming`. A
+        step's wait includes its delay, and its execution its screenshot's
+        capture and comparison. The screenshot which differed in a failed
+        test is kept, if known.
+        """
+        timings = timings or {}
+        with self._db:
+            run = self._db.execute(
+                'INSERT INTO runs (started, mode) VALUES (?, ?)', (time.time(), mode)
+            ).lastrowid
+            for name, (state, err) in results.items():
+                steps = timings.get(name) or []
+                if state == states.FAIL and getattr(err, 'num', None) is not None:
+                    self._db.execute(
+                        'INSERT INTO differed (run, name, screenshot) VALUES (?, ?, ?)',
+                        (run, name, err.num)
+                    )
+                self._db.execute(
+                    'INSERT INTO tests (run, name, state, duration, wait) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (run, name, str(state), durations.get(name),
+                        sum(step.delay + step.wait for step in steps))
+                )
+                self._db.executemany(
+                    'INSERT INTO steps (run, name, num, step, wait, execute) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    [(
+                        run, name, step.num, step.step, step.delay + step.wait,
+                        step.execute + step.capture + step.compare
+                    ) for step in steps]
+                )
+            self._db.execute(
+                'DELETE FROM runs WHERE id NOT IN '
+                '(SELECT id FROM runs ORDER BY id DESC LIMIT ?)', (self.keep, )
+            )
+        return run
+
+    def durations(self, last=5):
+        """
+        Dictionary of test name to its mean duration over its `last` runs.
+        """
+        ret = {}
+        rows = self._db.execute(
+            'SELECT name, duration FROM tests WHERE duration IS NOT NULL '
+            'ORDER BY name, run DESC'
+        )
+        counts = {}
+        for name, duration in rows:
+            if counts.get(name, 0) < last:
+                counts[name] = counts.get(name, 0) + 1
+                ret[name] = ret.get(name, 0.0) + duration
+        return dict((name, total / counts[name]) for name, total in ret.items())
+
+    def failing(self):
+        """
+        Set of names of tests which failed or errored in their last run.
+        """
+        rows = self._db.execute(
+            'SELECT name, state FROM tests WHERE run = '
+            '(SELECT MAX(run) FROM tests AS last WHERE last.name = tests.name)'
+        )
+        return set(
+            name for name, state in rows if state in (str(states.FAIL), str(states.ERROR))
+        )
+
+    def differed(self):
+        """
+        Dictionary of the name of each test which failed in its last run to
+        the list of numbers of the screenshots which differed, empty if
+        unknown.
+        """
+        rows = self._db.execute(
+            'SELECT tests.name, differed.screenshot FROM tests '
+            'LEFT JOIN differed ON differed.run = tests.run AND differed.name = tests.name '
+            'WHERE tests.state = ? AND tests.run = '
+            '(SELECT MAX(run) FROM tests AS last WHERE last.name = tests.name) '
+            'ORDER BY tests.name, differed.screenshot', (str(states.FAIL), )
+        )
+        ret = {}
+        for name, screenshot in rows:
+            ret.setdefault(name, [])
+            if screenshot is not None:
+                ret[name].append(screenshot)
+        return ret
+
+    def slowest_tests(self, count=10, last=5):
+        """
+        List of `(name, mean duration)` of the `count` slowest tests over
+        their `last` runs.
+        """
+        return sorted(
+            self.durations(last).items(), key=lambda x: (-x[1], x[0])
+        )[:count]
+
+    def slowest_steps(self, count=10):
+        """
+        List of `(name, num, step, mean wait, mean execute)` of the `count`
+        steps taking longest on average, waiting included.
+        """
+        return self._db.execute(
+            'SELECT name, num, step, AVG(wait), AVG(execute) FROM steps '
+            'GROUP BY name, num ORDER BY AVG(wait) + AVG(execute) DESC, name, num '
+            'LIMIT ?', (count, )
+        ).fetchall()
+
+
+def schedule(tests, history, failed_first=True, longest_first=True):
+    """
+    Order the dictionary `tests` by name, but with `failed_first` those
+    which failed last time first, and with `longest_first` the longest
+    first, by :func:`gossamer.shard.weight` with durations from `history`.
+    Returns an `OrderedDict`.
+    """
+    failing = history.failing() if failed_first else ()
+    durations = history.durations() if longest_first else None
+    return OrderedDict(sorted(
+        tests.items(),
+        key=lambda x: (
+            x[0] not in failing,
+            -weight(x[1], durations, x[0]) if longest_first else 0,
+            x[0]
+        )
+    ))
@@ -0,0 +1,180 @@
+"""
+Hooks called around tests, steps, screenshots and comparisons, to attach
+metrics, upload artifacts or compare screenshots differently.
+
+A hook is an object with any of the methods of :class:`.Hook`, registered
+with :func:`.register`; from the command line, with `--hooks`, or with
+`hooks` in :func:`gossamer.integration.run_gossamerfile`, registered only
+while its tests run, with :func:`.scoped`. Hooks are called
+in the order registered, on the thread running the test or, for
+comparisons made while playback continues, the thread comparing. With no
+hooks registered, Gossamer checks only that :data:`.registered` is empty.
+
+Hooks can be installed as setuptools entry points in the group
+`gossamer.hooks`, and named on the command line:
+
+    entry_points={'gossamer.hooks': ['upload = myproject.hooks:Upload']}
+"""
+
+# Copyright (c) 2013 contributors; see AUTHORS.
+# Licensed under the Apache License, Version 2.0
+# https://www.apache.org/licenses/LICENSE-2.0
+
+import threading
+
+__all__ = ['Hook', 'register', 'unregister', 'scoped', 'call', 'load', 'registered', ]
+
+ENTRY_POINTS = 'gossamer.hooks'
+
+# hooks in the order registered; replaced rather than changed, so calls
+# needn't lock
+registered = ()
+
+_lock = threading.Lock()
+
+# id of each hook registered by scoped to [hook, contexts using it]
+_scoped = {}
+
+
+class Hook(object):
+    """
+    Hooks, each doing nothing, to subclass. `test` is the
+    :class:`gossamer.data.Test` being run, and `step` a step of it.
+    """
+
+    def on_test_start(self, test):
+        """
+        The test is about to begin.
+        """
+
+    def on_test_end(self, test):
+        """
+        The test has ended, however it ended.
+        """
+
+    def before_step(self, test, num, step):
+        """
+        Step number `num` is about to be played back.
+        """
+
+    def after_step(self, test, num, step):
+        """
+        Step number `num` was played back.
+        """
+
+    def after_capture(self, test, step, png):
+        """
+        The screenshot `step` was taken as the bytes of a PNG.
+        """
+
+    def before_compare(self, test, step):
+        """
+        The screenshot `step` is about to be compared with the original.
+        Return True or False to decide whether they match instead.
+        """
+
+    def after_compare(self, test, step, identical):
+        """
+        The screenshot `step` was compared, and was `identical` or not.
+        """
+
+    def on_result(self, test, state, err):
+        """
+        The test was played back or rerecorded with `state` and `err`, as
+        returned by :func:`gossamer.main.dispatch`.
+        """
+
+
+def register(hook):
+    """
+    Register `hook`, returning it.
+    """
+    global registered # pylint: disable=W0603
+    with _lock:
+        if hook not in registered:
+            registered = registered + (hook, )
+    return hook
+
+
+def unregister(hook):
+    """
+    Unregister `hook`, if registered.
+    """
+    global registered # pylint: disable=W0603
+    with _lock:
+        registered = tuple(each for each in registered if each is not hook)
+
+
+def scoped(hooks):
+    """
+    A context manager registering `hooks` while in the context. On leaving,
+    those it registered are unregistered, unless another context registering
+    them is still open.
+    """
+    return _Scope(hooks)
+
+
+class _Scope(object):
+    """
+    Registers hooks while in the context; see :func:`.scoped`.
+    """
+
+    def __init__(self, hooks):
+        self.hooks = hooks
+
+    def __enter__(self):
+        global registered # pylint: disable=W0603
+        with _lock:
+            for hook in self.hooks:
+                if id(hook) in _scoped:
+                    _scoped[id(hook)][1] += 1
+                elif hook not in registered:
+                    _scoped[id(hook)] = [hook, 1]
+                    registered = registered + (hook, )
+        return self
+
+    def __exit__(self, *exc_info):
+        global registered # pylint: disable=W0603
+        with _lock:
+            for hook in self.hooks:
+                if id(hook) in _scoped:
+                    _scoped[id(hook)][1] -= 1
+                    if not _scoped[id(hook)][1]:
+                        del _scoped[id(hook)]
+                        registered = tuple(each for each in registered if each is not hook)
+
+
+def call(name, *args):
+    """
+    Call hook `name` with `args` on every registered hook which has it,
+    returning the first result which isn't None.
+    """
+    ret = None
+    for hook in registered:
+        func = getattr(hook, name, None)
+        if func is not None:
+            result = func(*args)
+            if ret is None:
+                ret = result
+    return ret
+
+
+def load(name):
+    """
+    A hook by `name`: an entry point in the group `gossamer.hooks`, or
+    `module:attribute`. A class is instantiated. Raises ValueError if there
+    is no such hook.
+    """
+    if ':' in name:
+        module, _, attribute = name.partition(':')
+        try:
+            hook = getattr(__import__(module, fromlist=[attribute]), attribute)
+        except (ImportError, AttributeError) as exception:
+            raise ValueError('Cannot load hook %s: %s' % (name, exception))
+    else:
+        import pkg_resources
+        entry_points = list(pkg_resources.iter_entry_points(ENTRY_POINTS, name))
+        if not entry_points:
+            raise ValueError('No hook named %s is installed' % name)
+        hook = entry_points[0].load()
+    return hook() if isinstance(hook, type) else hook
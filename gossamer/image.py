@@ -9,20 +9,30 @@ Compare screenshots taken via the webdriver.
 import math
 import operator
 
-try:
-    # Pillow
-    from PIL import Image
-    from PIL import ImageChops
-except ImportError: # pragma: no cover
-    # PIL
-    try:
-        import Image # pylint: disable=F0401
-        import ImageChops # pylint: disable=F0401
-    except ImportError:
-        raise ImportError('Could not import Pillow or PIL')
+from io import BytesIO
 
 from gossamer import util, exc
 
+
+def _pil():
+    """
+    Pillow's, or PIL's, `Image` and `ImageChops` modules, imported when
+    first needed rather than with gossamer.
+    """
+    try:
+        # Pillow
+        from PIL import Image
+        from PIL import ImageChops
+    except ImportError: # pragma: no cover
+        # PIL
+        try:
+            import Image # pylint: disable=F0401
+            import ImageChops # pylint: disable=F0401
+        except ImportError:
+            raise ImportError('Could not import Pillow or PIL')
+    return (Image, ImageChops)
+
+
 def allowance(browser):
     """
     Our image diffs below give some false alarms of diffs... The values
@@ -44,11 +54,28 @@ def allowance(browser):
         return margins['default']
 
 
+def crop(png, box):
+    """
+    The PNG bytes of the `box`, `(left, top, right, bottom)` in pixels, of
+    the PNG bytes `png`, kept within the image.
+    """
+    Image, _ = _pil() # pylint: disable=C0103
+    image = Image.open(BytesIO(png))
+    width, height = image.size
+    left, top, right, bottom = [int(round(value)) for value in box]
+    left, right = max(0, min(left, width)), max(0, min(right, width))
+    top, bottom = max(0, min(top, height)), max(0, min(bottom, height))
+    output = BytesIO()
+    image.crop((left, top, max(left, right), max(top, bottom))).save(output, 'PNG')
+    return output.getvalue()
+
+
 def images_identical(path1, path2, margin=None):
     """
     Hacky test of images being identical. PIL can show incorrect diffs.
     """
     util.log.debug('images_identical: %s, %s', path1, path2)
+    Image, ImageChops = _pil() # pylint: disable=C0103
 
     im1 = Image.open(path1)
     im2 = Image.open(path2)
@@ -72,6 +99,7 @@ def image_diff(path1, path2, outpath, diffcolor):
     Generate a diff image on a screenshot which has failed
     :func:`.images_identical`.
     """
+    Image, _ = _pil() # pylint: disable=C0103
     im1 = Image.open(path1)
     im2 = Image.open(path2)
     rmsdiff = _rmsdiff_2011(im1, im2)
@@ -116,6 +144,7 @@ def image_diff(path1, path2, outpath, diffcolor):
 
 def _rmsdiff_2011(im1, im2):
     "Calculate the root-mean-square difference between two images"
+    _, ImageChops = _pil() # pylint: disable=C0103
     h = ImageChops.difference(im1, im2).histogram()
     rms = math.sqrt(
         reduce(
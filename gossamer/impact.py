@@ -0,0 +1,169 @@
+"""
+Select the tests affected by a change to a website, by the URLs they
+visit.
+
+Each recorded test is indexed by its URL and the URL of every
+:class:`gossamer.step.Navigate` step. The index is kept in the data
+directory and only re-read for tests whose recorded run has changed. A
+test whose record can't be read is taken to be affected by any change, and
+isn't indexed, so it's read again next time.
+"""
+
+# Copyright (c) 2013 contributors; see AUTHORS.
+# Licensed under the Apache License, Version 2.0
+# https://www.apache.org/licenses/LICENSE-2.0
+
+import fnmatch
+import json
+import os
+import struct
+import urlparse
+
+from gossamer import packed
+from gossamer.step import Navigate
+from gossamer.util import record_path
+
+__all__ = ['URLIndex', 'read_changes', 'matches', ]
+
+FILENAME = 'urls.json'
+
+INDEX_VERSION = 1
+
+
+def read_changes(filename):
+    """
+    Read changed URL prefixes or route patterns from a file, one per line,
+    ignoring blank lines and those starting with '#'.
+    """
+    with open(filename, 'r') as fp:
+        return [
+            line.strip() for line in fp
+            if line.strip() and not line.strip().startswith('#')
+        ]
+
+
+def matches(url, change):
+    """
+    Whether `url` is affected by `change`: a URL prefix, such as
+    'http://www.example.com/checkout', or, if it starts with '/', a path
+    prefix, such as '/checkout'. A change containing `*`, `?` or `[` is
+    a route pattern matched as by :mod:`fnmatch`, such as '/users/*/edit'.
+    """
+    if change.startswith('/'):
+        url = urlparse.urlparse(url).path or '/'
+    if any(char in change for char in '*?['):
+        return fnmatch.fnmatchcase(url, change)
+    return url.startswith(change)
+
+
+class URLIndex(object):
+    """
+    URLs visited by each test recorded in `data_dir`.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.filename = os.path.join(data_dir, FILENAME)
+        self.tests = {}
+        self.unreadable = set()
+        self._changed = False
+        try:
+            with open(self.filename, 'r') as fp:
+                index = json.loads(fp.read())
+            if index.get('version') == INDEX_VERSION:
+                self.tests = index['tests']
+        except (IOError, ValueError, KeyError):
+            pass
+
+    def update(self, names):
+        """
+        Bring the index up to date for the tests `names`, reading only the
+        records changed since they were indexed, and save it if changed.
+        Tests without a record are dropped from the index, and those whose
+        record can't be read are added to `unreadable` instead.
+        """
+        for name in names:
+            self.unreadable.discard(name)
+            filename = record_path(os.path.join(self.data_dir, name))
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                if self.tests.pop(name, None) is not None:
+                    self._changed = True
+                continue
+            entry = self.tests.get(name)
+            if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                continue
+            urls = _read_urls(filename)
+            if urls is None:
+                self.unreadable.add(name)
+                if self.tests.pop(name, None) is not None:
+                    self._changed = True
+                continue
+            self.tests[name] = {
+                'mtime': stat.st_mtime,
+                'size': stat.st_size,
+                'urls': urls,
+            }
+            self._changed = True
+        if self._changed:
+            self.save()
+        return self
+
+    def save(self):
+        """
+        Write the index.
+        """
+        temporary = '%s.%d' % (self.filename, os.getpid())
+        with open(temporary, 'w') as fp:
+            fp.write(json.dumps({'version': INDEX_VERSION, 'tests': self.tests}))
+        os.rename(temporary, self.filename)
+        self._changed = False
+
+    def urls(self, name):
+        """
+        URLs visited by the test `name`.
+        """
+        return self.tests[name]['urls']
+
+    def affected(self, changes, names=None):
+        """
+        Set of names of tests, of those indexed or in `names`, which visit a
+        URL matching any of `changes`; see :func:`.matches`. Tests whose
+        record couldn't be read are always affected.
+        """
+        names = set(names) if names is not None else None
+        affected = set(
+            name for name, entry in self.tests.items()
+            if (names is None or name in names) and any(
+                matches(url, change) for url in entry['urls'] for change in changes
+            )
+        )
+        affected.update(self.unreadable if names is None else self.unreadable & names)
+        return affected
+
+
+def _read_urls(filename):
+    """
+    The URLs in a recorded run, without making the steps of a record.json,
+    or None if it can't be read.
+    """
+    try:
+        with open(filename, 'rb') as fp:
+            data = fp.read()
+        if packed.is_packed(data):
+            test = packed.loads(data)
+            return ([test.settings.url] if test.settings.url else []) + [
+                step.url for step in test.steps if isinstance(step, Navigate)
+            ]
+        urls = []
+        for test in json.loads(data).values():
+            if test['settings'].get('url'):
+                urls.append(test['settings']['url'])
+            for step in test['steps']:
+                if 'Navigate' in step:
+                    urls.append(step['Navigate']['url'])
+        return urls
+    except (IOError, ValueError, struct.error, TypeError, IndexError, KeyError,
+            AttributeError, StopIteration, NotImplementedError): # truncated or corrupt
+        return None
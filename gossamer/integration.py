@@ -6,16 +6,26 @@ Integrate with unittest.
 # Licensed under the Apache License, Version 2.0
 # https://www.apache.org/licenses/LICENSE-2.0
 
+import atexit
+import Queue
+import threading
 import unittest
 
 from gossamer.main import dispatch
+from gossamer.pool import SessionPool
+from gossamer.shard import select
+from gossamer.hooks import scoped, load
 from gossamer.constant import modes, states, DEFAULT_WEBDRIVER
 from gossamer import util, exc
 
+# hooks loaded by name, so modules naming the same hook share it
+_named_hooks = {}
+
 
 def run_gossamerfile(
         client_locals, gossamerfile, data_dir,
-        selenium=None, skip_allowed=True, rewrite_url=None
+        selenium=None, skip_allowed=True, rewrite_url=None, reuse=1,
+        shard=None, durations=None, client=None, hooks=None, workers=1
     ): # pylint: disable=R0913
     """
     Call this to read one or more Gossamerfiles and run all of their tests.
@@ -49,6 +59,40 @@ def run_gossamerfile(
             which is the URL in the recorded test. Use this to change the
             environment used. E.g., lambda x: x.replace('http://dev.', 'http://ci.').
 
+        reuse (optional), int:
+            If given, each WebDriver session is reused for up to this many
+            tests, being cleared between them. Default 1, a new session for
+            every test.
+
+        shard (optional), str or tuple:
+            If given as 'I/N' or `(I, N)`, only the tests in shard I of N
+            are added. Tests are split between shards deterministically; see
+            :func:`gossamer.shard.select`.
+
+        durations (optional), dict:
+            Test names to their durations in seconds, e.g., from
+            :func:`gossamer.shard.read_durations`, weighing tests when
+            sharding.
+
+        client (optional), str:
+            The WebDriver client, 'selenium' (the default) or 'w3c', the
+            pooled client in :mod:`gossamer.w3c`.
+
+        hooks (optional), list:
+            Hooks to register while the tests added run, each an object
+            with methods of :class:`gossamer.hooks.Hook` or the name of one
+            for :func:`gossamer.hooks.load`. A hook named is loaded once,
+            however many modules name it.
+
+        workers (optional), int:
+            If more than 1, the tests may run this many at once, each worker
+            with its own WebDriver session, reused for up to `reuse` tests.
+            Unless the module defines its own, a `load_tests` is added to
+            `client_locals` which runs its Gossamer tests in a
+            :class:`.ConcurrentSuite`.
+
+    Records are read as each test runs, and Selenium Server is first
+    checked when a test is set up.
     """
     if isinstance(gossamerfile, (str, unicode)):
         gossamerfile = [gossamerfile]
@@ -57,11 +101,24 @@ def run_gossamerfile(
 
     selenium = selenium or DEFAULT_WEBDRIVER
 
-    driver_ok = util.check_driver(selenium)
+    loaded = []
+    for hook in hooks or []:
+        if isinstance(hook, basestring):
+            if hook not in _named_hooks:
+                _named_hooks[hook] = load(hook)
+            hook = _named_hooks[hook]
+        if hook not in loaded:
+            loaded.append(hook)
+
+    driver_ok = _DriverCheck(selenium)
+    sessions = SessionPool(workers, selenium, reuse=reuse, client=client)
+    atexit.register(sessions.close)
 
     tests = util.make_tests(
         gossamerfile, modes.PLAYBACK, data_dir, rewrite_url=rewrite_url
     )
+    if shard:
+        tests = select(tests, shard, durations)
     for key, test in tests.items():
         case = type(
             'GossamerTestCase',
@@ -70,26 +127,170 @@ def run_gossamerfile(
         )
         case._skip_allowed = skip_allowed # pylint: disable=W0212
         case._driver_ok = driver_ok # pylint: disable=W0212
-        case._args = (test, test.settings.browser, selenium)
+        case._args = (test, sessions)
         case._gossamer_test = test # pylint: disable=W0212
-        case.runTest.__func__.__doc__ = test.settings.desc or test.settings.name # pylint: disable=E1101,C0301
+        case._hooks = tuple(loaded) # pylint: disable=W0212
+        # a test's settings are in its record, read once it runs
+        case._description = key # pylint: disable=W0212
         client_locals['GossamerTest_%s' % key] = case
+    if workers > 1 and 'load_tests' not in client_locals:
+        client_locals['load_tests'] = _load_tests(workers)
     return True
 
 
+class _DriverCheck(object): # pylint: disable=R0903
+    """
+    Whether Selenium Server at `selenium` is up, checked once when first
+    called.
+    """
+
+    def __init__(self, selenium):
+        self.selenium = selenium
+        self._ok = None
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            if self._ok is None:
+                self._ok = util.check_driver(self.selenium)
+            return self._ok
+
+
+def _load_tests(workers):
+    """
+    A `load_tests` function running a module's tests in a
+    :class:`.ConcurrentSuite` of `workers`.
+    """
+    def load_tests(loader, tests, pattern): # pylint: disable=W0613
+        """
+        The module's tests, with Gossamer tests run concurrently.
+        """
+        return ConcurrentSuite(tests, workers)
+    return load_tests
+
+
+def _flatten(suite):
+    """
+    The tests in a suite and those it contains.
+    """
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            for each in _flatten(test):
+                yield each
+        else:
+            yield test
+
+
+def _is_gossamer(test):
+    """
+    Whether `test` is a Gossamer test made by :func:`.run_gossamerfile`.
+    """
+    return getattr(test, '_gossamer_test', None) is not None
+
+
+class _RecordingResult(unittest.TestResult):
+    """
+    Records a test's outcome, to be reported whole by
+    :class:`.ConcurrentSuite`.
+    """
+
+    def __init__(self):
+        super(_RecordingResult, self).__init__()
+        self.outcomes = []
+
+    def _outcome(name): # pylint: disable=E0213
+        """
+        A method recording an outcome `name`.
+        """
+        def record(self, *args):
+            """
+            Record the outcome.
+            """
+            self.outcomes.append((name, args))
+        return record
+
+    addSuccess = _outcome('addSuccess')
+    addFailure = _outcome('addFailure')
+    addError = _outcome('addError')
+    addSkip = _outcome('addSkip')
+    addExpectedFailure = _outcome('addExpectedFailure')
+    addUnexpectedSuccess = _outcome('addUnexpectedSuccess')
+    del _outcome
+
+
+class ConcurrentSuite(unittest.TestSuite):
+    """
+    A test suite which runs its Gossamer tests, made by
+    :func:`.run_gossamerfile`, up to `workers` at once, and then its other
+    tests in order. Run `workers` no greater than that given to
+    :func:`.run_gossamerfile`, so that each worker has a session.
+
+    Each test's outcome is reported whole once it finishes, so output isn't
+    interleaved.
+    """
+
+    def __init__(self, tests=(), workers=2):
+        super(ConcurrentSuite, self).__init__(tests)
+        self.workers = workers
+
+    def run(self, result, debug=False):
+        tests = list(_flatten(self))
+        gossamer = [test for test in tests if _is_gossamer(test)]
+        others = [test for test in tests if not _is_gossamer(test)]
+        queue = Queue.Queue()
+        for test in gossamer:
+            queue.put(test)
+        lock = threading.Lock()
+
+        def work():
+            """
+            Run tests from the queue until it is empty or the run stops.
+            """
+            while not result.shouldStop:
+                try:
+                    test = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                recorder = _RecordingResult()
+                test(recorder)
+                with lock:
+                    result.startTest(test)
+                    for name, args in recorder.outcomes:
+                        getattr(result, name)(*args)
+                    result.stopTest(test)
+                    if recorder.shouldStop:
+                        result.stop()
+
+        workers = [
+            threading.Thread(target=work, name='gossamer-unittest-%d' % i)
+            for i in range(min(self.workers, len(gossamer)))
+        ]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for worker in workers:
+            while worker.is_alive():
+                worker.join(0.25)
+        if others and not result.shouldStop:
+            unittest.TestSuite(others).run(result)
+        return result
+
+
 class GossamerTestCase(unittest.TestCase): # pylint: disable=R0904
     """
     unittest case.
     """
 
     _skip_allowed = True
-    _driver_ok = True
+    _driver_ok = staticmethod(lambda: True)
     _gossamer_test = None
+    _description = None
+    _hooks = ()
     _args = ()
 
     def setUp(self):
         super(GossamerTestCase, GossamerTestCase()).setUp()
-        if not self._driver_ok:
+        if not self._driver_ok():
             if self._skip_allowed:
                 self.skipTest("Selenium Server is not available")
             else:
@@ -97,16 +298,25 @@ class GossamerTestCase(unittest.TestCase): # pylint: disable=R0904
                     "Selenium Server is not available"
                 )
 
+    def shortDescription(self):
+        """
+        The test's name, as each case shares :meth:`.runTest` and its
+        docstring.
+        """
+        return self._description or super(GossamerTestCase, self).shortDescription()
+
     def runTest(self):
         """
         Gossamer test
         """
-        test, browser, selenium = self._args
+        test, sessions = self._args
+        driver = sessions.acquire(test.settings.browser)
+        result = None
         try:
-            driver = util.get_driver(browser, selenium)
-            result, err = dispatch(
-                driver, modes.PLAYBACK,  test, output=util.null_writer
-            )
+            with scoped(self._hooks):
+                result, err = dispatch(
+                    driver, modes.PLAYBACK,  test, output=util.null_writer
+                )
             if result == states.FAIL:
                 if err is not None:
                     self.fail(str(err))
@@ -117,4 +327,4 @@ class GossamerTestCase(unittest.TestCase): # pylint: disable=R0904
                     raise err
                 raise exc.TestError() # todo
         finally:
-            util.close_driver(driver)
+            sessions.release(driver, error=result in (None, states.ERROR))
@@ -0,0 +1,117 @@
+"""
+An append-only journal of a recording in progress, so that an interrupted
+recording can be salvaged.
+
+While recording, captured events and steps are appended as they arrive to
+`record.journal` in the test's directory, one JSON object per line, and
+the journal is synced to disk with each screenshot. When recording
+finishes, the journal is compacted into the test's record and removed.
+"""
+
+# Copyright (c) 2013 contributors; see AUTHORS.
+# Licensed under the Apache License, Version 2.0
+# https://www.apache.org/licenses/LICENSE-2.0
+
+import json
+import os
+
+from collections import namedtuple
+
+from gossamer import util
+
+__all__ = ['FILENAME', 'Journal', 'read_journal', 'remove_journal', ]
+
+FILENAME = 'record.journal'
+
+JOURNAL_VERSION = 1
+
+# What a journal holds: the test's settings as a dictionary, the browser's
+# time when recording began, and the steps and events recorded.
+Entries = namedtuple('Entries', ['settings', 'start_time', 'steps', 'events'])
+
+
+class Journal(object):
+    """
+    Journal of the recording of the test with `settings`, begun at
+    `start_time` by the browser's clock.
+    """
+
+    def __init__(self, settings, start_time):
+        self.filename = os.path.join(settings.path, FILENAME)
+        self._fp = open(self.filename, 'w')
+        self._write({
+            'journal': JOURNAL_VERSION,
+            'start_time': start_time,
+            'settings': settings,
+        })
+
+    def _write(self, entry):
+        """
+        Append an entry.
+        """
+        self._fp.write(json.dumps(entry, cls=util.Encoder))
+        self._fp.write('\n')
+
+    def events(self, events):
+        """
+        Append events as captured by :class:`gossamer.run.CaptureEvents`.
+        """
+        for event in events:
+            self._write({'event': event})
+        self._fp.flush()
+
+    def step(self, step, sync=False):
+        """
+        Append a step, e.g., a :class:`gossamer.step.Screenshot`, and with
+        `sync`, make sure it and everything before it is on disk.
+        """
+        self._write({'step': step})
+        self._fp.flush()
+        if sync:
+            os.fsync(self._fp.fileno())
+
+    def close(self):
+        """
+        Close the journal, leaving it on disk.
+        """
+        self._fp.close()
+
+
+def read_journal(directory):
+    """
+    Read the journal in a test's `directory`, returning :class:`.Entries`.
+    A partly written last line, as from a crash, is ignored.
+
+    Events captured more than once are kept once, as last captured.
+    """
+    filename = os.path.join(directory, FILENAME)
+    with open(filename, 'r') as fp:
+        try:
+            header = json.loads(fp.readline())
+        except ValueError:
+            header = {}
+        if header.get('journal') != JOURNAL_VERSION:
+            raise ValueError('%s is not a journal gossamer can read' % filename)
+        steps = []
+        events = {}
+        for line in fp:
+            try:
+                entry = json.loads(line)
+            except ValueError: # interrupted while writing
+                break
+            if 'event' in entry:
+                event = entry['event']
+                events['%s.%s' % (event[0], event[1])] = event
+            else:
+                steps.append(util.import_step(entry['step']))
+    return Entries(header['settings'], header['start_time'], steps, events.values())
+
+
+def remove_journal(directory):
+    """
+    Remove the journal in a test's `directory`, if any.
+    """
+    try:
+        os.remove(os.path.join(directory, FILENAME))
+    except OSError:
+        pass
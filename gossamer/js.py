@@ -6,22 +6,51 @@ JavaScript to be executed in the testing user agent.
 # Licensed under the Apache License, Version 2.0
 # https://www.apache.org/licenses/LICENSE-2.0
 
-import pkg_resources
 import json
+import pkgutil
+
+_scripts = {}
 
 
 def _get_javascript(name):
     """
-    Convenience for reading JavaScript from package.
+    Convenience for reading JavaScript from package, once.
     """
-    return pkg_resources.resource_stream('gossamer', '%s.js' % name).read()
+    if name not in _scripts:
+        _scripts[name] = pkgutil.get_data('gossamer', '%s.js' % name)
+    return _scripts[name]
+
 
+def pageChangingObserver(): # pylint: disable=C0103
+    """
+    Observe changes to the page.
+    """
+    # https://developer.mozilla.org/en-US/docs/Web/API/MutationObserver
+    return _get_javascript('pageChangingObserver')
 
-# https://developer.mozilla.org/en-US/docs/Web/API/MutationObserver
-pageChangingObserver = _get_javascript('pageChangingObserver')
+
+def getGossamerEvents(): # pylint: disable=C0103
+    """
+    Capture the user's events in the page.
+    """
+    return _get_javascript('getGossamerEvents')
 
 
-getGossamerEvents = _get_javascript('getGossamerEvents')
+def fingerprint():
+    """
+    Fingerprint what the page renders; see :mod:`gossamer.fingerprint`.
+    """
+    return _get_javascript('fingerprint')
+
+
+def get_events(since): # pragma: no cover
+    """
+    Events recorded by :data:`.getGossamerEvents` after the `since`
+    timestamp, along with the count of events dropped by its ring buffer.
+    """
+    return """
+return window._getGossamerEvents(%d);
+""" % since
 
 
 def isPageChanging(timeout): # pragma: no cover
@@ -63,3 +92,50 @@ def get_post(url, postdata): # pragma: no cover
 now = """
 return Date.now();
 """
+
+
+# the bounding box of the element given, or of the viewport, in CSS pixels,
+# and the ratio of device pixels to CSS pixels
+client_rect = """
+var _gossamerClientRect = arguments.length ? arguments[0].getBoundingClientRect() :
+    {left: 0, top: 0, width: window.innerWidth, height: window.innerHeight};
+return [
+    _gossamerClientRect.left, _gossamerClientRect.top,
+    _gossamerClientRect.width, _gossamerClientRect.height,
+    window.devicePixelRatio || 1
+];
+"""
+
+
+clear_local_storage = """
+try { window.localStorage.clear(); } catch (e) {}
+"""
+
+
+clear_session_storage = """
+try { window.sessionStorage.clear(); } catch (e) {}
+"""
+
+
+# asynchronous; needs a script timeout
+clear_indexeddb = """
+var done = arguments[arguments.length - 1];
+if (!window.indexedDB || !window.indexedDB.databases) {
+    done();
+    return;
+}
+window.indexedDB.databases().then(function(databases) {
+    var pending = databases.length;
+    if (pending === 0) {
+        done();
+    }
+    databases.forEach(function(database) {
+        var request = window.indexedDB.deleteDatabase(database.name);
+        request.onsuccess = request.onerror = request.onblocked = function() {
+            if (--pending === 0) {
+                done();
+            }
+        };
+    });
+}, done);
+"""
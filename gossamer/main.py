@@ -10,30 +10,51 @@ Tests can be setup through the command-line interface via
 # Licensed under the Apache License, Version 2.0
 # https://www.apache.org/licenses/LICENSE-2.0
 
-from selenium.common.exceptions import WebDriverException
-
 from gossamer.constant import modes
-from gossamer import run, exc, util
+from gossamer import run, exc, util, hooks
+from gossamer.journal import remove_journal
 
 
-def dispatch(driver, mode, test, output=None):
+def dispatch(
+        driver, mode, test, output=None, executor=None, timings=None, verify=None,
+        screenshots=None
+    ): # pylint: disable=R0913
     """
     Given driver and a test, dispatch the appropriate run and return
     the result and error. For consumption by the CLI and unittest
     integration.
+
+    In playback, screenshots are compared on `executor` if one is given;
+    see :class:`gossamer.pool.Executor`. In playback and rerecording, the
+    time spent on each step is appended to `timings` if it is a list, and
+    only the `screenshots` given by number are taken, if any are. A
+    recording is verified as `verify` says; see :func:`gossamer.run.record`.
+    Registered :mod:`gossamer.hooks` are called as the test starts and ends.
     """
+    from selenium.common.exceptions import WebDriverException
     if not output:
         output = util.stdout_writer
     funcs = {
         modes.RECORD: (run.record, lambda x: (x.settings, )),
-        modes.RERECORD: (run.rerecord, lambda x: (x.settings, x.steps)),
-        modes.PLAYBACK: (run.playback, lambda x: (x.settings, x.steps))
+        modes.RERECORD: (run.rerecord, lambda x: (x.settings, x)),
+        modes.PLAYBACK: (run.playback, lambda x: (x.settings, x))
     }
+    kwargs = {'output': output}
+    if mode == modes.PLAYBACK:
+        kwargs['executor'] = executor
+    if mode in (modes.PLAYBACK, modes.RERECORD):
+        kwargs['timings'] = timings
+        kwargs['screenshots'] = screenshots
+    if mode == modes.RECORD:
+        kwargs['verify'] = verify
+    if hooks.registered:
+        hooks.call('on_test_start', test)
     try:
-        result, err = funcs[mode][0](driver, *funcs[mode][1](test), output=output)
+        result, err = funcs[mode][0](driver, *funcs[mode][1](test), **kwargs)
         if mode == modes.RECORD:
             # rerecord needs refactor to support writing updated settings
             util.write_recorded_run(test.settings.path, result)
+            remove_journal(test.settings.path)
     except exc.NoScreenshotsRecorded:
         raise
     except WebDriverException as exception:
@@ -49,4 +70,7 @@ def dispatch(driver, mode, test, output=None):
         raise
     except Exception:
         raise
+    finally:
+        if hooks.registered:
+            hooks.call('on_test_end', test)
     return (result, err)
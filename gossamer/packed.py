@@ -0,0 +1,278 @@
+"""
+A compact binary format for recorded runs, for long recordings whose
+`record.json` is slow to write and read.
+
+A file is a header, the test's settings, a table of step types, a table
+of interned strings, and then the steps as packed columns: each step's
+type, its `offset_time`, the `x` and `y` of its position, its other
+numbers, and references to its strings. A step type is a step's class
+name with the kind of each of its fields, so any step converts back to
+exactly the same JSON.
+"""
+
+# Copyright (c) 2013 contributors; see AUTHORS.
+# Licensed under the Apache License, Version 2.0
+# https://www.apache.org/licenses/LICENSE-2.0
+
+import json
+import struct
+import sys
+
+from array import array
+
+from gossamer.data import Point
+
+__all__ = ['MAGIC', 'FILENAME', 'is_packed', 'dumps', 'loads', ]
+
+MAGIC = 'GSMR'
+
+FILENAME = 'record.bin'
+
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<4sHH')
+_COUNT = struct.Struct('<I')
+_COLUMN = struct.Struct('<BI')
+
+# kinds of field, each stored in its own column
+_OFFSET = 'o' # integer offset_time
+_POINT = 'p' # Point of integer x and y
+_NUMBER = 'n' # other integer
+_STRING = 's' # string or None
+_JSON = 'j' # anything else, as JSON in the strings
+
+_COLUMNS = ('types', 'offsets', 'xs', 'ys', 'numbers', 'strings')
+
+# signed array typecodes by width in bytes; columns are little-endian
+_TYPECODES = {}
+for _typecode in 'bhilq':
+    try:
+        _TYPECODES.setdefault(array(_typecode).itemsize, _typecode)
+    except ValueError: # no 'q' before Python 3.3
+        pass
+del _typecode
+_LOW, _HIGH = -2 ** (max(_TYPECODES) * 8 - 1), 2 ** (max(_TYPECODES) * 8 - 1)
+
+
+def is_packed(data):
+    """
+    Whether `data`, the start of a file, is in this format.
+    """
+    return data[:len(MAGIC)] == MAGIC
+
+
+def _integral(value):
+    """
+    Whether `value` is stored in an integer column.
+    """
+    return type(value) in (int, long) and _LOW <= value < _HIGH
+
+
+def _kind(key, value):
+    """
+    How to store the field `key` of a step.
+    """
+    if key == 'offset_time' and _integral(value):
+        return _OFFSET
+    if isinstance(value, Point) and _integral(value.x) and _integral(value.y):
+        return _POINT
+    if _integral(value):
+        return _NUMBER
+    if value is None or isinstance(value, basestring):
+        return _STRING
+    return _JSON
+
+
+def _width(values):
+    """
+    The narrowest width in bytes of a signed integer holding `values`.
+    """
+    low, high = (min(values), max(values)) if values else (0, 0)
+    for width in sorted(_TYPECODES):
+        bits = width * 8
+        if -2 ** (bits - 1) <= low and high < 2 ** (bits - 1):
+            return width
+    raise ValueError('Integer out of range')
+
+
+def _pack_string(value):
+    """
+    A length-prefixed UTF-8 string.
+    """
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return _COUNT.pack(len(value)) + value
+
+
+class _Reader(object): # pylint: disable=R0903
+    """
+    Reads successive values from a buffer.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    def unpack(self, fmt):
+        """
+        Read a `struct.Struct`.
+        """
+        values = fmt.unpack_from(self.data, self.position)
+        self.position += fmt.size
+        return values
+
+    def string(self):
+        """
+        Read a string written by :func:`._pack_string`.
+        """
+        length, = self.unpack(_COUNT)
+        value = self.data[self.position:self.position + length]
+        self.position += length
+        return value.decode('utf-8')
+
+    def column(self):
+        """
+        Read a column written by :func:`._pack_column`.
+        """
+        width, length = self.unpack(_COLUMN)
+        values = array(_TYPECODES[width])
+        end = self.position + length * width
+        values.fromstring(self.data[self.position:end])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        self.position = end
+        return values
+
+
+def _pack_column(values):
+    """
+    A column of integers as their width, their count, and the array.
+    """
+    width = _width(values)
+    packed = array(_TYPECODES[width], values)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return _COLUMN.pack(width, len(values)) + packed.tostring()
+
+
+def dumps(test):
+    """
+    Serialize a :class:`gossamer.data.Test` to this format.
+    """
+    from gossamer.util import Encoder
+    types, kinds = {}, []
+    strings, interned = [], {None: -1}
+    columns = dict((name, []) for name in _COLUMNS)
+
+    def intern(value):
+        """
+        Reference to `value` in the string table.
+        """
+        if value not in interned:
+            interned[value] = len(strings)
+            strings.append(value)
+        return interned[value]
+
+    offsets, xs, ys = columns['offsets'], columns['xs'], columns['ys']
+    numbers, refs = columns['numbers'], columns['strings']
+    for step in test.steps:
+        items = [(name, getattr(step, name)) for name in step.fields]
+        fields = tuple((name, _kind(name, value)) for name, value in items)
+        key = (step.__class__.__name__, fields)
+        if key not in types:
+            types[key] = len(kinds)
+            kinds.append(key)
+        columns['types'].append(types[key])
+        for (_, value), (_, kind) in zip(items, fields):
+            if kind == _OFFSET:
+                offsets.append(value)
+            elif kind == _POINT:
+                xs.append(value.x)
+                ys.append(value.y)
+            elif kind == _NUMBER:
+                numbers.append(value)
+            elif kind == _STRING:
+                refs.append(intern(value))
+            else:
+                refs.append(intern(json.dumps(value, cls=Encoder)))
+
+    ret = [
+        _HEADER.pack(MAGIC, FORMAT_VERSION, test.version),
+        _pack_string(json.dumps(test.settings, cls=Encoder)),
+        _COUNT.pack(len(kinds)),
+    ]
+    for name, fields in kinds:
+        ret.append(_pack_string(name))
+        ret.append(_pack_string(''.join(kind for _, kind in fields)))
+        ret.append(_pack_string(','.join(field for field, _ in fields)))
+    ret.append(_COUNT.pack(len(strings)))
+    ret.extend(_pack_string(value) for value in strings)
+    ret.extend(_pack_column(columns[name]) for name in _COLUMNS)
+    return ''.join(ret)
+
+
+def loads(data):
+    """
+    Deserialize a :class:`gossamer.data.Test` from this format.
+    """
+    reader = _Reader(data)
+    magic, version, data_version = reader.unpack(_HEADER)
+    if magic != MAGIC:
+        raise ValueError('Not a packed recorded run')
+    if version != FORMAT_VERSION or data_version not in _LOADERS:
+        raise NotImplementedError()
+    return _LOADERS[data_version](reader)
+
+
+def _loads_v1(reader):
+    """
+    Deserialize for Test.version == 1
+    """
+    from gossamer.data import Test, Settings
+    from gossamer import step
+    settings = json.loads(reader.string())
+    count, = reader.unpack(_COUNT)
+    kinds = []
+    for _ in range(count):
+        name = reader.string()
+        fields = reader.string()
+        names = reader.string()
+        kinds.append((
+            getattr(step, name),
+            zip(names.split(',') if names else [], fields)
+        ))
+    count, = reader.unpack(_COUNT)
+    strings = [reader.string() for _ in range(count)]
+    columns = dict((name, iter(reader.column())) for name in _COLUMNS)
+
+    steps = []
+    for index in columns['types']:
+        cls, fields = kinds[index]
+        values = {}
+        for name, kind in fields:
+            if kind == _OFFSET:
+                values[name] = next(columns['offsets'])
+            elif kind == _POINT:
+                values[name] = Point(next(columns['xs']), next(columns['ys']))
+            elif kind == _NUMBER:
+                values[name] = next(columns['numbers'])
+            else:
+                ref = next(columns['strings'])
+                value = strings[ref] if ref >= 0 else None
+                if kind == _JSON:
+                    value = json.loads(value)
+                    if name == 'pos' and isinstance(value, dict):
+                        value = Point(**value)
+                values[name] = value
+        steps.append(cls(**values))
+    return Test(
+        version=1,
+        settings=Settings(**settings),
+        steps=steps
+    )
+
+
+# by Test.version
+_LOADERS = {
+    1: _loads_v1,
+}
@@ -0,0 +1,413 @@
+"""
+Run many tests concurrently over a pool of WebDriver sessions.
+"""
+
+# Copyright (c) 2013 contributors; see AUTHORS.
+# Licensed under the Apache License, Version 2.0
+# https://www.apache.org/licenses/LICENSE-2.0
+
+import Queue
+import threading
+import time
+
+from gossamer.main import dispatch
+from gossamer.constant import modes, states
+from gossamer import util, js, trace
+
+__all__ = ['SessionPool', 'Executor', 'Verifier', 'reset_session', 'run_tests', ]
+
+
+RESETS = ('cookies', 'localstorage', 'sessionstorage', 'indexeddb')
+
+
+def reset_session(driver, resets=RESETS):
+    """
+    Clear the state a test left in a WebDriver session using each of the
+    named `resets`, and leave it on a blank page. Cookies and storage are
+    only cleared for the page the session is on. Returns whether the
+    session could be reset.
+    """
+    from selenium.common.exceptions import WebDriverException
+    try:
+        if 'cookies' in resets:
+            driver.delete_all_cookies()
+        if 'localstorage' in resets:
+            driver.execute_script(js.clear_local_storage)
+        if 'sessionstorage' in resets:
+            driver.execute_script(js.clear_session_storage)
+        if 'indexeddb' in resets:
+            driver.set_script_timeout(5)
+            driver.execute_async_script(js.clear_indexeddb)
+        driver.get('about:blank')
+    except WebDriverException as exception:
+        util.log.debug('reset_session: %s', exception)
+        return False
+    util.session_state(driver)['clean'] = True
+    return True
+
+
+class SessionPool(object): # pylint: disable=R0902
+    """
+    Hand out at most `size` WebDriver sessions at once from the Selenium
+    Server at `selenium`.
+
+    A session is reused for up to `reuse` tests with the same browser,
+    being cleared between tests by :func:`.reset_session` with the given
+    `resets`. It is recycled after `reuse` tests, after an error, or if it
+    cannot be reset. By default, every test gets a new session.
+
+    Sessions are made with the WebDriver `client`, one of
+    :data:`gossamer.util.CLIENTS`.
+    """
+
+    def __init__(self, size=1, selenium=None, reuse=1, resets=RESETS, client=None): # pylint: disable=R0913
+        if size < 1:
+            raise ValueError('Pool size must be at least 1')
+        if reuse < 1:
+            raise ValueError('Sessions must be used for at least 1 test')
+        if client not in (None, ) + util.CLIENTS:
+            raise ValueError(
+                'Unknown client %r; valid clients are %r.' % (client, util.CLIENTS)
+            )
+        unknown = set(resets) - set(RESETS)
+        if unknown:
+            raise ValueError(
+                'Unknown resets %r; valid resets are %r.' % (sorted(unknown), RESETS)
+            )
+        self.size = size
+        self.selenium = selenium
+        self.reuse = reuse
+        self.resets = tuple(resets)
+        self.client = client
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._sessions = {} # driver: [browser, tests run]
+        self._idle = []
+
+    def acquire(self, browser):
+        """
+        Get a session for `browser`, blocking until a slot is free. The
+        caller is responsible for calling :meth:`.release`.
+        """
+        self._slots.acquire()
+        stale = None
+        with self._lock:
+            for driver in self._idle:
+                if self._sessions[driver][0] == browser:
+                    self._idle.remove(driver)
+                    return driver
+            if self._idle and len(self._sessions) >= self.size:
+                # make room by closing an idle session for another browser
+                stale = self._idle.pop(0)
+                del self._sessions[stale]
+        if stale is not None:
+            util.close_driver(stale)
+        try:
+            driver = self._new_driver(browser)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._sessions[driver] = [browser, 0]
+        return driver
+
+    def _new_driver(self, browser):
+        """
+        A new session for `browser`.
+        """
+        return util.get_driver(browser, self.selenium, client=self.client)
+
+    def release(self, driver, error=False):
+        """
+        Return a session to the pool after a test, with `error` if the test
+        errored.
+        """
+        try:
+            with self._lock:
+                self._sessions[driver][1] += 1
+                reuse = not error and self._sessions[driver][1] < self.reuse
+            if reuse and reset_session(driver, self.resets):
+                with self._lock:
+                    self._idle.append(driver)
+            else:
+                with self._lock:
+                    del self._sessions[driver]
+                util.close_driver(driver)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """
+        Close every open session, idle or not.
+        """
+        with self._lock:
+            drivers, self._sessions, self._idle = self._sessions.keys(), {}, []
+        for driver in drivers:
+            util.close_driver(driver)
+
+
+class Future(object):
+    """
+    The eventual result of a call submitted to an :class:`.Executor`.
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exception = None
+
+    def set_result(self, result):
+        """
+        Complete with `result`.
+        """
+        self._result = result
+        self._done.set()
+
+    def set_exception(self, exception):
+        """
+        Complete with `exception`, to be raised by :meth:`.result`.
+        """
+        self._exception = exception
+        self._done.set()
+
+    def done(self):
+        """
+        Whether the call has completed.
+        """
+        return self._done.is_set()
+
+    def result(self):
+        """
+        Wait for and return the result of the call, or raise its exception.
+        """
+        while not self._done.wait(0.25):
+            pass
+        if self._exception is not None:
+            raise self._exception # pylint: disable=E0702
+        return self._result
+
+
+class Executor(object):
+    """
+    Run submitted calls, such as screenshot comparisons, on `workers`
+    threads of their own.
+    """
+
+    def __init__(self, workers=2):
+        if workers < 1:
+            raise ValueError('Executor needs at least 1 worker')
+        self._queue = Queue.Queue()
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work, name='gossamer-executor-%d' % i)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Call `func` with the given arguments on a worker, returning a
+        :class:`.Future`.
+        """
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def shutdown(self):
+        """
+        Finish submitted calls and stop the workers.
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            while thread.is_alive():
+                thread.join(0.25)
+        self._threads = []
+
+    def _work(self):
+        """
+        Run calls from the queue until shut down.
+        """
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, func, args, kwargs = item
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as exception: # pylint: disable=W0703
+                future.set_exception(exception)
+
+
+class Verifier(object):
+    """
+    Verify recordings by playing them back on sessions from `pool` while
+    recording goes on, writing each result to `output` once it's known.
+    Pass it as `verify` to :func:`gossamer.run.record`.
+    """
+
+    def __init__(self, pool, output=None):
+        self.pool = pool
+        self.output = util.SynchronizedWriter(output or util.stdout_writer)
+        self._executor = Executor(pool.size)
+        self._verifications = []
+        self._cancelled = threading.Event()
+        self._results = None
+
+    def __call__(self, test):
+        """
+        Verify the recording `test`, in the background.
+        """
+        self._verifications.append(
+            (test.settings.name, self._executor.submit(self._verify, test))
+        )
+
+    def _verify(self, test):
+        """
+        Play back `test` on a session from the pool, unless cancelled.
+        """
+        if self._cancelled.is_set():
+            return None
+        output = self.output.buffer()
+        output('Verified: ')
+        result = None
+        try:
+            driver = self.pool.acquire(test.settings.browser)
+            try:
+                result, err = dispatch(driver, modes.PLAYBACK, test, output=output)
+            finally:
+                self.pool.release(driver, error=result in (None, states.ERROR))
+        except Exception as exception: # pylint: disable=W0703
+            result, err = (states.ERROR, exception)
+            output('%s ... %s: %s' % (test.settings.name, result, err))
+        finally:
+            output('\n')
+            output.commit()
+        return (result, err)
+
+    def wait(self, cancel=False):
+        """
+        Wait for the verifications and return a dictionary of test name to
+        `(state, err)` of those made. With `cancel`, those not yet begun are
+        skipped.
+        """
+        if cancel:
+            self._cancelled.set()
+        if self._results is None:
+            results = {}
+            for name, future in self._verifications:
+                result = future.result()
+                if result is not None:
+                    results[name] = result
+            self._executor.shutdown()
+            self._results = results
+        return self._results
+
+    def close(self, cancel=False):
+        """
+        :meth:`.wait`, and then close the pool's sessions, returning the
+        results.
+        """
+        try:
+            return self.wait(cancel)
+        finally:
+            self.pool.close()
+
+
+def run_tests(
+        tests, mode, pool, output=None, stop_on_error=False, executor=None,
+        durations=None, timings=None, startup=None, verify=None, screenshots=None
+    ): # pylint: disable=R0913,R0915,R0914
+    """
+    Dispatch every test in the dictionary `tests`, in its order, running as
+    many at once as `pool` has sessions, and return a dictionary of test
+    name to `(state, err)`. Screenshots are compared on `executor`, if
+    given. If `durations` is a dictionary, each test's duration in seconds,
+    including getting its session, is set in it, and if `timings` is a
+    dictionary, each test's list of :class:`gossamer.data.StepTiming`, and
+    if `startup` is a dictionary, the seconds spent getting its session.
+
+    With more than one session, each test's output is written as a whole
+    once it completes. With `stop_on_error`, no further tests are started
+    after a failure or error. Recordings are verified as `verify` says; see
+    :func:`gossamer.run.record`. If `screenshots` is a dictionary, only the
+    screenshots it gives by number for a test are taken. The first exception
+    raised while running a test stops the run and is re-raised.
+    """
+    output = output or util.stdout_writer
+    writer = util.SynchronizedWriter(output) if pool.size > 1 else None
+    queue = Queue.Queue()
+    for item in tests.items():
+        queue.put(item)
+    results = {}
+    failures = []
+    stop = threading.Event()
+
+    def work():
+        """
+        Run tests from the queue until it is empty or we're stopped.
+        """
+        while not stop.is_set():
+            try:
+                name, test = queue.get_nowait()
+            except Queue.Empty:
+                return
+            test_output = writer.buffer() if writer else output
+            started = time.time()
+            steps = [] if timings is not None else None
+            trace.memory()
+            try:
+                with trace.span('session', 'session'):
+                    driver = pool.acquire(test.settings.browser)
+                if startup is not None:
+                    startup[name] = time.time() - started
+                result = None
+                try:
+                    with trace.span(name, 'test') as span:
+                        result, err = dispatch(
+                            driver, mode, test, output=test_output, executor=executor,
+                            timings=steps, verify=verify,
+                            screenshots=screenshots.get(name) if screenshots else None
+                        )
+                        span.args = {'state': str(result)}
+                finally:
+                    pool.release(driver, error=result in (None, states.ERROR))
+                test_output('\n', flush=True)
+            except Exception as exception: # pylint: disable=W0703
+                failures.append(exception)
+                stop.set()
+                return
+            finally:
+                trace.memory()
+                if writer:
+                    test_output.commit()
+            results[name] = (result, err)
+            if durations is not None:
+                durations[name] = time.time() - started
+            if timings is not None:
+                timings[name] = steps
+            if stop_on_error and (not result or result in (states.FAIL, states.ERROR)):
+                stop.set()
+
+    if pool.size == 1:
+        work()
+    else:
+        workers = [
+            threading.Thread(target=work, name='gossamer-%d' % i)
+            for i in range(min(pool.size, len(tests)))
+        ]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        try:
+            for worker in workers:
+                while worker.is_alive():
+                    worker.join(0.25)
+        except KeyboardInterrupt:
+            stop.set()
+            pool.close()
+            raise
+
+    if failures:
+        raise failures[0]
+    return results
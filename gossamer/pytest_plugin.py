@@ -0,0 +1,225 @@
+"""
+A pytest plugin collecting the tests in Gossamerfiles as pytest items.
+
+Installed with Gossamer, and enabled with `--gossamer`, it collects each
+test in a file named `Gossamerfile` (or as given by the `gossamer_files`
+ini option) and plays it back. Tests in a process share one pool of WebDriver sessions, which is
+also the `gossamer_sessions` fixture; with pytest-xdist, each worker has its
+own. Tests are ordered longest first, by their durations in the run history
+if known and otherwise by their counts of steps and screenshots, so that
+xdist's load distribution finishes the long tests early. The terminal
+summary reports where the time went.
+
+    py.test --gossamer --gossamer-data gossamer -n 4
+"""
+
+# Copyright (c) 2013 contributors; see AUTHORS.
+# Licensed under the Apache License, Version 2.0
+# https://www.apache.org/licenses/LICENSE-2.0
+
+import fnmatch
+import os
+
+import pytest # pylint: disable=F0401
+
+from gossamer.constant import modes, states
+from gossamer.history import FILENAME as HISTORY_FILENAME, History
+from gossamer.main import dispatch
+from gossamer.pool import SessionPool, RESETS
+from gossamer.report import properties, summary
+from gossamer.shard import longest_first, weight
+from gossamer import util
+
+# slowest steps shown in the terminal summary
+SLOWEST = 5
+
+
+def pytest_addoption(parser):
+    """
+    Gossamer's options.
+    """
+    group = parser.getgroup('gossamer', 'Gossamer UI tests')
+    group.addoption(
+        '--gossamer', dest='gossamer', action='store_true', default=False,
+        help='Collect and play back the tests in Gossamerfiles'
+    )
+    group.addoption(
+        '--gossamer-data', dest='gossamer_data', metavar='DIR',
+        help='Directory of the recorded tests, by default gossamer/ beside '
+        'each Gossamerfile'
+    )
+    group.addoption(
+        '--gossamer-selenium', dest='gossamer_selenium', metavar='URL',
+        help='Selenium WebDriver URL to use'
+    )
+    group.addoption(
+        '--gossamer-client', dest='gossamer_client', metavar='NAME',
+        help='WebDriver client to use, either selenium or w3c'
+    )
+    group.addoption(
+        '--gossamer-reuse', dest='gossamer_reuse', type=int, default=1, metavar='N',
+        help='Reuse each WebDriver session for up to N tests'
+    )
+    parser.addini(
+        'gossamer_files', 'Glob of Gossamerfile names to collect',
+        default='Gossamerfile'
+    )
+
+
+def pytest_collect_file(path, parent):
+    """
+    Collect Gossamerfiles, if enabled.
+    """
+    if parent.config.getoption('gossamer') and \
+            fnmatch.fnmatch(path.basename, parent.config.getini('gossamer_files')):
+        return _node(GossamerFile, parent, fspath=path)
+
+
+def _node(cls, parent, **kwargs):
+    """
+    Make a collection node, with `from_parent` where pytest has it.
+    """
+    if hasattr(cls, 'from_parent'):
+        return cls.from_parent(parent, **kwargs)
+    return cls(parent=parent, **kwargs)
+
+
+def _sessions(config):
+    """
+    The process's pool of WebDriver sessions, opened when first needed.
+    """
+    sessions = getattr(config, '_gossamer_sessions', None)
+    if sessions is None:
+        sessions = config._gossamer_sessions = SessionPool( # pylint: disable=W0212
+            1, config.getoption('gossamer_selenium'),
+            reuse=config.getoption('gossamer_reuse'), resets=RESETS,
+            client=config.getoption('gossamer_client')
+        )
+    return sessions
+
+
+@pytest.fixture(scope='session')
+def gossamer_sessions(request):
+    """
+    The :class:`gossamer.pool.SessionPool` shared by Gossamer tests in this
+    process or xdist worker.
+    """
+    return _sessions(request.config)
+
+
+class GossamerFailure(Exception):
+    """
+    A Gossamer test's screenshots differed.
+    """
+
+
+class GossamerFile(pytest.File):
+    """
+    The tests in a Gossamerfile.
+    """
+
+    def collect(self):
+        filename = str(self.fspath)
+        data_dir = self.config.getoption('gossamer_data') or \
+            os.path.join(os.path.dirname(filename), 'gossamer')
+        if not os.path.isabs(data_dir):
+            data_dir = os.path.join(str(self.config.rootdir), data_dir)
+        tests = util.make_tests([filename], modes.PLAYBACK, data_dir)
+        durations = None
+        if os.path.exists(os.path.join(data_dir, HISTORY_FILENAME)):
+            history = History(data_dir)
+            durations = history.durations()
+            history.close()
+        for name in util.read_test_names([filename], data_dir):
+            if name in tests:
+                yield _node(
+                    GossamerItem, self, name=name, test=tests[name], durations=durations
+                )
+
+
+class GossamerItem(pytest.Item):
+    """
+    A Gossamer test, played back when run.
+    """
+
+    def __init__(self, name, parent=None, test=None, durations=None, **kwargs):
+        super(GossamerItem, self).__init__(name, parent, **kwargs)
+        self.test = test
+        self.durations = durations
+
+    @property
+    def cost(self):
+        """
+        Expected duration in seconds; see :func:`gossamer.shard.weight`.
+        """
+        return weight(self.test, self.durations, self.name)
+
+    def runtest(self):
+        sessions = _sessions(self.config)
+        driver = sessions.acquire(self.test.settings.browser)
+        timings = []
+        result = None
+        try:
+            result, err = dispatch(
+                driver, modes.PLAYBACK, self.test, output=util.null_writer,
+                timings=timings
+            )
+        finally:
+            sessions.release(driver, error=result in (None, states.ERROR))
+            self.user_properties.append(('gossamer', properties(timings)))
+        if result == states.FAIL:
+            raise GossamerFailure(str(err) if err is not None else 'Screenshots were different.')
+        elif result == states.ERROR:
+            raise err if err is not None else GossamerFailure('Test errored')
+
+    def repr_failure(self, excinfo): # pylint: disable=W0221
+        if excinfo.errisinstance(GossamerFailure):
+            return str(excinfo.value)
+        return super(GossamerItem, self).repr_failure(excinfo)
+
+    def reportinfo(self):
+        return (self.fspath, None, 'gossamer: %s' % self.name)
+
+
+def pytest_collection_modifyitems(session, config, items): # pylint: disable=W0613
+    """
+    Order Gossamer tests longest first, among the places they were
+    collected in, so every process, xdist worker or not, has the same order.
+    Tests of known duration are weighed without loading their records.
+    """
+    longest_first(items, lambda item: item.cost if isinstance(item, GossamerItem) else None)
+
+
+def pytest_runtest_logreport(report):
+    """
+    Keep the timings of Gossamer tests, which come from xdist workers in
+    their reports.
+    """
+    if report.when != 'call':
+        return
+    for key, value in getattr(report, 'user_properties', ()):
+        if key == 'gossamer':
+            _timings.append((report.nodeid, value))
+
+_timings = []
+
+
+def pytest_terminal_summary(terminalreporter):
+    """
+    Report the time spent in each phase of Gossamer tests, and the slowest
+    steps.
+    """
+    if not _timings:
+        return
+    terminalreporter.section('Gossamer timings')
+    for line in summary(_timings, SLOWEST):
+        terminalreporter.write_line(line)
+
+
+def pytest_unconfigure(config):
+    """
+    Close the process's WebDriver sessions.
+    """
+    sessions = getattr(config, '_gossamer_sessions', None)
+    if sessions is not None:
+        sessions.close()
@@ -0,0 +1,183 @@
+"""
+Reports of a run, as JSON and as JUnit XML for CI, with where each test's
+time went.
+
+A test's time is split into phases: getting its WebDriver `session`,
+`begin`, preparing the browser, navigating and waiting for the page to
+load, and then for its steps, their `delay`, the `wait` for the page to be
+static, `execute` in the step itself, and for screenshots, `capture` and
+`compare`. Screenshots compared while playback continues are compared
+alongside the other phases rather than after them.
+"""
+
+# Copyright (c) 2013 contributors; see AUTHORS.
+# Licensed under the Apache License, Version 2.0
+# https://www.apache.org/licenses/LICENSE-2.0
+
+import json
+import os
+
+from gossamer.constant import states
+
+__all__ = ['PHASES', 'phases', 'totals', 'properties', 'summary', 'write_json',
+    'write_junit', ]
+
+REPORT_VERSION = 1
+
+PHASES = ('session', 'begin', 'delay', 'wait', 'execute', 'capture', 'compare')
+
+_STEP_PHASES = ('delay', 'wait', 'execute', 'capture', 'compare')
+
+
+def phases(timings, startup=None):
+    """
+    Dictionary of phase to seconds for a test, from its list of
+    :class:`gossamer.data.StepTiming` and seconds getting its session.
+    """
+    ret = dict((phase, 0.0) for phase in PHASES)
+    ret['session'] = startup or 0.0
+    for step in timings or []:
+        if step.num == 0:
+            ret['begin'] += step.wait + step.execute
+            continue
+        for phase in _STEP_PHASES:
+            ret[phase] += getattr(step, phase)
+    return ret
+
+
+def totals(timings, startup=None):
+    """
+    Dictionary of phase to seconds over every test, from dictionaries of
+    test name to its timings and to its seconds getting its session.
+    """
+    startup = startup or {}
+    ret = dict((phase, 0.0) for phase in PHASES)
+    for name in set(timings) | set(startup):
+        for phase, seconds in phases(timings.get(name), startup.get(name)).items():
+            ret[phase] += seconds
+    return ret
+
+
+def properties(timings, startup=None):
+    """
+    A test's phases and the seconds of each step, as a JSON-able dictionary
+    to be summarized by :func:`.summary`, e.g., in a pytest report.
+    """
+    return {
+        'phases': phases(timings, startup),
+        'steps': [
+            (step.num, step.step, sum(getattr(step, phase) for phase in _STEP_PHASES))
+            for step in timings or [] if step.num
+        ],
+    }
+
+
+def summary(tests, slowest=5):
+    """
+    Lines reporting the seconds spent in each phase, most first, and the
+    `slowest` steps, over `tests`, a list of test name and its
+    :func:`.properties`.
+    """
+    spent = dict((phase, 0.0) for phase in PHASES)
+    steps = []
+    for name, value in tests:
+        for phase, seconds in value['phases'].items():
+            spent[phase] = spent.get(phase, 0.0) + seconds
+        steps.extend((seconds, name, num, step) for num, step, seconds in value['steps'])
+    total = sum(spent.values()) or 1.0
+    lines = [
+        '%10.2f s  %5.1f%%  %s' % (seconds, 100.0 * seconds / total, phase)
+        for phase, seconds in sorted(spent.items(), key=lambda item: (-item[1], item[0]))
+    ]
+    lines.append('Slowest steps:')
+    lines.extend(
+        '%10.2f s  %s step %d (%s)' % (seconds, name, num, step)
+        for seconds, name, num, step in sorted(steps, reverse=True)[:slowest]
+    )
+    return lines
+
+
+def _write(filename, data):
+    """
+    Write `data` to `filename`, making its directory if need be.
+    """
+    directory = os.path.dirname(filename)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(filename, 'w') as fp:
+        fp.write(data)
+
+
+def write_json(
+        filename, results, durations=None, timings=None, startup=None, mode=None
+    ): # pylint: disable=R0913
+    """
+    Write a report of `results`, a dictionary of test name to
+    `(state, err)`, to the JSON file `filename`, with each test's duration,
+    phases and steps, and the suite's total for each phase.
+    """
+    durations, timings, startup = durations or {}, timings or {}, startup or {}
+    tests = {}
+    for name, (state, err) in results.items():
+        steps = timings.get(name) or []
+        tests[name] = {
+            'state': str(state),
+            'error': str(err) if err is not None else None,
+            'duration': durations.get(name),
+            'phases': phases(steps, startup.get(name)),
+            'steps': [dict(step._asdict()) for step in steps],
+        }
+    _write(filename, json.dumps({
+        'version': REPORT_VERSION,
+        'mode': mode,
+        'totals': totals(timings, startup),
+        'tests': tests,
+    }, indent=2, sort_keys=True))
+    return True
+
+
+def write_junit(
+        filename, results, durations=None, timings=None, startup=None, suite='gossamer'
+    ): # pylint: disable=R0913,R0914
+    """
+    Write `results` to the JUnit XML file `filename`, as a test suite named
+    `suite`. Each test case's phases are given as properties and its steps'
+    timings in its output.
+    """
+    from xml.etree import ElementTree
+    durations, timings, startup = durations or {}, timings or {}, startup or {}
+    counts = dict((state, 0) for state in (states.OK, states.FAIL, states.ERROR))
+    root = ElementTree.Element('testsuite', name=suite)
+    for name in sorted(results):
+        state, err = results[name]
+        counts[state] = counts.get(state, 0) + 1
+        case = ElementTree.SubElement(
+            root, 'testcase', classname=suite, name=name,
+            time='%.3f' % (durations.get(name) or 0.0)
+        )
+        if state == states.FAIL:
+            ElementTree.SubElement(case, 'failure', message=str(err)).text = str(err)
+        elif state != states.OK:
+            ElementTree.SubElement(
+                case, 'error', message=str(err) if err is not None else 'error'
+            ).text = str(err)
+        properties = ElementTree.SubElement(case, 'properties')
+        steps = timings.get(name) or []
+        test_phases = phases(steps, startup.get(name))
+        for phase in PHASES:
+            ElementTree.SubElement(
+                properties, 'property', name=phase, value='%.3f' % test_phases[phase]
+            )
+        ElementTree.SubElement(case, 'system-out').text = ''.join(
+            '%d %s: %s\n' % (step.num, step.step, ', '.join(
+                '%s %.3fs' % (field, getattr(step, field))
+                for field in ('delay', 'wait', 'execute', 'capture', 'compare')
+                if getattr(step, field)
+            )) for step in steps
+        )
+    root.set('tests', str(len(results)))
+    root.set('failures', str(counts[states.FAIL]))
+    root.set('errors', str(counts[states.ERROR]))
+    root.set('time', '%.3f' % sum(durations.get(name) or 0.0 for name in results))
+    _write(filename, ElementTree.tostring(root, encoding='utf-8'))
+    return True
@@ -6,18 +6,21 @@ Record, playback, &c a given test.
 # Licensed under the Apache License, Version 2.0
 # https://www.apache.org/licenses/LICENSE-2.0
 
+import itertools
 import operator
 import time
 
-from selenium.common.exceptions import WebDriverException
+from collections import deque, namedtuple
 
 from gossamer.constant import states, modes, DATA_VERSION
-from gossamer.step import Screenshot, Click, Key, Scroll, Text, \
-    Navigate, Dropdown, KeyParams, ClickParams
-from gossamer.data import Point, Test
-from gossamer import util, js, exc
+from gossamer.step import Screenshot, Click, Scroll, Text, \
+    Navigate, Dropdown, KeyParams, ClickParams, TextParams, resolve_identifier, \
+    screenshot_target
+from gossamer.data import Point, Test, Settings, StepTiming
+from gossamer.journal import Journal, read_journal, remove_journal
+from gossamer import util, js, exc, trace, hooks
 
-__all__ = ['playback', 'record', 'rerecord', ]
+__all__ = ['playback', 'record', 'rerecord', 'compact', ]
 
 
 def navigate(driver, url):
@@ -25,8 +28,9 @@ def navigate(driver, url):
     Navigate the driver to the given URL.
     """
     href, postdata = url
-    driver.get('about:blank')
-    driver.refresh()
+    if not util.session_state(driver).pop('clean', False):
+        driver.get('about:blank')
+        driver.refresh()
     if not postdata:
         driver.get(href)
     else:
@@ -39,8 +43,8 @@ def _load_initial_js(driver):
     Split from :func:`.navigate` for calling within :func:`.record`
     after a URL change.
     """
-    driver.execute_script(js.getGossamerEvents)
-    driver.execute_script(js.pageChangingObserver)
+    driver.execute_script(js.getGossamerEvents())
+    driver.execute_script(js.pageChangingObserver())
 
 
 def wait_until_loaded(driver):
@@ -60,90 +64,159 @@ def wait_until_loaded(driver):
         )
 
 
-def _process_steps(steps, events, start_time): # pylint: disable=R0912
+_Field = namedtuple('_Field', ['offset_time', 'identifier_type', 'identifier', 'value'])
+
+
+def _process_steps(steps, events, start_time):
     """
     Process events from the user agent into our objects.
+
+    `steps` are those taken outside of the page, i.e., screenshots and
+    navigation. They are merged with the steps streamed from `events` by
+    :func:`._iter_steps`, and only steps up to the last screenshot are kept.
     """
     util.log.debug('_process_steps: %s steps, %s events', len(steps), len(events))
-    for (timestamp, action, params) in sorted(events, key=lambda x: x[0]):
+    last_screenshot_time = None
+    for step in steps:
+        if isinstance(step, Screenshot):
+            last_screenshot_time = step.offset_time
+    if last_screenshot_time is None:
+        return []
+    return list(itertools.takewhile(
+        lambda step: step.offset_time <= last_screenshot_time,
+        _iter_steps(
+            sorted(steps, key=operator.attrgetter('offset_time')),
+            sorted(events, key=lambda x: x[0]),
+            start_time
+        )
+    ))
+
+
+def _iter_steps(steps, events, start_time):
+    """
+    Merge time-ordered `steps` with the steps generated from time-ordered
+    `events`, in a single pass. On ties, `steps` come first.
+    """
+    steps = iter(steps)
+    pending = next(steps, None)
+    for step in _event_steps(events, start_time):
+        while pending is not None and pending.offset_time <= step.offset_time:
+            yield pending
+            pending = next(steps, None)
+        yield step
+    while pending is not None:
+        yield pending
+        pending = next(steps, None)
+
+
+def _event_steps(events, start_time): # pylint: disable=R0912
+    """
+    Generate playback steps, in time order, from time-ordered events from
+    the user agent.
+
+    Keystrokes are merged into :class:`.Text` as they stream past: only the
+    last keystroke of a run of typing is kept, and its `Text` is emitted
+    once the next event shows the run has ended. A tab's keyup carries the
+    element of the new field, so it instead ends the run at the step before
+    it. A `Text` sorts after other steps at the same time.
+    """
+    typing = None # (key, _Field) of the last keystroke of a run
+    previous = None # _Field of the previous step, if it has a value
+    texts = deque()
+
+    for (timestamp, action, params) in events:
         util.log.debug('event: %i, %s, %r', timestamp, action, params)
+        offset_time = timestamp - start_time
+        step = None
+        key = None
+        field = None
+
         if action == 'click':
             params = ClickParams(*params)
-            if not params[1]:
-                steps.append(
-                    Click(timestamp - start_time, Point(*params.pos))
-                )
+            if not params.select:
+                step = Click(offset_time, Point(*params.pos))
             else:
-                steps.append(
-                    Dropdown(
-                        timestamp - start_time,
-                        Point(*params.pos),
-                        params.eid,
-                        params.ecn,
-                        params.ecl
-                    )
+                step = Dropdown(
+                    offset_time,
+                    Point(*params.pos),
+                    params.eid,
+                    params.ecn,
+                    params.ecl
                 )
-        elif action == 'keyup':
-            params = KeyParams(*params)
-            steps.append(
-                Key(
-                    timestamp - start_time,
-                    key=params.key, shift=params.shift,
-                    eid=params.eid[0], eid_val=params.eid[1],
-                    ecn=params.ecn[0], ecn_val=params.ecn[1],
-                    ecl=params.ecl[0], ecl_val=params.ecl[1]
-                )
-            )
+                field = _Field(offset_time, step.identifier_type, step.identifier, step.value)
+        elif action in ('keyup', 'text'):
+            if action == 'keyup':
+                params = KeyParams(*params)
+                key = params.key
+            else:
+                params = TextParams(*params)
+            try:
+                field = _Field(offset_time, *resolve_identifier(
+                    params.eid[0], params.ecn[0], params.ecl[0],
+                    params.eid[1], params.ecn[1], params.ecl[1]
+                ))
+            except ValueError:
+                if key != '\t':
+                    # an element we cannot identify; it can't be played back
+                    util.log.debug('event: cannot identify element')
+                    action = None
         elif action == 'scroll':
-            steps.append(
-                Scroll(timestamp - start_time, Point(*params))
-            )
-
-    # iterate through steps, and process 'raw' steps like Key into Text
-    last_screenshot_time = None
-    merges = []
-    length = len(steps) - 1
-    for i, step in enumerate(steps):
-        if isinstance(step, Screenshot):
-            last_screenshot_time = step.offset_time
-        if isinstance(step, Key):
-            if i != length and step.key != '\t' and isinstance(steps[i+1], Key):
-                continue
+            step = Scroll(offset_time, Point(*params))
+        else:
+            continue
+        is_key = action in ('keyup', 'text')
+
+        if typing is not None:
+            # keystrokes merge until the field is left; a field's text
+            # event repeats if it was captured mid-run
+            if not (is_key and (typing[0] is not None or
+                    (field is not None and field.identifier == typing[1].identifier))):
+                texts.append(_text(typing[1]))
+            typing = None
+
+        if is_key:
+            if key == '\t':
+                if previous is not None:
+                    texts.append(_text(previous))
             else:
-                # tab keyup carries the element of the new field, so go back one
-                step = step if step.key != '\t' else (steps[i-1] if i != 0 else None)
-                if step is not None:
-                    merges.append(
-                        Text(
-                            offset_time=step.offset_time,
-                            value=step.value,
-                            identifier_type=step.identifier_type,
-                            identifier=step.identifier
-                        )
-                    )
-        # not merging scrolls; might've been done for rendering side effects
+                typing = (key, field)
+        elif step is not None:
+            while texts and texts[0].offset_time < step.offset_time:
+                yield texts.popleft()
+            yield step
+        previous = field
 
-    def _filter_steps(step):
-        """
-        Filter for whether a given step should go to playback.
-        """
-        return step.offset_time <= last_screenshot_time and \
-            step.playback is True
+    if typing is not None:
+        texts.append(_text(typing[1]))
+    while texts:
+        yield texts.popleft()
 
-    steps = sorted(
-        filter(_filter_steps, steps + merges), # pylint: disable=W0141
-        key=operator.attrgetter('offset_time')
+
+def _text(field):
+    """
+    :class:`.Text` for a field resolved from keystrokes.
+    """
+    return Text(
+        offset_time=field.offset_time,
+        value=field.value,
+        identifier_type=field.identifier_type,
+        identifier=field.identifier
     )
-    return steps
 
 
 def _begin_browsing(driver, settings):
     """
     Prepare the browser for the test to begin.
     """
+    from selenium.common.exceptions import WebDriverException
+    state = util.session_state(driver)
     try:
-        driver.delete_all_cookies()
-        driver.set_window_size(*settings.screensize)
+        if not state.get('clean'):
+            driver.delete_all_cookies()
+        screensize = tuple(settings.screensize)
+        if state.get('screensize') != screensize:
+            driver.set_window_size(*screensize)
+            state['screensize'] = screensize
         navigate(driver, settings.navigate())
         if settings.cookies is not None and len(settings.cookies) > 0:
             for cookie in settings.cookies:
@@ -184,12 +257,15 @@ def _has_page_changed(url, driver_url):
 
 class CaptureEvents(object): # pylint: disable=R0903
     """
-    Merge new events with old, keeping state of `timestamp`.
+    Merge new events with old, keeping state of `timestamp`, and append
+    them to `journal` if given.
     """
 
-    def __init__(self, timestamp):
+    def __init__(self, timestamp, journal=None):
         self.timestamp = timestamp
+        self.journal = journal
         self.retry = 3
+        self.overflow = 0
 
     def __call__(self, driver, events):
         """
@@ -197,9 +273,10 @@ class CaptureEvents(object): # pylint: disable=R0903
         on a composite key of 'timestamp.action'. This is an ugly workaround
         for an apparent Selenium issue.
         """
+        from selenium.common.exceptions import WebDriverException
         timestamp = driver.execute_script(js.now)
         try:
-            merges = driver.execute_script('return window._getGossamerEvents();')
+            merges = driver.execute_script(js.get_events(self.timestamp))
         except WebDriverException as exception:
             if exception.msg.startswith('window._getGossamerEvents is not a function'):
                 # navigation
@@ -212,122 +289,250 @@ class CaptureEvents(object): # pylint: disable=R0903
                                         'A script on this page may be busy, or '
                                         'it may have stopped responding.'):
             raise exc.TestError('Event-capturing script was unresponsive.')
-        for event in merges:
-            if event[0] > self.timestamp:
-                events['%s.%s' % (str(event[0]), str(event[1]))] = event
+        if merges['overflow'] > self.overflow:
+            util.log.warning(
+                'Event buffer overflowed; %d events were dropped.',
+                merges['overflow'] - self.overflow
+            )
+            self.overflow = merges['overflow']
+        if self.journal:
+            self.journal.events(merges['events'])
+        for event in merges['events']:
+            events['%s.%s' % (str(event[0]), str(event[1]))] = event
         self.timestamp = timestamp
         return events
 
 
-def record(driver, settings, output):
+def record(driver, settings, output, verify=None):
     """
     Record a given test.
+
+    Events and steps are kept in a :class:`gossamer.journal.Journal` as
+    they're captured, and the record is made from it at the end.
+    Screenshots are written on a thread of their own, so the next can be
+    taken meanwhile. The recording is then verified by playing it back,
+    unless `verify` is False; if `verify` is callable, it is called with
+    the record to verify it instead, e.g., on another session with a
+    :class:`gossamer.pool.Verifier`.
     """
+    from gossamer.pool import Executor
     _begin_browsing(driver, settings)
     start_time = driver.execute_script(js.now)
     url = settings.url
-    steps = []
-    navs = []
-    events = {}
-    get_events = CaptureEvents(start_time)
-
-    while True:
-        if util.prompt("\nPress enter to take a screenshot, "
-            "or type Q if you're done.", ('Q', 'q'), testname=settings.name):
-            break
-        events = get_events(driver, events)
-        # detect page changes
-        if _has_page_changed(url, driver.current_url):
-            if (not len(navs) and not settings.expect_redirect):
-                # only add to navs if an initial redirect is not expected
-                navs.append(
-                    Navigate(
-                        driver.execute_script(js.now) - start_time,
-                        driver.current_url
+    screenshots = 0
+    navigated = False
+    journal = Journal(settings, start_time)
+    get_events = CaptureEvents(start_time, journal)
+    writer = Executor(1)
+    writes = []
+
+    try:
+        while True:
+            answer = util.ask(
+                "\nPress enter to take a screenshot, or type #id, .class or "
+                "x,y,width,height to take one of an element or region, or type "
+                "Q if you're done.", testname=settings.name
+            )
+            if answer.strip() in ('Q', 'q'):
+                break
+            try:
+                target = screenshot_target(answer)
+            except ValueError as exception:
+                output('%s\n' % exception)
+                continue
+            get_events(driver, {})
+            # detect page changes
+            if _has_page_changed(url, driver.current_url):
+                if (not navigated and not settings.expect_redirect):
+                    # only add a navigation if an initial redirect is not expected
+                    journal.step(
+                        Navigate(
+                            driver.execute_script(js.now) - start_time,
+                            driver.current_url
+                        )
                     )
-                )
-            url = driver.current_url
-            _load_initial_js(driver)
-        events = get_events(driver, events)
+                    navigated = True
+                url = driver.current_url
+                _load_initial_js(driver)
+            get_events(driver, {})
 
-        # take screenshot
-        output('Taking screenshot ... ', flush=True)
-        screenshot_step = Screenshot(
-            driver.execute_script(js.now) - start_time,
-            len(steps) + 1
-        )
-        driver.save_screenshot(screenshot_step.get_path(settings))
-        steps.append(screenshot_step)
-        output(
-            '%d screenshot%s in test.\n' % \
-            (len(steps), 's' if len(steps) > 1 else '')
-        )
+            # take screenshot
+            output('Taking screenshot ... ', flush=True)
+            screenshot_step = Screenshot(
+                driver.execute_script(js.now) - start_time,
+                screenshots + 1, **target
+            )
+            writes.append(screenshot_step.capture(driver, settings, modes.RECORD, writer))
+            journal.step(screenshot_step, sync=True)
+            screenshots += 1
+            output(
+                '%d screenshot%s in test.\n' % \
+                (screenshots, 's' if screenshots > 1 else '')
+            )
+
+        # final capture of events
+        get_events(driver, {})
+    finally:
+        writer.shutdown()
+        journal.close()
+    for write in writes:
+        write.result()
 
     # must have at least one screenshot
-    if len(steps) == 0:
+    if screenshots == 0:
+        remove_journal(settings.path)
         raise exc.NoScreenshotsRecorded(
             'No screenshots recorded for %s--please take at least one\n' % \
                 settings.name
         )
 
-    # final capture of events
-    events = get_events(driver, events)
-    steps = _process_steps(steps + navs, events.values(), start_time)
-    record = Test( # pylint: disable=W0621
-        version = DATA_VERSION,
-        settings = settings,
-        steps = steps
-    )
+    record = compact(settings.path, settings) # pylint: disable=W0621
 
-    util.prompt(
-        "\n"
-        "Up next, we'll re-run your actions to generate screenshots to "
-        "ensure they \nare pixel-perfect when running automated. Press "
-        "enter to start.", testname=settings.name
-    )
-    playback(driver, settings, record, output)
+    if callable(verify):
+        verify(record)
+    elif verify is not False:
+        util.prompt(
+            "\n"
+            "Up next, we'll re-run your actions to generate screenshots to "
+            "ensure they \nare pixel-perfect when running automated. Press "
+            "enter to start.", testname=settings.name
+        )
+        playback(driver, settings, record, output)
 
     return (record, None)
 
 
-def rerecord(driver, settings, record, output): # pylint: disable=W0621
+def compact(directory, settings=None):
+    """
+    Make a :class:`gossamer.data.Test` from the journal of the recording in
+    a test's `directory`, with `settings`, or otherwise those journaled.
+    Raises :class:`gossamer.exc.NoScreenshotsRecorded` if the recording
+    has no screenshots.
+    """
+    entries = read_journal(directory)
+    if settings is None:
+        settings = Settings(**entries.settings)
+        settings.path = directory
+    if not any(isinstance(step, Screenshot) for step in entries.steps):
+        raise exc.NoScreenshotsRecorded(
+            'No screenshots recorded for %s--please take at least one\n' % \
+                settings.name
+        )
+    return Test(
+        version = DATA_VERSION,
+        settings = settings,
+        steps = _process_steps(entries.steps, entries.events, entries.start_time)
+    )
+
+
+def rerecord(driver, settings, record, output, timings=None, screenshots=None): # pylint: disable=W0621,R0913
     """
     Rerecord a given test. :func:`.playback` handles it based on mode.
     """
-    return playback(driver, settings, record, output, modes.RERECORD)
+    return playback(
+        driver, settings, record, output, modes.RERECORD, timings=timings,
+        screenshots=screenshots
+    )
 
 
-def playback(driver, settings, record, output, mode=None): # pylint: disable=W0621,R0912
+def playback(
+        driver, settings, record, output, mode=None, executor=None, timings=None,
+        screenshots=None
+    ): # pylint: disable=W0621,R0912,R0913,R0914,R0915
     """
     Playback a given test.
+
+    If an `executor` is given, screenshots are compared on it while the
+    following steps are played back, and the test fails on the first
+    screenshot which differs as it would otherwise. If `timings` is a list,
+    a :class:`gossamer.data.StepTiming` is appended to it for beginning the
+    test and for every step played back. Given a collection of
+    `screenshots` by number, only those are taken, and the test stops after
+    the last of them.
     """
     if settings.desc:
         output("%s ... " % settings.desc, flush=True)
     else:
         output("Playing back %s ... " % settings.name, flush=True)
 
-    _begin_browsing(driver, settings)
-    wait_until_loaded(driver)
+    started = time.time()
+    with trace.span('begin', 'step'):
+        _begin_browsing(driver, settings)
+    loading = time.time()
+    with trace.span('load', 'wait'):
+        wait_until_loaded(driver)
+    if timings is not None:
+        timings.append(StepTiming(0, 'Begin', time.time() - loading, loading - started))
     state = states.OK
     err = None
     mode = mode or modes.PLAYBACK
+    if mode != modes.PLAYBACK:
+        executor = None
+    comparisons = []
+    last = max(screenshots) if screenshots else None
 
     try:
-        for step in record.steps:
-            step.delayer(driver)
-            timeout = 0
-            while timeout < 40:
-                timeout += 1
-                if not driver.execute_script(js.isPageChanging(250)): # milliseconds
-                    step.execute(driver, settings, mode)
-                    break
+        try:
+            for num, step in enumerate(record.steps, 1):
+                selected = screenshots is None or not isinstance(step, Screenshot) or \
+                    step.num in screenshots
+                if not selected:
+                    if step.num > last:
+                        break
+                    continue
+                started = time.time()
+                step.delayer(driver)
+                waiting = time.time()
+                trace.complete('delay', 'wait', started, waiting)
+                timeout = 0
+                while timeout < 40:
+                    timeout += 1
+                    if not driver.execute_script(js.isPageChanging(250)): # milliseconds
+                        break
+                    else:
+                        time.sleep(0.25)
                 else:
-                    time.sleep(0.25)
-            if timeout == 40:
-                raise exc.PlaybackTimeout(
-                    '%s timed out while waiting for the page to be static.' \
-                        % settings.name
-                )
+                    raise exc.PlaybackTimeout(
+                        '%s timed out while waiting for the page to be static.' \
+                            % settings.name
+                    )
+                executing = time.time()
+                trace.complete('quiescence', 'wait', waiting, executing, {'polls': timeout})
+                capture = compare = 0.0
+                if hooks.registered:
+                    hooks.call('before_step', record, num, step)
+                with trace.span(step.__class__.__name__, 'step', {'num': num}):
+                    if isinstance(step, Screenshot):
+                        step.capture(driver, settings, mode)
+                        capture = time.time() - executing
+                        if hooks.registered:
+                            _after_capture(record, step, settings, mode)
+                        if mode == modes.PLAYBACK and executor is not None:
+                            comparisons.append((
+                                step, executor.submit(_compare, record, step, settings),
+                                len(timings) if timings is not None else None
+                            ))
+                        elif mode == modes.PLAYBACK:
+                            identical, compare = _compare(record, step, settings)
+                            if not identical:
+                                step.fail(settings)
+                    else:
+                        step.execute(driver, settings, mode)
+                if hooks.registered:
+                    hooks.call('after_step', record, num, step)
+                if timings is not None:
+                    timings.append(StepTiming(
+                        num, step.__class__.__name__, executing - waiting,
+                        time.time() - executing - capture - compare,
+                        waiting - started, capture, compare
+                    ))
+                if last is not None and isinstance(step, Screenshot) and step.num >= last:
+                    break
+        except Exception as exception: # pylint: disable=W0703
+            # a screenshot differing before the error is what failed the test
+            _check_comparisons(comparisons, settings, timings)
+            raise exception
+        _check_comparisons(comparisons, settings, timings)
 
     except Exception as exception: # pylint: disable=W0703
         if isinstance(exception, exc.ScreenshotsDiffer):
@@ -346,8 +551,53 @@ def playback(driver, settings, record, output, mode=None): # pylint: disable=W06
             else:
                 err = exception
 
+    if hooks.registered:
+        hooks.call('on_result', record, state, err)
     output('%s' % str(state))
     if err:
         output(': %s' % str(err))
     return (state, err)
 
+
+def _after_capture(record, step, settings, mode): # pylint: disable=W0621
+    """
+    Call the `after_capture` hooks with the screenshot `step` just taken.
+    """
+    if mode in (modes.RECORD, modes.RERECORD):
+        path = step.get_path(settings)
+    else:
+        path = step.get_last_path(settings)
+    with open(path, 'rb') as fp:
+        hooks.call('after_capture', record, step, fp.read())
+
+
+def _compare(record, step, settings): # pylint: disable=W0621
+    """
+    Compare a screenshot `step`, returning whether it was identical and the
+    seconds it took. A `before_compare` hook may decide instead.
+    """
+    started = time.time()
+    with trace.span('compare', 'compare', {'num': step.num}):
+        identical = None
+        if hooks.registered:
+            identical = hooks.call('before_compare', record, step)
+        if identical is None:
+            identical = step.compare(settings)
+        if hooks.registered:
+            hooks.call('after_compare', record, step, identical)
+    return (identical, time.time() - started)
+
+
+def _check_comparisons(comparisons, settings, timings=None):
+    """
+    Wait for screenshot comparisons made on an executor during
+    :func:`.playback`, failing on the first which differed. Their times
+    are added to `timings`.
+    """
+    for step, comparison, index in comparisons:
+        identical, elapsed = comparison.result()
+        if timings is not None and index < len(timings):
+            timings[index] = timings[index]._replace(compare=elapsed)
+        if not identical:
+            step.fail(settings)
+
@@ -0,0 +1,181 @@
+"""
+Split a suite across machines, and combine their results.
+
+Tests are assigned to shards deterministically by their expected
+duration, so each machine given the same tests and durations runs the same
+shard. Each shard writes its results to a JSON file, and
+:func:`.merge_results` combines those files into one verdict.
+"""
+
+# Copyright (c) 2013 contributors; see AUTHORS.
+# Licensed under the Apache License, Version 2.0
+# https://www.apache.org/licenses/LICENSE-2.0
+
+import json
+import os
+
+from gossamer.constant import states
+from gossamer.data import RecordedTest
+from gossamer.step import Screenshot
+
+__all__ = ['parse_shard', 'weight', 'longest_first', 'select', 'write_results', 'read_results',
+    'read_durations', 'merge_results', ]
+
+RESULTS_VERSION = 1
+
+# estimated seconds, used when a test has no known duration
+TEST_COST = 5.0
+STEP_COST = 0.5
+SCREENSHOT_COST = 2.0
+
+_STATES = dict((str(state), state) for state in (states.OK, states.FAIL, states.ERROR))
+
+
+def parse_shard(shard):
+    """
+    Parse a shard given as 'I/N', or as a tuple `(I, N)`, to a tuple of
+    integers where 1 <= I <= N.
+    """
+    try:
+        if isinstance(shard, basestring):
+            index, count = [int(x) for x in shard.split('/')]
+        else:
+            index, count = [int(x) for x in shard]
+    except (ValueError, TypeError):
+        raise ValueError('Invalid shard %r; expected I/N, e.g., 2/4' % (shard, ))
+    if not 1 <= index <= count:
+        raise ValueError('Invalid shard %r; I must be between 1 and N' % (shard, ))
+    return (index, count)
+
+
+def weight(test, durations=None, name=None):
+    """
+    Expected duration in seconds of `test`, named `name`: its duration in
+    `durations`, a dictionary of test name to seconds, if known, or
+    otherwise an estimate from its count of steps and screenshots. A
+    :class:`gossamer.data.RecordedTest` is only loaded for the estimate.
+    """
+    if name is None:
+        name = test.name if isinstance(test, RecordedTest) else test.settings.name
+    if durations and name in durations:
+        return float(durations[name])
+    steps = test.steps or []
+    screenshots = sum(1 for step in steps if isinstance(step, Screenshot))
+    return TEST_COST + STEP_COST * (len(steps) - screenshots) + \
+        SCREENSHOT_COST * screenshots
+
+
+def longest_first(items, cost):
+    """
+    Reorder the list `items` in place, longest first by `cost`, a function
+    of an item returning its expected seconds, e.g., by :func:`.weight`, or
+    None to leave it where it is. Others of the same cost keep their order.
+    """
+    costs = [cost(item) for item in items]
+    places = [index for index, value in enumerate(costs) if value is not None]
+    ordered = iter(sorted(places, key=lambda index: -costs[index]))
+    items[:] = [
+        items[next(ordered)] if value is not None else item
+        for item, value in zip(items, costs)
+    ]
+    return items
+
+
+def select(tests, shard, durations=None):
+    """
+    Of the dictionary `tests`, return those in `shard`, as parsed by
+    :func:`.parse_shard`.
+
+    Tests are taken longest first, by :func:`.weight` and then by name, and
+    each is given to the shard with the least expected duration so far.
+    """
+    index, count = parse_shard(shard)
+    loads = [0.0] * count
+    ret = {}
+    weights = sorted(
+        (-weight(test, durations, name), name) for name, test in tests.items()
+    )
+    for negative, name in weights:
+        least = loads.index(min(loads))
+        loads[least] -= negative
+        if least == index - 1:
+            ret[name] = tests[name]
+    return ret
+
+
+def write_results(filename, results, durations=None, shard=None):
+    """
+    Write `results`, a dictionary of test name to `(state, err)`, to the
+    JSON file `filename`, with durations in seconds if known.
+    """
+    durations = durations or {}
+    output = {
+        'version': RESULTS_VERSION,
+        'shard': list(parse_shard(shard)) if shard else None,
+        'tests': dict(
+            (name, {
+                'state': str(state),
+                'error': str(err) if err is not None else None,
+                'duration': durations.get(name),
+            }) for name, (state, err) in results.items()
+        ),
+    }
+    directory = os.path.dirname(filename)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(filename, 'w') as fp:
+        fp.write(json.dumps(output, indent=2, sort_keys=True))
+    return True
+
+
+def read_results(filename):
+    """
+    Read a results file written by :func:`.write_results`, returning a
+    dictionary with the results' `shard`, and `tests`, a dictionary of test
+    name to a dictionary of `state`, `error`, and `duration`.
+    """
+    try:
+        with open(filename, 'r') as fp:
+            results = json.loads(fp.read())
+    except (IOError, ValueError):
+        raise ValueError('Could not read results from %s' % filename)
+    if results.get('version') != RESULTS_VERSION:
+        raise ValueError('Unknown results version in %s' % filename)
+    for result in results['tests'].values():
+        result['state'] = _STATES[result['state']]
+    return results
+
+
+def read_durations(filename):
+    """
+    Dictionary of test name to duration in seconds from a results file.
+    """
+    return dict(
+        (name, result['duration'])
+        for name, result in read_results(filename)['tests'].items()
+        if result['duration'] is not None
+    )
+
+
+def merge_results(filenames):
+    """
+    Combine the results files `filenames` of a sharded run. Returns a
+    tuple of a dictionary of test name to `(state, err)`, where `err` is
+    the error's message; a dictionary of test name to duration; and a list
+    of the shard numbers that are missing.
+    """
+    results = {}
+    durations = {}
+    seen = set()
+    count = None
+    for filename in filenames:
+        read = read_results(filename)
+        if read['shard']:
+            index, count = read['shard']
+            seen.add(index)
+        for name, result in read['tests'].items():
+            results[name] = (result['state'], result['error'])
+            if result['duration'] is not None:
+                durations[name] = result['duration']
+    missing = [i for i in range(1, count + 1) if i not in seen] if count else []
+    return (results, durations, missing)
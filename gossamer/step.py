@@ -11,19 +11,31 @@ import os
 import time
 
 from collections import namedtuple
-from selenium.webdriver.support import ui
 
 from gossamer.constant import modes
-from gossamer.exc import ScreenshotsDiffer
-from gossamer.image import images_identical, image_diff, allowance
-from gossamer import util
+from gossamer.exc import ScreenshotsDiffer, EmptyScreenshot
+from gossamer.image import images_identical, image_diff, allowance, crop
+from gossamer import fingerprint, js, util
 
+# changed elements' boxes listed when a screenshot differs
+CHANGED_BOXES = 10
+
+# errors of drivers lacking a command
+UNSUPPORTED = ('unknown command', 'unknown method', 'unsupported', 'not implemented')
 
 class TestStep(object): # pylint: disable=R0903
     """
     Base class of test actions, not useful in itself.
+
+    Steps have `__slots__` rather than a `__dict__`, as a record can hold
+    very many of them; `fields` lists the attributes serialized, and
+    `optional` those of them serialized only when not None.
     """
 
+    __slots__ = ('offset_time', )
+    fields = ('offset_time', )
+    optional = ()
+
     def __init__(self, offset_time):
         self.offset_time = offset_time
 
@@ -40,7 +52,12 @@ class TestStep(object): # pylint: disable=R0903
         raise NotImplementedError
 
     def __json__(self):
-        return {self.__class__.__name__: self.__dict__}
+        return {
+            self.__class__.__name__: dict(
+                (field, getattr(self, field)) for field in self.fields
+                if field not in self.optional or getattr(self, field) is not None
+            )
+        }
 
 
 class FindElementMixin(object): # pylint: disable=R0903
@@ -48,6 +65,8 @@ class FindElementMixin(object): # pylint: disable=R0903
     driver method lookup for identifier_type.
     """
 
+    __slots__ = ()
+
     _find_element_funcs = {
         'id': 'find_element_by_id',
         'classname': 'find_element_by_class_name',
@@ -57,52 +76,42 @@ class FindElementMixin(object): # pylint: disable=R0903
 
 class ElementIdentifierMixin(object): # pylint: disable=R0903
     """
-    For steps that need to identify elements and their values.
+    For steps that need to identify elements and their values. Subclasses
+    have slots for `identifier`, `identifier_type`, and `value`.
     """
-    identifier = None
-    identifier_type = None
-    value = None
-
-    eid = None
-    ecn = None
-    ecl = None
-    eid_val = None
-    ecn_val = None
-    ecl_val = None
-
-    def _process_identifiers_and_values(self):
+
+    __slots__ = ()
+
+    def _process_identifiers_and_values(self, eid, ecn, ecl, eid_val, ecn_val, ecl_val): # pylint: disable=R0913
         """
         Resolve element data to `identifier`, `identifier_type`, and
         `value`.
         """
-        # element.id
-        self.eid = self.eid if self.eid and len(self.eid) > 0 else None
-        # element.className
-        self.ecn = self.ecn if self.ecn and len(self.ecn) > 0 else None
-        # element.classList
-        self.ecl = '.%s' % '. '.join(self.ecl) if self.ecl and len(self.ecl) > 0 else None
-
-        if not (self.eid or self.ecn or self.ecl):
-            raise ValueError()
-        if self.eid:
-            self.identifier = self.eid
-            self.identifier_type = 'id'
-            self.value = self.eid_val
-        elif self.ecl:
-            self.identifier = self.ecl
-            self.identifier_type = 'classlist'
-            self.value = self.ecl_val
-        elif self.ecn:
-            self.identifier = self.ecn
-            self.identifier_type = 'classname'
-            self.value = self.ecn_val
-
-        del self.eid
-        del self.ecn
-        del self.ecl
-        del self.eid_val
-        del self.ecn_val
-        del self.ecl_val
+        self.identifier_type, self.identifier, self.value = resolve_identifier( # pylint: disable=W0201
+            eid, ecn, ecl, eid_val, ecn_val, ecl_val
+        )
+
+
+def resolve_identifier(eid, ecn, ecl, eid_val=None, ecn_val=None, ecl_val=None): # pylint: disable=R0913
+    """
+    Resolve element data as captured in the page to a tuple of
+    `(identifier_type, identifier, value)`, preferring the element's id,
+    then its classList, then its className.
+    """
+    # element.id
+    eid = eid if eid and len(eid) > 0 else None
+    # element.className
+    ecn = ecn if ecn and len(ecn) > 0 else None
+    # element.classList
+    ecl = '.%s' % '. '.join(ecl) if ecl and len(ecl) > 0 else None
+
+    if eid:
+        return ('id', eid, eid_val)
+    elif ecl:
+        return ('classlist', ecl, ecl_val)
+    elif ecn:
+        return ('classname', ecn, ecn_val)
+    raise ValueError()
 
 
 class Navigate(TestStep): # pylint: disable=R0903
@@ -111,6 +120,9 @@ class Navigate(TestStep): # pylint: disable=R0903
     """
     playback = True
 
+    __slots__ = ('url', )
+    fields = TestStep.fields + __slots__
+
     def __init__(self, offset_time, url):
         super(Navigate, self).__init__(offset_time)
         self.url = url
@@ -132,6 +144,9 @@ class Click(TestStep): # pylint: disable=R0903
 
     playback = True
 
+    __slots__ = ('pos', )
+    fields = TestStep.fields + __slots__
+
     def __init__(self, offset_time, pos):
         super(Click, self).__init__(offset_time)
         self.pos = pos
@@ -151,8 +166,11 @@ class Dropdown(TestStep, FindElementMixin, ElementIdentifierMixin): # pylint: di
 
     playback = True
 
+    __slots__ = ('pos', 'identifier', 'identifier_type', 'value')
+    fields = TestStep.fields + __slots__
+
     def __init__(self, offset_time, pos=None,
-        eid=[None, None], ecn=[None, None], ecl=[None, None],
+        eid=(None, None), ecn=(None, None), ecl=(None, None),
         identifier=None, identifier_type=None, value=None
         ): # pylint: disable=R0913
         super(Dropdown, self).__init__(offset_time)
@@ -162,31 +180,34 @@ class Dropdown(TestStep, FindElementMixin, ElementIdentifierMixin): # pylint: di
         self.identifier_type = identifier_type
         self.value = value
 
-        self.eid = eid[0]
-        self.eid_val = eid[1]
-        self.ecn = ecn[0]
-        self.ecn_val = ecn[1]
-        self.ecl = ecl[0]
-        self.ecl_val = ecl[1]
-
         # this is because we don't use a separate step for a processed
         # Dropdown. todo.
         if not (identifier and identifier_type and value):
-            self._process_identifiers_and_values()
+            self._process_identifiers_and_values(
+                eid[0], ecn[0], ecl[0], eid[1], ecn[1], ecl[1]
+            )
 
     def execute(self, driver, settings, mode):
         util.log.debug(
             "Selecting '%s' into '%s' by %s",
             self.value, self.identifier, self.identifier_type
         )
-        ui.Select(
-            getattr(driver, self._find_element_funcs[self.identifier_type])(self.identifier)
-        ).select_by_visible_text(self.value)
+        element = getattr(driver, self._find_element_funcs[self.identifier_type])(
+            self.identifier
+        )
+        if hasattr(element, 'select_by_visible_text'): # gossamer.w3c.Element
+            element.select_by_visible_text(self.value)
+        else:
+            from selenium.webdriver.support import ui
+            ui.Select(element).select_by_visible_text(self.value)
 
 
 KeyParams = namedtuple('KeyParams', ['key', 'shift', 'eid', 'ecn', 'ecl'])
 
 
+TextParams = namedtuple('TextParams', ['eid', 'ecn', 'ecl'])
+
+
 class Key(TestStep, FindElementMixin, ElementIdentifierMixin): # pylint: disable=R0903,R0902,W0223
     """
     Typing action by the user.
@@ -194,24 +215,17 @@ class Key(TestStep, FindElementMixin, ElementIdentifierMixin): # pylint: disable
 
     playback = False
 
+    __slots__ = ('key', 'shift', 'identifier', 'identifier_type', 'value')
+    fields = TestStep.fields + __slots__
+
     def __init__(self, offset_time, key, shift=None,
         eid=None, ecn=None, ecl=None, eid_val=None, ecn_val=None, ecl_val=None
         ): # pylint: disable=R0913
         super(Key, self).__init__(offset_time)
         self.key = key
         self.shift = shift
-        self.identifier = None
-        self.identifier_type = None
-        self.value = None
-
-        self.eid = eid
-        self.ecn = ecn
-        self.ecl = ecl
-        self.eid_val = eid_val
-        self.ecn_val = ecn_val
-        self.ecl_val = ecl_val
 
-        self._process_identifiers_and_values()
+        self._process_identifiers_and_values(eid, ecn, ecl, eid_val, ecn_val, ecl_val)
 
 
 class Text(TestStep, FindElementMixin): # pylint: disable=R0903
@@ -221,6 +235,9 @@ class Text(TestStep, FindElementMixin): # pylint: disable=R0903
 
     playback = True
 
+    __slots__ = ('identifier', 'identifier_type', 'value')
+    fields = TestStep.fields + __slots__
+
     def __init__(self, offset_time, identifier, identifier_type, value):
         super(Text, self).__init__(offset_time)
         self.identifier = identifier
@@ -242,16 +259,31 @@ class Text(TestStep, FindElementMixin): # pylint: disable=R0903
             (self.identifier).send_keys(self.value)
 
 
-class Screenshot(TestStep):
+class Screenshot(TestStep, FindElementMixin):
     """
-    Screenshot taken by the user.
+    Screenshot taken by the user: of the viewport, or clipped to the
+    element found by `identifier` and `identifier_type`, or to the
+    `region` `[x, y, width, height]` of the viewport in CSS pixels. An
+    element's screenshot is taken by `method`: 'element', the driver's own,
+    or 'crop', cropped from the viewport's.
     """
 
     playback = True
 
-    def __init__(self, offset_time, num):
+    __slots__ = ('num', 'identifier', 'identifier_type', 'region', 'method')
+    fields = TestStep.fields + __slots__
+    optional = ('identifier', 'identifier_type', 'region', 'method')
+
+    def __init__(
+            self, offset_time, num, identifier=None, identifier_type=None, region=None,
+            method=None
+        ): # pylint: disable=R0913
         super(Screenshot, self).__init__(offset_time)
         self.num = num
+        self.identifier = identifier
+        self.identifier_type = identifier_type
+        self.region = region
+        self.method = method
 
     def delayer(self, driver):
         """
@@ -265,26 +297,180 @@ class Screenshot(TestStep):
         """
         return os.path.join(settings.path, 'screenshot' + str(self.num) + '.png')
 
-    def execute(self, driver, settings, mode):
+    def get_last_path(self, settings):
+        """
+        Path to the screenshot taken in the last playback.
+        """
+        return os.path.join(settings.path, 'last', 'screenshot%s.png' % self.num)
+
+    def get_fingerprint_path(self, settings, last=False):
+        """
+        Path to the page's fingerprint with the screenshot, or with the
+        last playback's if `last`.
+        """
+        path = self.get_last_path(settings) if last else self.get_path(settings)
+        return path[:-len('.png')] + '.fingerprint.json'
+
+    def capture(self, driver, settings, mode, executor=None):
+        """
+        Save the screenshot: as the original when recording, and otherwise
+        as the last run's for :meth:`.compare`. With `settings.fingerprint`,
+        the page's fingerprint is saved with it. Given an `executor`, the
+        screenshot is cropped and written on it, and its
+        :class:`gossamer.pool.Future` returned.
+        """
         util.log.debug("Taking screenshot %s", self.num)
-        original = self.get_path(settings)
-        new = os.path.join(settings.path, 'last', 'screenshot%s.png' % self.num)
-        if mode in (modes.RECORD, modes.RERECORD):
-            driver.save_screenshot(original)
+        last = mode not in (modes.RECORD, modes.RERECORD)
+        path = self.get_last_path(settings) if last else self.get_path(settings)
+        future = None
+        if executor is None and not (self.identifier or self.region):
+            driver.save_screenshot(path)
         else:
-            driver.save_screenshot(new)
-            if not images_identical(original, new, allowance(settings.browser)):
-                if settings.save_diff:
-                    diffpath = os.path.join(settings.path, 'diff.png')
-                    diff = image_diff(original, new, diffpath, settings.diffcolor)
-                    raise ScreenshotsDiffer(
-                        'Screenshot %s was different; compare %s with %s. See %s '
-                        'for the comparison. diff=%r' % (
-                            self.num, original, new, diffpath, diff
-                        )
-                    )
+            png, box = self._grab(driver, mode)
+            if executor is None:
+                _write_png(path, png, box)
+            else:
+                future = executor.submit(_write_png, path, png, box)
+        if settings.fingerprint:
+            fingerprint.capture(driver, self.get_fingerprint_path(settings, last))
+        return future
+
+    def _grab(self, driver, mode):
+        """
+        PNG bytes of the screenshot, and the box to crop them to, if any.
+        When recording, an element's screenshot is its own if the driver
+        takes them, and otherwise cropped from the viewport's, like a
+        region's; `method` keeps which, for playback to take it the same way.
+        """
+        if not (self.identifier or self.region):
+            return (driver.get_screenshot_as_png(), None)
+        args = ()
+        if self.identifier:
+            element = getattr(driver, self._find_element_funcs[self.identifier_type])(
+                self.identifier
+            )
+            state = util.session_state(driver)
+            if self.method == 'element' or \
+                    (self.method is None and state.get('element_screenshots', True)):
+                try:
+                    png = element.screenshot_as_png
+                except Exception as exception: # pylint: disable=W0703
+                    if self.method == 'element' or not _unsupported(exception):
+                        raise
+                    util.log.debug('Cropping; no element screenshots: %s', exception)
+                    state['element_screenshots'] = False
                 else:
-                    raise ScreenshotsDiffer('Screenshot %s was different.' % self.num)
+                    if mode == modes.RECORD:
+                        self.method = 'element'
+                    return (png, None)
+            if mode == modes.RECORD:
+                self.method = 'crop'
+            args = (element, )
+        left, top, width, height, ratio = driver.execute_script(js.client_rect, *args)
+        if self.region:
+            left, top, width, height = self.region
+        if width <= 0 or height <= 0:
+            raise EmptyScreenshot('Screenshot %s of %s is empty: %sx%s' % (
+                self.num, self.identifier or self.region, width, height
+            ))
+        return (driver.get_screenshot_as_png(), (
+            left * ratio, top * ratio, (left + width) * ratio, (top + height) * ratio
+        ))
+
+    def compare(self, settings):
+        """
+        Whether the last run's screenshot matches the original: without
+        comparing pixels if their fingerprints match.
+        """
+        if settings.fingerprint and fingerprint.matches(
+                fingerprint.read(self.get_fingerprint_path(settings)),
+                fingerprint.read(self.get_fingerprint_path(settings, last=True))):
+            util.log.debug('Screenshot %s: fingerprints match', self.num)
+            return True
+        return images_identical(
+            self.get_path(settings), self.get_last_path(settings),
+            allowance(settings.browser)
+        )
+
+    def fail(self, settings):
+        """
+        Raise :class:`.ScreenshotsDiffer` for a screenshot that failed
+        :meth:`.compare`, saving a diff if requested.
+        """
+        original = self.get_path(settings)
+        new = self.get_last_path(settings)
+        changed = ''
+        if settings.fingerprint:
+            boxes = fingerprint.changed(
+                fingerprint.read(self.get_fingerprint_path(settings)),
+                fingerprint.read(self.get_fingerprint_path(settings, last=True))
+            )
+            if boxes:
+                changed = ' Changed elements (x, y, width, height): %s%s.' % (
+                    ', '.join('%r' % (box, ) for box in boxes[:CHANGED_BOXES]),
+                    ' and %d more' % (len(boxes) - CHANGED_BOXES)
+                        if len(boxes) > CHANGED_BOXES else ''
+                )
+        if settings.save_diff:
+            diffpath = os.path.join(settings.path, 'diff.png')
+            diff = image_diff(original, new, diffpath, settings.diffcolor)
+            raise ScreenshotsDiffer(
+                'Screenshot %s was different; compare %s with %s. See %s '
+                'for the comparison. diff=%r%s' % (
+                    self.num, original, new, diffpath, diff, changed
+                ), self.num
+            )
+        else:
+            raise ScreenshotsDiffer(
+                'Screenshot %s was different.%s' % (self.num, changed), self.num
+            )
+
+    def execute(self, driver, settings, mode):
+        self.capture(driver, settings, mode)
+        if mode not in (modes.RECORD, modes.RERECORD) and not self.compare(settings):
+            self.fail(settings)
+
+
+def screenshot_target(text):
+    """
+    Keyword arguments of a :class:`.Screenshot` of what `text` names: an
+    element as `#id` or `.class.list`, or a region as `x,y,width,height`,
+    or the viewport if `text` is empty. Raises ValueError otherwise.
+    """
+    text = text.strip()
+    if not text:
+        return {}
+    if text.startswith('#') and len(text) > 1:
+        return {'identifier_type': 'id', 'identifier': text[1:]}
+    if text.startswith('.') and len(text) > 1:
+        return {'identifier_type': 'classlist', 'identifier': text}
+    try:
+        region = [int(value) for value in text.split(',')]
+    except ValueError:
+        region = None
+    if region is None or len(region) != 4 or min(region) < 0 or 0 in region[2:]:
+        raise ValueError('Expected #id, .class or x,y,width,height, not %r' % text)
+    return {'region': region}
+
+
+def _unsupported(exception):
+    """
+    Whether `exception` is a driver's refusal of a command it lacks.
+    """
+    if isinstance(exception, (AttributeError, NotImplementedError)):
+        return True
+    message = str(getattr(exception, 'msg', None) or exception).lower()
+    return any(text in message for text in UNSUPPORTED)
+
+
+def _write_png(path, png, box=None):
+    """
+    Write the PNG bytes `png`, cropped to `box` if given, to `path`.
+    """
+    if box is not None:
+        png = crop(png, box)
+    with open(path, 'wb') as fp:
+        fp.write(png)
 
 
 class Scroll(TestStep): # pylint: disable=R0903
@@ -294,6 +480,9 @@ class Scroll(TestStep): # pylint: disable=R0903
 
     playback = True
 
+    __slots__ = ('pos', )
+    fields = TestStep.fields + __slots__
+
     def __init__(self, offset_time, pos):
         super(Scroll, self).__init__(offset_time)
         self.pos = pos
@@ -0,0 +1,235 @@
+"""
+Trace runs as Chrome trace events, for viewing in Perfetto or
+about:tracing.
+
+While a :class:`.Tracer` is started, tests, steps, the waits before them,
+WebDriver commands and screenshot comparisons are recorded as spans on the
+thread they ran on, and the process's memory as a counter at the start and
+end of each test. Spans are cheap no-ops when no tracer is started.
+"""
+
+# Copyright (c) 2013 contributors; see AUTHORS.
+# Licensed under the Apache License, Version 2.0
+# https://www.apache.org/licenses/LICENSE-2.0
+
+import json
+import os
+import threading
+import time
+
+__all__ = ['Tracer', 'start', 'stop', 'span', 'complete', 'memory', 'instrument', ]
+
+_tracer = None
+
+
+class _Span(object):
+    """
+    A span recorded by a :class:`.Tracer` when it ends.
+    """
+
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'started')
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        args = self.args
+        if exc_type is not None:
+            args = dict(args or {}, error=exc_type.__name__)
+        self.tracer.complete(self.name, self.cat, self.started, time.time(), args)
+        return False
+
+
+class _NullSpan(object):
+    """
+    A span when no tracer is started.
+    """
+
+    __slots__ = ()
+
+    # arguments set on a span are dropped
+    args = property(lambda self: None, lambda self, value: None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer(object):
+    """
+    Trace events of this process. With `memory`, its memory is counted by
+    `tracemalloc` where that is available, and otherwise by its peak
+    resident size.
+    """
+
+    def __init__(self, memory=False):
+        self.pid = os.getpid()
+        self.memory = memory
+        self.started = time.time()
+        self._events = []
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._tracemalloc = None
+        if memory:
+            try:
+                import tracemalloc # pylint: disable=F0401
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                self._tracemalloc = tracemalloc
+            except ImportError:
+                pass
+
+    def _tid(self):
+        """
+        Small number for the current thread, named on first use.
+        """
+        thread = threading.current_thread()
+        tid = self._threads.get(thread.ident)
+        if tid is None:
+            with self._lock:
+                tid = self._threads[thread.ident] = len(self._threads) + 1
+                self._events.append({
+                    'ph': 'M', 'name': 'thread_name', 'pid': self.pid, 'tid': tid,
+                    'args': {'name': thread.name},
+                })
+        return tid
+
+    def _ts(self, when):
+        """
+        Microseconds since the tracer started.
+        """
+        return int((when - self.started) * 1000000)
+
+    def span(self, name, cat, args=None):
+        """
+        Context manager recording a span named `name` in category `cat`.
+        """
+        return _Span(self, name, cat, args)
+
+    def complete(self, name, cat, started, ended, args=None): # pylint: disable=R0913
+        """
+        Record a span from `started` to `ended`, by `time.time()`.
+        """
+        event = {
+            'ph': 'X', 'name': name, 'cat': cat, 'pid': self.pid, 'tid': self._tid(),
+            'ts': self._ts(started), 'dur': self._ts(ended) - self._ts(started),
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self._events.append(event)
+
+    def counter(self, name, values):
+        """
+        Record counters, a dictionary of series to numbers, named `name`.
+        """
+        with self._lock:
+            self._events.append({
+                'ph': 'C', 'name': name, 'pid': self.pid, 'tid': 0,
+                'ts': self._ts(time.time()), 'args': values,
+            })
+
+    def memory_usage(self):
+        """
+        Record the process's memory, if counting memory.
+        """
+        if not self.memory:
+            return
+        if self._tracemalloc is not None:
+            current, peak = self._tracemalloc.get_traced_memory()
+            self.counter('memory', {'current': current, 'peak': peak})
+            return
+        import resource
+        self.counter('memory', {
+            'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        })
+
+    def events(self):
+        """
+        List of the events so far.
+        """
+        with self._lock:
+            return list(self._events)
+
+    def write(self, filename):
+        """
+        Write the trace to the JSON file `filename`.
+        """
+        with open(filename, 'w') as fp:
+            fp.write(json.dumps({
+                'traceEvents': self.events(), 'displayTimeUnit': 'ms',
+            }))
+
+
+def start(memory=False):
+    """
+    Start tracing, returning the :class:`.Tracer`.
+    """
+    global _tracer # pylint: disable=W0603
+    _tracer = Tracer(memory)
+    return _tracer
+
+
+def stop():
+    """
+    Stop tracing, returning the :class:`.Tracer`, if one was started.
+    """
+    global _tracer # pylint: disable=W0603
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def span(name, cat, args=None):
+    """
+    Context manager recording a span on the started tracer, if any.
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, cat, args)
+
+
+def complete(name, cat, started, ended, args=None):
+    """
+    Record a span from `started` to `ended` on the started tracer, if any.
+    """
+    if _tracer is not None:
+        _tracer.complete(name, cat, started, ended, args)
+
+
+def memory():
+    """
+    Record the process's memory on the started tracer, if any.
+    """
+    if _tracer is not None:
+        _tracer.memory_usage()
+
+
+def instrument(driver):
+    """
+    Trace each command of a Selenium WebDriver `driver`, if tracing.
+    """
+    if _tracer is None or not hasattr(driver, 'execute'):
+        return driver
+    execute = driver.execute
+
+    def traced(command, params=None):
+        """
+        Selenium's `execute` in a span.
+        """
+        with span(command, 'webdriver'):
+            return execute(command, params)
+
+    driver.execute = traced
+    return driver
@@ -9,14 +9,16 @@ Utilities.
 import os
 import sys
 import json
+import cPickle
+import hashlib
+import functools
 import operator
+import struct
+import threading
 import ConfigParser
-from selenium.common.exceptions import WebDriverException
-import urllib2
 
-from selenium import webdriver  # pylint: disable=F0401
-
-from gossamer import exc
+from gossamer import exc, packed, trace
+from gossamer.catalog import Catalog
 
 from gossamer.constant import modes,  DEFAULT_DIFFCOLOR, \
     DEFAULT_WEBDRIVER, DATA_VERSION
@@ -34,6 +36,9 @@ def logger(name, level=None):
 # level can be overriden to DEBUG in CLI with -v
 log = logger(__name__, 'INFO')
 
+# increment when pickled steps or data change, invalidating cached runs
+CACHE_VERSION = 2
+
 
 def stdout_writer(content=None, flush=False):
     """
@@ -53,6 +58,53 @@ def null_writer(content=None, flush=False): # pylint: disable=W0613
     pass
 
 
+class SynchronizedWriter(object): # pylint: disable=R0903
+    """
+    Wrap a writer such as :func:`.stdout_writer` so that concurrent tests
+    each write their output as one contiguous chunk.
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self._lock = threading.Lock()
+
+    def buffer(self):
+        """
+        A writer for a single test; its output is written on
+        :meth:`BufferedWriter.commit`.
+        """
+        return BufferedWriter(self)
+
+    def write(self, content):
+        """
+        Write a chunk of content at once.
+        """
+        with self._lock:
+            self.output(content, flush=True)
+
+
+class BufferedWriter(object):
+    """
+    Writer collecting a single test's output for a :class:`.SynchronizedWriter`.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self._chunks = []
+
+    def __call__(self, content=None, flush=False): # pylint: disable=W0613
+        if content:
+            self._chunks.append(content)
+
+    def commit(self):
+        """
+        Write everything collected so far.
+        """
+        if self._chunks:
+            self.writer.write(''.join(self._chunks))
+            self._chunks = []
+
+
 class Encoder(json.JSONEncoder):
     """
     Overriden JSON encoder for calling __json__.
@@ -67,19 +119,25 @@ class Encoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
+def import_step(each):
+    """
+    Deserialize a step, as serialized by its `__json__`.
+    """
+    from gossamer.data import Point
+    from gossamer import step
+    key, val = each.items()[0]
+    if val.get('pos') is not None:
+        val['pos'] = Point(**val['pos'])
+    return getattr(step, key)(**val)
+
+
 def _import_run_v1(rec):
     """
     Deserialize for Test.version == 1
     """
-    from gossamer.data import Test, Settings, Point
-    from gossamer import step
+    from gossamer.data import Test, Settings
     mode_trans = {1: modes.RECORD, 2: modes.RERECORD, 3: modes.PLAYBACK}
-    steps = []
-    for each in rec['steps']:
-        key, val = each.items()[0]
-        if 'pos' in val:
-            val['pos'] = Point(**val['pos'])
-        steps.append(getattr(step, key)(**val))
+    steps = [import_step(each) for each in rec['steps']]
     for key, val in rec['settings'].items():
         if key == 'mode':
             rec['settings'][key] = mode_trans[val]
@@ -106,95 +164,264 @@ def import_recorded_run(inc):
         raise NotImplementedError()
 
 
-def read_recorded_run(filename):
+def check_recorded_run(filename):
     """
-    Load a serialized run.
+    Ensure a serialized run exists and is not empty, returning its
+    `os.stat` result.
     """
     try:
-        if os.path.getsize(filename) <= 0:
-            raise exc.RecordedRunEmpty('%s is empty' % filename)
+        stat = os.stat(filename)
     except OSError:
         raise exc.RecordedRunDoesNotExist('%s does not exist' % filename)
-    with open(filename, 'r') as fp:
+    if stat.st_size <= 0:
+        raise exc.RecordedRunEmpty('%s is empty' % filename)
+    return stat
+
+
+def read_recorded_run(filename, cache=True):
+    """
+    Load a serialized run.
+
+    With `cache`, the loaded run is pickled into the user's cache directory,
+    and the pickle is used instead while the run's modification time and size
+    are unchanged.
+    """
+    stat = check_recorded_run(filename)
+    key = (
+        CACHE_VERSION, DATA_VERSION, os.path.abspath(filename),
+        stat.st_mtime, stat.st_size
+    )
+    if cache:
+        test = _read_cache(_cache_path(filename), key)
+        if test is not None:
+            return test
+    with open(filename, 'rb') as fp:
+        data = fp.read()
+    if packed.is_packed(data):
         try:
-            rec = json.loads(fp.read())
+            test = packed.loads(data)
+        except (struct.error, ValueError, TypeError, IndexError, KeyError,
+                AttributeError, StopIteration, # truncated or corrupt
+                NotImplementedError): # from a later version of gossamer
+            raise exc.CouldNotParseRecordedRun('Could not parse %s' % filename)
+    else:
+        try:
+            rec = json.loads(data)
         except ValueError: # couldn't parse
             raise exc.CouldNotParseRecordedRun('Could not parse %s' % filename)
-    return import_recorded_run(rec)
+        test = import_recorded_run(rec)
+    if cache:
+        _write_cache(_cache_path(filename), key, test)
+    return test
 
 
-def write_recorded_run(filename, output):
+def _cache_path(filename):
+    """
+    Path to the cache of a serialized run, keyed by its absolute path.
+
+    The cache is kept out of the recorded data, which is usually committed,
+    so that a pickle is never loaded from a checkout.
     """
-    Serialize a recorded run to a JSON file.
+    directory = os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache')),
+        'gossamer'
+    )
+    digest = hashlib.sha1(os.path.abspath(filename)).hexdigest()
+    return os.path.join(directory, '%s.pickle' % digest)
+
+
+def _read_cache(filename, key):
+    """
+    A cached run, if there is one for `key`.
+    """
+    try:
+        with open(filename, 'rb') as fp:
+            if cPickle.load(fp) != key:
+                return None
+            return cPickle.load(fp)
+    except Exception: # pylint: disable=W0703
+        # missing, stale or from another version of gossamer
+        return None
+
+
+def _write_cache(filename, key, test):
+    """
+    Cache a run for `key`, if possible.
+    """
+    temporary = '%s.%d' % (filename, os.getpid())
+    try:
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(temporary, 'wb') as fp:
+            cPickle.dump(key, fp, cPickle.HIGHEST_PROTOCOL)
+            cPickle.dump(test, fp, cPickle.HIGHEST_PROTOCOL)
+        os.rename(temporary, filename)
+    except (IOError, OSError, cPickle.PicklingError) as exception:
+        log.debug('_write_cache: %s', exception)
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+
+
+def _load_recorded_test(filename, path, rewrite_url=None):
+    """
+    Load the serialized run of a test in the directory `path`.
+    """
+    test = read_recorded_run(filename)
+    test.settings.path = path
+    if rewrite_url:
+        test.settings.url = rewrite_url(test.settings.url)
+    return test
+
+
+def record_path(directory):
+    """
+    Path to the serialized run in a test's `directory`: its
+    :data:`gossamer.packed.FILENAME` if it has one, and otherwise its
+    record.json.
+    """
+    filename = os.path.join(directory, packed.FILENAME)
+    if os.path.exists(filename):
+        return filename
+    return os.path.join(directory, 'record.json')
+
+
+def write_recorded_run(filename, output, binary=None):
+    """
+    Serialize a recorded run to a JSON file, or, with `binary`, in the
+    format of :mod:`gossamer.packed`. By default, a run is written in the
+    format it already has.
     """
     from gossamer.data import Test
     if not isinstance(output, Test):
         raise ValueError()
+    if binary is None:
+        binary = os.path.exists(os.path.join(filename, packed.FILENAME))
     try:
-        with open(os.path.join(filename, 'record.json'), 'w') as fp:
-            fp.write(json.dumps(output, cls=Encoder))
+        if binary:
+            with open(os.path.join(filename, packed.FILENAME), 'wb') as fp:
+                fp.write(packed.dumps(output))
+        else:
+            with open(os.path.join(filename, 'record.json'), 'w') as fp:
+                fp.write(json.dumps(output, cls=Encoder))
     except Exception as exception: # todo
         raise exception
     return True
 
 
-DRIVERS = {
-    'firefox': webdriver.Firefox,
-    'chrome': webdriver.Chrome,
-    'ie': webdriver.Ie,
-    'opera': webdriver.Opera
-}
+def convert_recorded_run(directory, binary):
+    """
+    Rewrite the serialized run in a test's `directory` in the other format,
+    removing the original. Returns the new path.
+    """
+    original = record_path(directory)
+    write_recorded_run(directory, read_recorded_run(original, cache=False), binary)
+    converted = os.path.join(directory, packed.FILENAME if binary else 'record.json')
+    if converted != original:
+        os.remove(original)
+    return converted
+
 
+# names of webdriver.DesiredCapabilities by browser; selenium.webdriver is
+# imported only when a driver is needed
 CAPABILITIES = {
-    'firefox': webdriver.DesiredCapabilities.FIREFOX,
-    'chrome': webdriver.DesiredCapabilities.CHROME,
-    'ie': webdriver.DesiredCapabilities.INTERNETEXPLORER,
-    'opera': webdriver.DesiredCapabilities.OPERA
+    'firefox': 'FIREFOX',
+    'chrome': 'CHROME',
+    'ie': 'INTERNETEXPLORER',
+    'opera': 'OPERA'
 }
 
+# W3C browserName by browser
+BROWSER_NAMES = {
+    'firefox': 'firefox',
+    'chrome': 'chrome',
+    'ie': 'internet explorer',
+    'opera': 'opera'
+}
+
+# WebDriver clients: Selenium's, or gossamer.w3c
+CLIENTS = ('selenium', 'w3c')
+
+# seconds to wait for check_driver
+CHECK_TIMEOUT = 10
+
 
 def check_driver(url):
     """
     For a Selenium Server URL, see if the server appears to be up.
     """
+    import urllib2
     try:
-        code = urllib2.urlopen(url).getcode()
+        code = urllib2.urlopen(url, timeout=CHECK_TIMEOUT).getcode()
     except Exception: # pylint: disable=W0703
         code = 500
     return code in (200, 301, 302)
 
 
-def get_driver(browser, selenium=None):
+def get_driver(browser, selenium=None, client=None):
     """
     Get a webdriver. The caller is responsible for closing the driver.
 
     Browser is required. Local and remote are optional, with remote
-    taking precedence.
+    taking precedence. `client` is one of :data:`.CLIENTS`, by default
+    Selenium's.
     """
+    import urllib2
+    from selenium.common.exceptions import WebDriverException
     driver_url = selenium or DEFAULT_WEBDRIVER
-    try:
-        driver = webdriver.Remote(driver_url, CAPABILITIES[browser])
-    except KeyError:
+    if browser not in CAPABILITIES:
         raise exc.InvalidBrowser(
-            'Invalid browser %r; valid browsers are %r.' % (browser, DRIVERS.keys())
+            'Invalid browser %r; valid browsers are %r.' % (browser, CAPABILITIES.keys())
         )
+    try:
+        if client == 'w3c':
+            from gossamer import w3c
+            driver = w3c.Remote(driver_url, {'browserName': BROWSER_NAMES[browser]})
+        elif client in (None, 'selenium'):
+            from selenium import webdriver  # pylint: disable=F0401
+            driver = trace.instrument(webdriver.Remote(
+                driver_url, getattr(webdriver.DesiredCapabilities, CAPABILITIES[browser])
+            ))
+        else:
+            raise ValueError('Unknown client %r; valid clients are %r.' % (client, CLIENTS))
     except urllib2.URLError as exception:
         raise exc.WebDriverConnectionFailed(
             'We cannot connect to the WebDriver %s -- is it running?' % driver_url
         )
     except WebDriverException as exception:
+        if client == 'w3c' and exception.msg.startswith('Error communicating'):
+            raise exc.WebDriverConnectionFailed(
+                'We cannot connect to the WebDriver %s -- is it running?' % driver_url
+            )
         if exception.msg.startswith('The path to the driver executable must be set'):
             raise exc.InvalidWebDriverConfiguration(
                 'WebDriver cannot locate the driver for %s: %s' % (browser, exception.msg)
             )
         raise
+    session_state(driver)['clean'] = True
     return driver
 
 
+def session_state(driver):
+    """
+    Dictionary of what we know about the state of a WebDriver session,
+    kept on the driver so that it follows the session when it is reused.
+    `clean` is set while the session is on a blank page with no state, and
+    `screensize` is the last window size we set.
+    """
+    try:
+        return driver._gossamer_state # pylint: disable=W0212
+    except AttributeError:
+        driver._gossamer_state = {} # pylint: disable=W0212
+        return driver._gossamer_state # pylint: disable=W0212
+
+
 def close_driver(driver):
     """
     Close the driver, or fail silently if it doesn't exist.
     """
+    from selenium.common.exceptions import WebDriverException
     try:
         driver.quit()
     except UnboundLocalError: # pragma: no cover
@@ -206,16 +433,23 @@ def close_driver(driver):
     return True
 
 
+def ask(display, testname=None):
+    """
+    Given text as `display`, returns what was typed in answer.
+    """
+    sys.stdout.write(display)
+    sys.stdout.write('\n')
+    sys.stdout.flush()
+    return raw_input('gossamer%s >>> ' % (':'+testname if testname else ''))
+
+
 def prompt(display, options=None, testname=None):
     """
     Given text as `display` and optionally `options` as an
     iterable containing acceptable input, returns a boolean
     of whether the prompt was met.
     """
-    sys.stdout.write(display)
-    sys.stdout.write('\n')
-    sys.stdout.flush()
-    inp = raw_input('gossamer%s >>> ' % (':'+testname if testname else ''))
+    inp = ask(display, testname)
     if options:
         if inp in options:
             return True
@@ -270,7 +504,7 @@ def verify_and_prepare_files(filename, testname, mode, overwrite): # pylint: dis
                         testname
                     )
                 for each in os.listdir(filename):
-                    if each.split('.')[-1] in ('png', 'json'):
+                    if each.split('.')[-1] in ('png', 'json', 'pickle', 'bin', 'journal'):
                         os.remove(os.path.join(filename, each))
                 try:
                     for each in os.listdir(os.path.join(filename, 'last')):
@@ -289,13 +523,31 @@ def verify_and_prepare_files(filename, testname, mode, overwrite): # pylint: dis
     return True
 
 
+def read_test_names(test_files, data_dir=None):
+    """
+    Names of the tests in the given Gossamerfiles, in order, from the
+    :class:`gossamer.catalog.Catalog` in `data_dir` if given.
+    """
+    if data_dir:
+        return Catalog(data_dir).names(test_files)
+    names = []
+    for file_name in test_files:
+        config = ConfigParser.SafeConfigParser(allow_no_value=True)
+        config.read([file_name])
+        names.extend(config.sections())
+    return names
+
+
 def make_tests(test_files, mode, data_dir, rewrite_url=None, **kwargs): # pylint: disable=R0914,R0912,R0915
     """
     Given a list of gossamer test files, a mode, working directory, and
     options as found on the CLI interface, make tests for use by the
     dispatcher.
+
+    Gossamerfiles are read through the :class:`gossamer.catalog.Catalog` in
+    `data_dir`, and only the tests in `names`, if given, are prepared.
     """
-    from gossamer.data import Settings, Test
+    from gossamer.data import Settings, Test, RecordedTest
 
     postdata = _postdata(kwargs.pop('postdata', {}))
     diffcolor = tuple(
@@ -307,87 +559,75 @@ def make_tests(test_files, mode, data_dir, rewrite_url=None, **kwargs): # pylint
     overwrite = kwargs.get('overwrite', False)
     existing_names = []
 
-    for file_name in test_files:
-
-        config = ConfigParser.SafeConfigParser(
-            allow_no_value=True
-        )
-        config.read([file_name])
+    for testname, _, test_config in Catalog(data_dir).sections(test_files):
 
-        for testname in config.sections():
+        existing_names.append(testname)
+        if names and (testname not in names):
+            continue
+        if testname in tests:
+            raise exc.DuplicateTestName('Duplicate test name %s' % testname)
 
-            existing_names.append(testname)
-            if names and (testname not in names):
-                continue
-            if testname in tests:
-                raise exc.DuplicateTestName('Duplicate test name %s' % testname)
+        filename = os.path.join(data_dir, testname)
 
-            test_config = dict(config.items(testname))
-            filename = os.path.join(data_dir, testname)
-
-            if mode == modes.RECORD:
+        if mode == modes.RECORD:
 
-                url = test_config.get('url', None)
-                if not url:
-                    raise exc.InvalidGossamerfile(
-                        '%s did not have a `url` argument' % testname
-                    )
-                url = url.strip("'").strip('"')
-
-                cookies = test_config.get('cookies', None)
-                if cookies and len(cookies) > 0:
-                    cookies = json.loads(cookies)
-                else:
-                    cookies = None
-
-                screensize = tuple(
-                    int(x) for x in
-                        (kwargs.pop('screensize', None) or \
-                        test_config.get('screensize', '1024x768')
-                ).split('x'))
-
-                sa_browser = test_config.get('browser', None)
-                kw_browser = kwargs.get('browser', None)
-                if sa_browser and kw_browser and sa_browser != kw_browser:
-                    raise exc.DifferentBrowser(
-                        "Different browser given in command-line than "
-                        "is on recorded run. Screenshots may not match, "
-                        "so aborting. Please re-record."
-                    )
-                browser = kw_browser if kw_browser is not None else sa_browser
-
-                recorded_run = None
-                settings = Settings(
-                    name=testname,
-                    desc=test_config.get('desc', None),
-                    url=url,
-                    mode=mode,
-                    path=filename,
-                    browser=browser,
-                    screensize=screensize,
-                    postdata=postdata or test_config.get('postdata'),
-                    diffcolor=diffcolor,
-                    save_diff=kwargs.pop('save_diff', None),
-                    cookies=cookies,
-                    expect_redirect=asbool(test_config.get('expect_redirect', 'false'))
+            url = test_config.get('url', None)
+            if not url:
+                raise exc.InvalidGossamerfile(
+                    '%s did not have a `url` argument' % testname
                 )
+            url = url.strip("'").strip('"')
 
+            cookies = test_config.get('cookies', None)
+            if cookies and len(cookies) > 0:
+                cookies = json.loads(cookies)
             else:
-                recorded_run = read_recorded_run(os.path.join(filename, 'record.json'))
-                settings = recorded_run.settings
-                settings.path = filename
-                if rewrite_url:
-                    settings.url = rewrite_url(settings.url)
+                cookies = None
+
+            screensize = tuple(
+                int(x) for x in
+                    (kwargs.pop('screensize', None) or \
+                    test_config.get('screensize', '1024x768')
+            ).split('x'))
+
+            sa_browser = test_config.get('browser', None)
+            kw_browser = kwargs.get('browser', None)
+            if sa_browser and kw_browser and sa_browser != kw_browser:
+                raise exc.DifferentBrowser(
+                    "Different browser given in command-line than "
+                    "is on recorded run. Screenshots may not match, "
+                    "so aborting. Please re-record."
+                )
+            browser = kw_browser if kw_browser is not None else sa_browser
+
+            settings = Settings(
+                name=testname,
+                desc=test_config.get('desc', None),
+                url=url,
+                mode=mode,
+                path=filename,
+                browser=browser,
+                screensize=screensize,
+                postdata=postdata or test_config.get('postdata'),
+                diffcolor=diffcolor,
+                save_diff=kwargs.pop('save_diff', None),
+                cookies=cookies,
+                expect_redirect=asbool(test_config.get('expect_redirect', 'false')),
+                fingerprint=kwargs.get('fingerprint') or \
+                    asbool(test_config.get('fingerprint', 'false'))
+            )
 
-            verify_and_prepare_files(filename, testname, mode, overwrite)
+        verify_and_prepare_files(filename, testname, mode, overwrite)
 
-            # load recorded runs if appropriate
-            if mode != modes.RECORD:
-                recorded_run = read_recorded_run(os.path.join(filename, 'record.json'))
-            else:
-                recorded_run = None
-
-            tests[testname] = Test(version=DATA_VERSION, settings=settings, steps=recorded_run)
+        if mode == modes.RECORD:
+            tests[testname] = Test(version=DATA_VERSION, settings=settings, steps=None)
+        else:
+            # recorded runs are loaded once the test is used
+            record = record_path(filename)
+            check_recorded_run(record)
+            tests[testname] = RecordedTest(testname, functools.partial(
+                _load_recorded_test, record, filename, rewrite_url
+            ))
 
     if names:
         for name in names:
@@ -0,0 +1,417 @@
+"""
+A minimal W3C WebDriver client, as an alternative to Selenium's.
+
+It covers only the commands Gossamer uses, with the same method names as
+Selenium's drivers, so it can be used wherever they are. Requests to a
+WebDriver server share a pool of persistent connections, each request has
+a timeout, and the latency of each command is counted.
+
+Errors are raised as Selenium's `WebDriverException`, with the message
+Gossamer expects where it handles them.
+"""
+
+# Copyright (c) 2013 contributors; see AUTHORS.
+# Licensed under the Apache License, Version 2.0
+# https://www.apache.org/licenses/LICENSE-2.0
+
+import base64
+import httplib
+import json
+import select
+import socket
+import threading
+import time
+import urlparse
+
+from gossamer import trace
+
+__all__ = ['Remote', 'Element', 'ConnectionPool', 'connection_pool', 'latency', ]
+
+# seconds to wait for a response; creating a session starts a browser
+COMMAND_TIMEOUT = 60
+SESSION_TIMEOUT = 120
+
+# connections kept open to each WebDriver server
+POOL_SIZE = 8
+
+# methods retried when a reused connection fails after sending them
+IDEMPOTENT = frozenset(['GET', 'HEAD', 'DELETE'])
+
+ELEMENT_KEY = 'element-6066-11e4-a52e-4f735466cecf'
+
+# legacy JSON wire protocol
+_LEGACY_ELEMENT_KEY = 'ELEMENT'
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# command: [count, total seconds, longest seconds], across sessions
+_latency = {}
+_latency_lock = threading.Lock()
+
+
+def _error(message):
+    """
+    A Selenium `WebDriverException` with `message`.
+    """
+    from selenium.common.exceptions import WebDriverException
+    return WebDriverException(message)
+
+
+class ConnectionPool(object):
+    """
+    Persistent HTTP connections to the WebDriver server at `url`, keeping
+    up to `size` idle.
+    """
+
+    def __init__(self, url, size=POOL_SIZE):
+        parsed = urlparse.urlsplit(url)
+        self.https = parsed.scheme == 'https'
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.prefix = parsed.path.rstrip('/')
+        self.size = size
+        self.opened = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self, timeout):
+        """
+        A new connection.
+        """
+        cls = httplib.HTTPSConnection if self.https else httplib.HTTPConnection
+        with self._lock:
+            self.opened += 1
+        return cls(self.host, self.port, timeout=timeout)
+
+    def request(self, method, path, body=None, timeout=COMMAND_TIMEOUT, fresh=False): # pylint: disable=R0913
+        """
+        Make a request, returning its status and body, on an idle connection
+        unless it's `fresh`. An idle connection the server has closed is
+        replaced before sending; if a reused connection fails anyway, the
+        request is retried once on a new connection if it hadn't been sent
+        or is idempotent, as the server may otherwise have acted on it.
+        """
+        connection = None
+        if not fresh:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+        if connection is not None and _dropped(connection):
+            connection.close()
+            connection = None
+        reused = connection is not None
+        if connection is None:
+            connection = self._connect(timeout)
+        headers = {'Accept': 'application/json', 'Connection': 'keep-alive'}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json;charset=UTF-8'
+        sent = False
+        try:
+            connection.timeout = timeout
+            if connection.sock is None:
+                connection.connect()
+                # requests are small; don't wait to fill a packet
+                connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            else:
+                connection.sock.settimeout(timeout)
+            connection.request(method, self.prefix + path, payload, headers)
+            sent = True
+            response = connection.getresponse()
+            data = response.read()
+        except (socket.error, httplib.HTTPException) as exception:
+            connection.close()
+            if reused and not isinstance(exception, socket.timeout) and \
+                    (not sent or method in IDEMPOTENT):
+                return self.request(method, path, body, timeout, fresh=True)
+            raise _error(
+                'Error communicating with the remote browser: %s' % exception
+            )
+        if response.will_close:
+            connection.close()
+        else:
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append(connection)
+                    connection = None
+            if connection is not None:
+                connection.close()
+        return (response.status, data)
+
+    def close(self):
+        """
+        Close idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+def _dropped(connection):
+    """
+    Whether the server has closed the idle `connection`: with no request
+    outstanding, it has nothing to read but the end of the stream.
+    """
+    try:
+        return bool(select.select([connection.sock], [], [], 0)[0])
+    except (select.error, socket.error, ValueError, TypeError):
+        return True
+
+
+def connection_pool(url):
+    """
+    The :class:`.ConnectionPool` shared by sessions on the server at `url`.
+    """
+    with _pools_lock:
+        if url not in _pools:
+            _pools[url] = ConnectionPool(url)
+        return _pools[url]
+
+
+def latency():
+    """
+    Dictionary of command name to `(count, mean seconds, longest seconds)`
+    over every session so far.
+    """
+    with _latency_lock:
+        return dict(
+            (name, (count, total / count, longest))
+            for name, (count, total, longest) in _latency.items()
+        )
+
+
+def _count(counters, name, elapsed):
+    """
+    Count a command taking `elapsed` seconds.
+    """
+    counter = counters.setdefault(name, [0, 0.0, 0.0])
+    counter[0] += 1
+    counter[1] += elapsed
+    counter[2] = max(counter[2], elapsed)
+
+
+class Element(object):
+    """
+    An element found by :class:`.Remote`.
+    """
+
+    def __init__(self, driver, element_id):
+        self.driver = driver
+        self.id = element_id # pylint: disable=C0103
+
+    def _path(self, suffix=''):
+        """
+        Path of a command on this element.
+        """
+        return '/element/%s%s' % (self.id, suffix)
+
+    def send_keys(self, text):
+        """
+        Type `text` into the element.
+        """
+        self.driver._command( # pylint: disable=W0212
+            'sendKeys', 'POST', self._path('/value'), {'text': text, 'value': list(text)}
+        )
+
+    def click(self):
+        """
+        Click the element.
+        """
+        self.driver._command('click', 'POST', self._path('/click'), {}) # pylint: disable=W0212
+
+    def select_by_visible_text(self, text):
+        """
+        Select the option of a select element with `text`, as Selenium's
+        `Select.select_by_visible_text` does.
+        """
+        found = self.driver.execute_script(
+            'var select = arguments[0], text = arguments[1];'
+            'for (var i = 0; i < select.options.length; i++) {'
+            '  if (select.options[i].text.trim() === text) {'
+            '    select.selectedIndex = i;'
+            '    select.dispatchEvent(new Event("change", {bubbles: true}));'
+            '    return true;'
+            '  }'
+            '}'
+            'return false;', self, text
+        )
+        if not found:
+            raise _error('Could not locate element with visible text: %s' % text)
+
+    @property
+    def screenshot_as_png(self):
+        """
+        PNG bytes of a screenshot of the element.
+        """
+        return base64.b64decode(self.driver._command( # pylint: disable=W0212
+            'takeElementScreenshot', 'GET', self._path('/screenshot')
+        ))
+
+    def __json__(self):
+        return {ELEMENT_KEY: self.id, _LEGACY_ELEMENT_KEY: self.id}
+
+
+class Remote(object):
+    """
+    A session on the WebDriver server at `url` with `capabilities`,
+    e.g., `{'browserName': 'firefox'}`. Commands time out after `timeout`
+    seconds; :attr:`latency` counts each command's count, total and
+    longest time in seconds.
+    """
+
+    def __init__(self, url, capabilities, timeout=COMMAND_TIMEOUT, pool=None):
+        self.pool = pool or connection_pool(url)
+        self.timeout = timeout
+        self.latency = {}
+        self.session_id = None
+        response = self._command('newSession', 'POST', '', {
+            'capabilities': {'alwaysMatch': capabilities},
+            'desiredCapabilities': capabilities,
+        }, timeout=SESSION_TIMEOUT, whole=True)
+        value = response.get('value') or {}
+        self.session_id = response.get('sessionId') or value.get('sessionId')
+        self.capabilities = value.get('capabilities', value)
+
+    def _command(self, name, method, path, body=None, timeout=None, whole=False): # pylint: disable=R0913
+        """
+        Run a command on the session, returning its value, or, with
+        `whole`, the whole response.
+        """
+        if self.session_id:
+            path = '/session/%s%s' % (self.session_id, path)
+        else:
+            path = '/session%s' % path
+        started = time.time()
+        with trace.span(name, 'webdriver'):
+            status, data = self.pool.request(method, path, body, timeout or self.timeout)
+        elapsed = time.time() - started
+        _count(self.latency, name, elapsed)
+        with _latency_lock:
+            _count(_latency, name, elapsed)
+        try:
+            response = json.loads(data) if data else {}
+        except ValueError:
+            raise _error('Invalid response to %s (%d): %s' % (name, status, data[:200]))
+        if not isinstance(response, dict):
+            response = {'value': response}
+        value = response.get('value')
+        if status >= 400 or response.get('status') not in (None, 0):
+            if isinstance(value, dict):
+                message = value.get('message') or value.get('error')
+            else:
+                message = value
+            raise _error(message or 'WebDriver command %s failed (%d)' % (name, status))
+        return response if whole else value
+
+    def get(self, url):
+        """
+        Navigate to `url`.
+        """
+        self._command('get', 'POST', '/url', {'url': url})
+
+    def refresh(self):
+        """
+        Reload the page.
+        """
+        self._command('refresh', 'POST', '/refresh', {})
+
+    @property
+    def current_url(self):
+        """
+        URL of the page.
+        """
+        return self._command('getCurrentUrl', 'GET', '/url')
+
+    def execute_script(self, script, *args):
+        """
+        Run JavaScript in the page, returning its result.
+        """
+        return self._command('executeScript', 'POST', '/execute/sync', {
+            'script': script, 'args': _arguments(args),
+        })
+
+    def execute_async_script(self, script, *args):
+        """
+        Run asynchronous JavaScript, which calls its last argument when done.
+        """
+        return self._command('executeAsyncScript', 'POST', '/execute/async', {
+            'script': script, 'args': _arguments(args),
+        })
+
+    def set_script_timeout(self, seconds):
+        """
+        Time asynchronous scripts out after `seconds`.
+        """
+        self._command('setTimeouts', 'POST', '/timeouts', {'script': int(seconds * 1000)})
+
+    def set_window_size(self, width, height):
+        """
+        Resize the window.
+        """
+        self._command('setWindowRect', 'POST', '/window/rect', {
+            'width': int(width), 'height': int(height),
+        })
+
+    def get_screenshot_as_png(self):
+        """
+        PNG bytes of a screenshot of the page.
+        """
+        return base64.b64decode(self._command('takeScreenshot', 'GET', '/screenshot'))
+
+    def save_screenshot(self, filename):
+        """
+        Save a PNG screenshot of the page to `filename`.
+        """
+        with open(filename, 'wb') as fp:
+            fp.write(self.get_screenshot_as_png())
+        return True
+
+    def delete_all_cookies(self):
+        """
+        Delete the page's cookies.
+        """
+        self._command('deleteAllCookies', 'DELETE', '/cookie')
+
+    def add_cookie(self, cookie):
+        """
+        Add a cookie, a dictionary with at least `name` and `value`.
+        """
+        self._command('addCookie', 'POST', '/cookie', {'cookie': cookie})
+
+    def find_element_by_css_selector(self, selector):
+        """
+        The first element matching a CSS selector.
+        """
+        value = self._command('findElement', 'POST', '/element', {
+            'using': 'css selector', 'value': selector,
+        })
+        return Element(self, value.get(ELEMENT_KEY) or value.get(_LEGACY_ELEMENT_KEY))
+
+    def find_element_by_id(self, element_id):
+        """
+        The element with an id.
+        """
+        return self.find_element_by_css_selector('[id=%s]' % json.dumps(element_id))
+
+    def find_element_by_class_name(self, name):
+        """
+        The first element with a `className`.
+        """
+        return self.find_element_by_css_selector('[class=%s]' % json.dumps(name))
+
+    def quit(self):
+        """
+        End the session.
+        """
+        if self.session_id:
+            self._command('deleteSession', 'DELETE', '')
+            self.session_id = None
+
+
+def _arguments(args):
+    """
+    Script arguments, with elements as references.
+    """
+    return [arg.__json__() if isinstance(arg, Element) else arg for arg in args]
@@ -46,6 +46,9 @@ setup(
         ],
         'setuptools.installation': [
             'eggsecutable = gossamer.cli:main',
+        ],
+        'pytest11': [
+            'gossamer = gossamer.pytest_plugin',
         ]
     },
     license = 'Apache 2.0',
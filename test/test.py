@@ -7,11 +7,13 @@ Smoke tests. Needs to be improved.
 # https://www.apache.org/licenses/LICENSE-2.0
 
 import unittest
-from gossamer import util, run, integration
+from gossamer import util, run, integration, pool
+from gossamer.constant import modes, states
 import json
 import pkg_resources
 import os
 import shutil
+import tempfile
 
 
 class TestUtilities(unittest.TestCase): # pylint: disable=R0904
@@ -41,6 +43,145 @@ class TestUtilities(unittest.TestCase): # pylint: disable=R0904
         finally:
             os.unlink(os.path.join(filename, 'record.json'))
 
+    def test_read_run_cache(self):
+        """
+        util.read_recorded_run, data.RecordedTest
+        """
+        from gossamer.data import RecordedTest
+        directory = tempfile.mkdtemp()
+        cache = tempfile.mkdtemp()
+        environ = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = cache
+        try:
+            util.write_recorded_run(directory, util.import_recorded_run(self.data))
+            filename = os.path.join(directory, 'record.json')
+            test = RecordedTest('test', lambda: util.read_recorded_run(filename))
+            self.assertFalse(test.loaded)
+            steps = json.dumps(test.steps, cls=util.Encoder, sort_keys=True)
+            self.assertTrue(test.loaded)
+            self.assertEqual(os.listdir(directory), ['record.json'])
+            path = util._cache_path(filename) # pylint: disable=W0212
+            self.assertEqual(os.path.dirname(path), os.path.join(cache, 'gossamer'))
+            self.assertTrue(os.path.exists(path))
+            cached = util.read_recorded_run(filename)
+            self.assertEqual(json.dumps(cached.steps, cls=util.Encoder, sort_keys=True), steps)
+            with open(path, 'wb') as fp:
+                fp.write('not a pickle')
+            self.assertEqual(json.dumps(
+                util.read_recorded_run(filename).steps, cls=util.Encoder, sort_keys=True
+            ), steps)
+        finally:
+            if environ is None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = environ
+            shutil.rmtree(directory)
+            shutil.rmtree(cache)
+
+    def test_packed_run(self):
+        """
+        packed.dumps, packed.loads, util.convert_recorded_run
+        """
+        from gossamer import exc, packed
+        from gossamer.data import Point
+        from gossamer.step import Scroll, Text
+        test = util.import_recorded_run(self.data)
+        test.steps.append(Scroll(12000, Point(0.5, 2 ** 40)))
+        test.steps.append(Text(12001, u'caf\xe9', 'id', None))
+        expected = json.dumps(test, cls=util.Encoder, sort_keys=True)
+        self.assertEqual(json.dumps(
+            packed.loads(packed.dumps(test)), cls=util.Encoder, sort_keys=True
+        ), expected)
+
+        directory = tempfile.mkdtemp()
+        try:
+            util.write_recorded_run(directory, test)
+            filename = util.convert_recorded_run(directory, True)
+            self.assertEqual(filename, os.path.join(directory, packed.FILENAME))
+            self.assertEqual(util.record_path(directory), filename)
+            self.assertFalse(os.path.exists(os.path.join(directory, 'record.json')))
+            self.assertEqual(json.dumps(
+                util.read_recorded_run(filename), cls=util.Encoder, sort_keys=True
+            ), expected)
+            with open(filename, 'rb') as fp:
+                data = fp.read()
+            with open(filename, 'wb') as fp:
+                fp.write(packed.MAGIC + '\xff\xff' + data[len(packed.MAGIC) + 2:])
+            self.assertRaises(
+                exc.CouldNotParseRecordedRun, util.read_recorded_run, filename, False
+            )
+            with open(filename, 'wb') as fp:
+                fp.write(data)
+            util.convert_recorded_run(directory, False)
+            self.assertEqual(json.dumps(util.read_recorded_run(
+                os.path.join(directory, 'record.json')
+            ), cls=util.Encoder, sort_keys=True), expected)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_step_slots(self):
+        """
+        step.Dropdown.__json__, step.Screenshot.__json__
+        """
+        from gossamer.data import Point
+        from gossamer.step import Dropdown, Screenshot
+        step = Dropdown(1, Point(2, 3), ecl=[['field', 'wide'], 'Lyon'])
+        self.assertFalse(hasattr(step, '__dict__'))
+        self.assertEqual(json.loads(json.dumps(step, cls=util.Encoder)), {
+            'Dropdown': {
+                'offset_time': 1, 'pos': {'x': 2, 'y': 3}, 'value': 'Lyon',
+                'identifier': '.field. wide', 'identifier_type': 'classlist',
+            }
+        })
+        self.assertEqual(json.loads(json.dumps(Screenshot(1, 2), cls=util.Encoder)), {
+            'Screenshot': {'offset_time': 1, 'num': 2}
+        })
+        self.assertEqual(json.loads(json.dumps(
+            Screenshot(1, 2, region=[0, 0, 8, 4]), cls=util.Encoder
+        )), {'Screenshot': {'offset_time': 1, 'num': 2, 'region': [0, 0, 8, 4]}})
+
+    def test_catalog(self):
+        """
+        catalog.Catalog
+        """
+        from gossamer.catalog import Catalog, FILENAME
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'Gossamerfile')
+            with open(filename, 'w') as fp:
+                fp.write('[first]\nurl=http://www.example.com\n\n[second]\nurl=/\n')
+            self.assertEqual(Catalog(directory).names([filename]), ['first', 'second'])
+            self.assertTrue(os.path.exists(os.path.join(directory, FILENAME)))
+            catalog = Catalog(directory)
+            self.assertEqual(
+                catalog.sections([filename])[0],
+                ('first', filename, {'url': 'http://www.example.com'})
+            )
+            self.assertFalse(catalog._changed) # pylint: disable=W0212
+            with open(filename, 'a') as fp:
+                fp.write('\n[third]\nurl=/third\n')
+            self.assertEqual(
+                util.read_test_names([filename], directory), ['first', 'second', 'third']
+            )
+        finally:
+            shutil.rmtree(directory)
+
+    def test_lazy_imports(self):
+        """
+        Importing gossamer doesn't import selenium, Pillow or pkg_resources
+        """
+        import subprocess
+        import sys
+        loaded = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys, gossamer.cli, gossamer.integration; '
+            'print(" ".join(sorted(sys.modules)))'
+        ]).split()
+        self.assertEqual([
+            name for name in loaded
+            if name.split('.')[0] in ('selenium', 'PIL', 'pkg_resources')
+        ], [])
+
 
 class TestRun(unittest.TestCase): # pylint: disable=R0904
     """
@@ -76,6 +217,125 @@ class TestRun(unittest.TestCase): # pylint: disable=R0904
             ), False
         )
 
+    def test_process_steps_text_events(self):
+        """
+        run._process_steps merges text events per field
+        """
+        from gossamer.step import Screenshot, Text, Click
+        field = lambda name, value: [[name, value], ['', None], [[], None]]
+        events = [
+            [1100, 'text', field('username', 'us')],
+            [1200, 'text', field('username', 'user')],
+            [1300, 'text', field('password', 'pass')],
+            [1400, 'click', [[10, 20], False, ['', None], ['', None], [[], None]]],
+            [1500, 'scroll', [0, 300]],
+            [9000, 'text', field('username', 'ignored')],
+        ]
+        steps = run._process_steps( # pylint: disable=W0212
+            [Screenshot(600, 1)], events, 1000
+        )
+        self.assertEqual(
+            [step.__class__ for step in steps],
+            [Text, Text, Click, run.Scroll, Screenshot]
+        )
+        self.assertEqual(
+            [(step.offset_time, step.identifier, step.value) for step in steps[:2]],
+            [(200, 'username', 'user'), (300, 'password', 'pass')]
+        )
+
+    def test_process_steps_record(self):
+        """
+        run._process_steps reproduces a recorded run from its keystrokes
+        """
+        data = json.loads(
+            pkg_resources.resource_stream('test', 'data/record.json').read()
+        )
+        recorded = util.import_recorded_run(data)
+        start_time = 1000
+        steps, events = [], []
+        for step in recorded.steps:
+            timestamp = start_time + step.offset_time
+            if step.__class__.__name__ == 'Screenshot':
+                steps.append(step)
+            elif step.__class__.__name__ == 'Click':
+                events.append([timestamp, 'click', [
+                    [step.pos.x, step.pos.y], False, ['', None], ['', None], [[], None]
+                ]])
+            elif step.__class__.__name__ == 'Text':
+                classlist = [step.identifier.lstrip('.')]
+                for i in range(len(step.value)):
+                    events.append([timestamp - len(step.value) + i + 1, 'keyup', [
+                        step.value[i], False,
+                        ['', None], ['', None], [classlist, step.value[:i + 1]]
+                    ]])
+                # tab into the next field
+                events.append([timestamp + 1, 'keyup', [
+                    '\t', False, ['', None], ['', None], [['next'], '']
+                ]])
+        events.append([start_time + recorded.steps[-1].offset_time + 1, 'scroll', [0, 1]])
+        self.assertEqual(
+            json.dumps(run._process_steps( # pylint: disable=W0212
+                steps, events, start_time
+            ), cls=util.Encoder, sort_keys=True),
+            json.dumps(recorded.steps, cls=util.Encoder, sort_keys=True)
+        )
+
+    def test_process_steps_streams(self):
+        """
+        run._process_steps makes the steps that the implementation before it
+        streamed events made of random event streams
+        """
+        from gossamer.step import Screenshot
+        cases = json.loads(
+            pkg_resources.resource_stream('test', 'data/process_steps.json').read()
+        )
+        for case in cases:
+            steps = run._process_steps([ # pylint: disable=W0212
+                Screenshot(offset_time, num + 1)
+                for num, offset_time in enumerate(case['screenshots'])
+            ], case['events'], 1000)
+            self.assertEqual([[
+                step.__class__.__name__, step.offset_time,
+                [step.pos.x, step.pos.y] if getattr(step, 'pos', None) else None,
+                getattr(step, 'identifier', None), getattr(step, 'identifier_type', None),
+                getattr(step, 'value', None), getattr(step, 'num', None),
+            ] for step in steps], case['steps'])
+
+    def test_journal(self):
+        """
+        journal.Journal, run.compact
+        """
+        from gossamer.journal import Journal, FILENAME
+        data = json.loads(
+            pkg_resources.resource_stream('test', 'data/record.json').read()
+        )
+        recorded = util.import_recorded_run(data)
+        directory = tempfile.mkdtemp()
+        try:
+            recorded.settings.path = directory
+            journal = Journal(recorded.settings, 1000)
+            journal.events([[1100, 'click', [[5, 6], False, ['', None], ['', None], [[], None]]]])
+            journal.step(recorded.steps[0], sync=True)
+            # the second capture of an event replaces the first
+            journal.events([
+                [1100, 'click', [[7, 8], False, ['', None], ['', None], [[], None]]],
+                [1200, 'scroll', [0, 10]],
+            ])
+            journal.step(recorded.steps[2], sync=True)
+            journal.close()
+            with open(os.path.join(directory, FILENAME), 'a') as fp:
+                fp.write('{"event": [5000, "sc') # interrupted
+            test = run.compact(directory)
+            self.assertEqual(test.settings.name, recorded.settings.name)
+            self.assertEqual(test.settings.path, directory)
+            self.assertEqual(
+                [(step.__class__.__name__, step.offset_time) for step in test.steps],
+                [('Click', 100), ('Scroll', 200), ('Screenshot', 1785), ('Screenshot', 4287)]
+            )
+            self.assertEqual((test.steps[0].pos.x, test.steps[0].pos.y), (7, 8))
+        finally:
+            shutil.rmtree(directory)
+
 class TestIntegration(unittest.TestCase): # pylint: disable=R0904
     """
     Integration
@@ -105,9 +365,1086 @@ class TestIntegration(unittest.TestCase): # pylint: disable=R0904
                 self.assertEqual(cls.__base__, unittest.TestCase)
                 self.assertEqual(cls._skip_allowed, False) # pylint: disable=W0212
                 self.assertTrue(':80' in cls._gossamer_test.settings.url) # pylint: disable=W0212
+            self.assertEqual(
+                [locals()['GossamerTest_%s' % name]().shortDescription() for name in tests],
+                tests
+            )
+            self.assertEqual(integration.GossamerTestCase.runTest.__doc__.strip(), 'Gossamer test')
         finally:
             try:
                 shutil.rmtree('/tmp/example')
                 shutil.rmtree('/tmp/mdn')
             except OSError:
                 pass
+
+    def test_concurrent_suite(self):
+        """
+        integration.ConcurrentSuite runs Gossamer tests on reused sessions
+        """
+        from gossamer import fake, hooks, w3c
+        from gossamer.data import Test, Settings
+        from gossamer.step import Screenshot
+        server = fake.Server().start()
+        path = tempfile.mkdtemp()
+        try:
+            gossamerfile = os.path.join(path, 'Gossamerfile')
+            with open(gossamerfile, 'w') as fp:
+                for num in range(4):
+                    name = 'test%d' % num
+                    fp.write('[%s]\nurl=http://example.com/\n\n' % name)
+                    directory = os.path.join(path, name)
+                    os.makedirs(os.path.join(directory, 'last'))
+                    with open(os.path.join(directory, 'screenshot1.png'), 'wb') as png:
+                        png.write(fake.png())
+                    util.write_recorded_run(directory, Test(1, Settings(
+                        name, 'http://example.com/', modes.PLAYBACK, directory, 'firefox',
+                        (1024, 768), None, (0, 255, 0), False
+                    ), [Screenshot(1, 1)]))
+            started = []
+            class Hook(hooks.Hook): # pylint: disable=C0111
+                def on_test_start(self, test):
+                    started.append(test.settings.name)
+            hook = Hook()
+            client = {}
+            integration.run_gossamerfile(
+                client, gossamerfile, path, selenium=server.url, skip_allowed=False,
+                reuse=2, client='w3c', workers=2,
+                hooks=['gossamer.hooks:Hook', hook, hook]
+            )
+            other = {}
+            integration.run_gossamerfile(
+                other, gossamerfile, path, selenium=server.url, hooks=['gossamer.hooks:Hook']
+            )
+            self.assertEqual(hooks.registered, ())
+            cases = [client['GossamerTest_test%d' % num] for num in range(4)]
+            self.assertEqual(len(cases[0]._hooks), 2) # pylint: disable=W0212
+            self.assertTrue(
+                other['GossamerTest_test0']._hooks[0] is cases[0]._hooks[0] # pylint: disable=W0212
+            )
+            self.assertFalse(any(case._gossamer_test.loaded for case in cases)) # pylint: disable=W0212
+            self.assertEqual(server.requests, [])
+            loader = unittest.TestLoader()
+            suite = client['load_tests'](loader, unittest.TestSuite(
+                loader.loadTestsFromTestCase(case) for case in cases
+            ), None)
+            self.assertTrue(isinstance(suite, integration.ConcurrentSuite))
+            result = suite.run(unittest.TestResult())
+            self.assertEqual(result.testsRun, 4)
+            self.assertTrue(result.wasSuccessful())
+            self.assertEqual(len(server.drivers), 2)
+            self.assertEqual(sorted(started), ['test%d' % num for num in range(4)])
+            self.assertEqual(hooks.registered, ())
+            cases[0]._args[1].close() # pylint: disable=W0212
+        finally:
+            w3c.connection_pool(server.url).close()
+            server.stop()
+            shutil.rmtree(path)
+
+
+class TestPool(unittest.TestCase): # pylint: disable=R0904
+    """
+    Pool
+    """
+
+    class _Pool(pool.SessionPool):
+        """
+        Sessions that are never opened.
+        """
+        def acquire(self, browser):
+            self._slots.acquire()
+            return browser
+
+        def release(self, driver, error=False):
+            self._slots.release()
+
+    def _run(self, results, jobs, stop_on_error=False):
+        """
+        pool.run_tests with dispatch returning `results` by test name.
+        """
+        from gossamer.data import Test
+        def dispatch(
+                driver, mode, test, output, executor=None, timings=None, verify=None,
+                screenshots=None
+            ): # pylint: disable=W0613,R0913
+            output('Playing back %s ... ' % test.settings.name, flush=True)
+            output('%s' % results[test.settings.name][0])
+            return results[test.settings.name]
+        class Settings(object): # pylint: disable=R0903,C0111
+            browser = 'firefox'
+            def __init__(self, name):
+                self.name = name
+        chunks = []
+        tests = dict(
+            (name, Test(1, Settings(name), [])) for name in sorted(results)
+        )
+        original, pool.dispatch = pool.dispatch, dispatch
+        try:
+            ret = pool.run_tests(
+                tests, modes.PLAYBACK, self._Pool(jobs),
+                output=lambda content=None, flush=False: chunks.append(content),
+                stop_on_error=stop_on_error
+            )
+        finally:
+            pool.dispatch = original
+        return ret, chunks
+
+    def test_run_tests(self):
+        """
+        pool.run_tests writes each test's output contiguously
+        """
+        results = dict(
+            ('test%d' % i, (states.OK if i % 3 else states.FAIL, None)) for i in range(20)
+        )
+        ret, chunks = self._run(results, 4)
+        self.assertEqual(ret, results)
+        self.assertEqual(
+            sorted(chunks),
+            sorted('Playing back %s ... %s\n' % (key, val[0]) for key, val in results.items())
+        )
+
+    def test_run_tests_stop(self):
+        """
+        pool.run_tests stops starting tests after a failure
+        """
+        results = {'a': (states.FAIL, None), 'b': (states.ERROR, None)}
+        ret, _ = self._run(results, 1, stop_on_error=True)
+        self.assertEqual(len(ret), 1)
+
+    def test_session_reuse(self):
+        """
+        pool.SessionPool reuses and recycles sessions
+        """
+        class Driver(object): # pylint: disable=C0111
+            def __init__(self):
+                self.commands = []
+                self.closed = False
+            def __getattr__(self, name):
+                if name.startswith('_'):
+                    raise AttributeError(name)
+                return lambda *args: self.commands.append(name)
+            def quit(self):
+                self.closed = True
+        original, util.get_driver = util.get_driver, lambda browser, selenium, **kwargs: Driver()
+        try:
+            sessions = pool.SessionPool(1, reuse=2, resets=('cookies', 'localstorage'))
+            first = sessions.acquire('firefox')
+            sessions.release(first)
+            self.assertEqual(
+                first.commands, ['delete_all_cookies', 'execute_script', 'get']
+            )
+            self.assertTrue(util.session_state(first)['clean'])
+            self.assertTrue(sessions.acquire('firefox') is first)
+            sessions.release(first)
+            self.assertTrue(first.closed)
+            second = sessions.acquire('firefox')
+            self.assertFalse(second is first)
+            sessions.release(second, error=True)
+            self.assertTrue(second.closed)
+            third = sessions.acquire('firefox')
+            sessions.release(third)
+            fourth = sessions.acquire('chrome')
+            self.assertTrue(third.closed)
+            sessions.release(fourth)
+            sessions.close()
+            self.assertTrue(fourth.closed)
+        finally:
+            util.get_driver = original
+
+
+class TestSuite(unittest.TestCase): # pylint: disable=R0904
+    """
+    Suites
+    """
+
+    def setUp(self):
+        super(TestSuite, self).setUp()
+        from PIL import Image
+        self.path = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.path, 'last'))
+        for num in (1, 2):
+            Image.new('RGB', (10, 10), (255, 0, 0)).save(
+                os.path.join(self.path, 'screenshot%d.png' % num)
+            )
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    @staticmethod
+    def _sessions(size):
+        """
+        Fake WebDriver sessions, whose screenshots match the originals but
+        for those made blue.
+        """
+        from gossamer import fake
+        return fake.SessionPool(size, screenshot=fake.png(10, 10, (255, 0, 0)))
+
+    def _make_blue(self, num):
+        """
+        Make the original screenshot `num` differ.
+        """
+        from PIL import Image
+        Image.new('RGB', (10, 10), (0, 0, 255)).save(
+            os.path.join(self.path, 'screenshot%d.png' % num)
+        )
+
+    def test_run_suite(self):
+        """
+        aio.run_suite compares screenshots on an executor
+        """
+        from gossamer.data import Test, Settings
+        from gossamer.step import Screenshot
+        from gossamer import aio
+        self._make_blue(1)
+
+        settings = Settings(
+            'differs', 'http://example.com/', modes.PLAYBACK, self.path, 'chrome',
+            (1024, 768), None, (0, 255, 0), False
+        )
+        test = Test(1, settings, [Screenshot(1, 1), Screenshot(2, 2)])
+        results = aio.run_suite({'differs': test}, pool=self._sessions(2))
+        state, err = results['differs']
+        self.assertTrue(state is states.FAIL)
+        self.assertEqual(str(err), 'Screenshot 1 was different.')
+
+    def test_report(self):
+        """
+        report writes each test's phases as JSON and JUnit XML
+        """
+        from xml.etree import ElementTree
+        from gossamer.data import Test, Settings
+        from gossamer.step import Screenshot
+        from gossamer import report
+
+        settings = Settings(
+            'same', 'http://example.com/', modes.PLAYBACK, self.path, 'chrome',
+            (1024, 768), None, (0, 255, 0), False
+        )
+        durations, timings, startup = {}, {}, {}
+        results = pool.run_tests(
+            {'same': Test(1, settings, [Screenshot(1, 1)])}, modes.PLAYBACK,
+            self._sessions(1), output=util.null_writer, durations=durations, timings=timings,
+            startup=startup
+        )
+        self.assertEqual(
+            [(step.num, step.step) for step in timings['same']],
+            [(0, 'Begin'), (1, 'Screenshot')]
+        )
+        phases = report.phases(timings['same'], startup['same'])
+        self.assertTrue(phases['delay'] >= 1.0)
+        self.assertTrue(phases['capture'] > 0 and phases['compare'] > 0)
+
+        filename = os.path.join(self.path, 'report.json')
+        report.write_json(filename, results, durations, timings, startup)
+        with open(filename, 'r') as fp:
+            written = json.loads(fp.read())
+        self.assertEqual(written['tests']['same']['state'], 'ok')
+        self.assertEqual(written['totals'], report.totals(timings, startup))
+        self.assertEqual(len(written['tests']['same']['steps']), 2)
+
+        filename = os.path.join(self.path, 'junit.xml')
+        report.write_junit(filename, results, durations, timings, startup)
+        suite = ElementTree.parse(filename).getroot()
+        self.assertEqual((suite.get('tests'), suite.get('failures')), ('1', '0'))
+        self.assertEqual(
+            [prop.get('name') for prop in suite.findall('testcase/properties/property')],
+            list(report.PHASES)
+        )
+
+    def test_summary(self):
+        """
+        report.summary totals the phases and finds the slowest steps of the
+        properties of several tests
+        """
+        from gossamer.data import StepTiming
+        from gossamer import report
+        a = report.properties([
+            StepTiming(0, 'Begin', 1.0, 1.0),
+            StepTiming(1, 'Click', 0.5, 0.25, 0.25),
+            StepTiming(2, 'Screenshot', 0.0, 0.0, 1.0, 2.0, 3.0),
+        ], 4.0)
+        self.assertEqual(a['steps'], [(1, 'Click', 1.0), (2, 'Screenshot', 6.0)])
+        self.assertEqual(a['phases']['begin'], 2.0)
+        b = report.properties([StepTiming(1, 'Text', 0.0, 2.0)])
+        lines = report.summary([('a', a), ('b', b)], slowest=2)
+        self.assertEqual(lines[0], '      4.00 s   26.7%  session')
+        self.assertEqual(lines[len(report.PHASES)], 'Slowest steps:')
+        self.assertEqual(lines[len(report.PHASES) + 1:], [
+            '      6.00 s  a step 2 (Screenshot)', '      2.00 s  b step 1 (Text)',
+        ])
+
+    def test_trace(self):
+        """
+        trace records tests, steps and comparisons as trace events
+        """
+        from gossamer.data import Test, Settings
+        from gossamer.step import Screenshot
+        from gossamer import aio, trace
+
+        settings = Settings(
+            'same', 'http://example.com/', modes.PLAYBACK, self.path, 'chrome',
+            (1024, 768), None, (0, 255, 0), False
+        )
+        tracer = trace.start(memory=True)
+        try:
+            aio.run_suite(
+                {'same': Test(1, settings, [Screenshot(1, 1)])}, pool=self._sessions(1)
+            )
+        finally:
+            self.assertTrue(trace.stop() is tracer)
+        filename = os.path.join(self.path, 'trace.json')
+        tracer.write(filename)
+        with open(filename, 'r') as fp:
+            events = json.loads(fp.read())['traceEvents']
+        spans = dict((event['name'], event) for event in events if event['ph'] == 'X')
+        self.assertEqual(
+            sorted(spans),
+            ['Screenshot', 'begin', 'compare', 'delay', 'load', 'quiescence', 'same', 'session']
+        )
+        self.assertEqual(spans['same']['args'], {'state': 'ok'})
+        self.assertNotEqual(spans['compare']['tid'], spans['same']['tid'])
+        self.assertEqual(len([event for event in events if event['ph'] == 'C']), 2)
+        with trace.span('untraced', 'test') as span:
+            span.args = {}
+
+    def test_hooks(self):
+        """
+        hooks are called around steps and may decide comparisons
+        """
+        from gossamer.data import Test, Settings
+        from gossamer.step import Screenshot
+        from gossamer import hooks
+        self._make_blue(1)
+
+        calls = []
+        class Hook(hooks.Hook): # pylint: disable=C0111
+            def on_test_start(self, test):
+                calls.append(('start', test.settings.name))
+            def after_step(self, test, num, step):
+                calls.append(('step', num))
+            def after_capture(self, test, step, png):
+                calls.append(('capture', png[1:4]))
+            def before_compare(self, test, step):
+                return True if step.num == 1 else None
+            def after_compare(self, test, step, identical):
+                calls.append(('compare', step.num, identical))
+            def on_result(self, test, state, err):
+                calls.append(('result', str(state)))
+
+        settings = Settings(
+            'differs', 'http://example.com/', modes.PLAYBACK, self.path, 'chrome',
+            (1024, 768), None, (0, 255, 0), False
+        )
+        hook = hooks.register(Hook())
+        try:
+            results = pool.run_tests(
+                {'differs': Test(1, settings, [Screenshot(1, 1)])}, modes.PLAYBACK,
+                self._sessions(1), output=util.null_writer
+            )
+        finally:
+            hooks.unregister(hook)
+        self.assertEqual(results['differs'], (states.OK, None))
+        self.assertEqual(calls, [
+            ('start', 'differs'), ('capture', 'PNG'), ('compare', 1, True),
+            ('step', 1), ('result', 'ok'),
+        ])
+        self.assertEqual(hooks.registered, ())
+        self.assertTrue(isinstance(hooks.load('gossamer.hooks:Hook'), hooks.Hook))
+        self.assertRaises(ValueError, hooks.load, 'not-installed')
+
+
+class TestPytestPlugin(unittest.TestCase): # pylint: disable=R0904
+    """
+    pytest plugin
+    """
+
+    _TEST = '''
+import os
+import shutil
+
+def test_collect(testdir):
+    data = %r
+    shutil.copyfile(os.path.join(data, 'Gossamerfile'), str(testdir.tmpdir.join('Gossamerfile')))
+    for name in ('example', 'mdn'):
+        shutil.copytree(os.path.join(data, name), str(testdir.tmpdir.join('gossamer', name)))
+    result = testdir.runpytest('--collect-only', '-p', 'gossamer.pytest_plugin')
+    assert 'GossamerItem' not in result.stdout.str()
+    result = testdir.runpytest('--collect-only', '--gossamer', '-p', 'gossamer.pytest_plugin')
+    result.stdout.fnmatch_lines(['*GossamerItem*example*', '*GossamerItem*mdn*'])
+'''
+
+    def test_collect(self):
+        """
+        With --gossamer, the plugin collects the tests in Gossamerfiles, and
+        otherwise none; run with pytester where pytest is installed
+        """
+        import subprocess
+        import sys
+        try:
+            import pytest # pylint: disable=F0401,W0612
+        except ImportError:
+            raise unittest.SkipTest('pytest is not installed')
+        path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(path, 'test_plugin.py')
+            with open(filename, 'w') as fp:
+                fp.write(self._TEST % os.path.join(os.getcwd(), 'test', 'data'))
+            env = dict(os.environ, PYTHONPATH=os.getcwd())
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'pytest', '-p', 'pytester', '-p', 'no:gossamer',
+                    '-p', 'no:cacheprovider', filename],
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=path, env=env
+            )
+            output = process.communicate()[0]
+            self.assertEqual(process.returncode, 0, output)
+        finally:
+            shutil.rmtree(path)
+
+
+class TestShard(unittest.TestCase): # pylint: disable=R0904
+    """
+    Shards
+    """
+
+    def _tests(self):
+        """
+        Tests with from 0 to 9 steps.
+        """
+        from gossamer.data import Test
+        from gossamer.step import Click, Screenshot
+        from gossamer.data import Point
+        class Settings(object): # pylint: disable=R0903,C0111
+            def __init__(self, name):
+                self.name = name
+        return dict(
+            ('test%d' % i, Test(1, Settings('test%d' % i), [
+                Click(j, Point(0, 0)) for j in range(i)
+            ] + [Screenshot(i, 1)])) for i in range(10)
+        )
+
+    def test_select(self):
+        """
+        shard.select splits tests deterministically
+        """
+        from gossamer import shard
+        tests = self._tests()
+        shards = [shard.select(tests, '%d/3' % i) for i in (1, 2, 3)]
+        self.assertEqual(
+            sorted(name for each in shards for name in each), sorted(tests)
+        )
+        self.assertEqual(shards[0].keys(), shard.select(tests, (1, 3)).keys())
+        loads = [sum(shard.weight(test) for test in each.values()) for each in shards]
+        self.assertTrue(max(loads) - min(loads) <= shard.weight(tests['test9']))
+        durations = dict(('test%d' % i, 1.0) for i in range(10))
+        durations['test0'] = 100.0
+        self.assertEqual(shard.select(tests, '1/3', durations).keys(), ['test0'])
+        self.assertRaises(ValueError, shard.parse_shard, '4/3')
+        self.assertRaises(ValueError, shard.parse_shard, 'x')
+
+    def test_longest_first(self):
+        """
+        shard.longest_first reorders the items it weighs among their places
+        """
+        from gossamer import shard
+        items = ['x', 2.0, 5.0, 'y', 2.0, 9.0]
+        cost = lambda item: item if isinstance(item, float) else None
+        self.assertEqual(shard.longest_first(items, cost), ['x', 9.0, 5.0, 'y', 2.0, 2.0])
+        tests = self._tests()
+        items = sorted(tests.items())
+        shard.longest_first(items, lambda item: shard.weight(item[1], {'test0': 100.0}, item[0]))
+        self.assertEqual(
+            [name for name, _ in items], ['test0'] + ['test%d' % i for i in range(9, 0, -1)]
+        )
+
+    def test_weight_unloaded(self):
+        """
+        Tests of known duration are weighed without loading their records
+        """
+        from gossamer import history, shard
+        from gossamer.data import RecordedTest
+        tests = self._tests()
+        recorded = dict(
+            (name, RecordedTest(name, lambda name=name: tests[name])) for name in tests
+        )
+        durations = dict((name, 1.0) for name in tests if name != 'test9')
+        shard.select(recorded, '1/3', durations)
+        self.assertEqual([name for name in recorded if recorded[name].loaded], ['test9'])
+        class Store(object): # pylint: disable=R0903,C0111
+            failing = lambda self: set()
+            durations = lambda self: dict(durations, test9=1.0)
+        recorded = dict(
+            (name, RecordedTest(name, lambda name=name: tests[name])) for name in tests
+        )
+        self.assertEqual(history.schedule(recorded, Store()).keys(), sorted(tests))
+        self.assertFalse(any(test.loaded for test in recorded.values()))
+
+    def test_merge_results(self):
+        """
+        shard.merge_results combines shards
+        """
+        from gossamer import shard
+        path = tempfile.mkdtemp()
+        try:
+            shard.write_results(
+                os.path.join(path, 'results-1.json'),
+                {'a': (states.OK, None)}, {'a': 1.5}, '1/3'
+            )
+            shard.write_results(
+                os.path.join(path, 'results-3.json'),
+                {'b': (states.FAIL, ValueError('differs'))}, {}, '3/3'
+            )
+            results, durations, missing = shard.merge_results([
+                os.path.join(path, 'results-%d.json' % i) for i in (1, 3)
+            ])
+            self.assertEqual(
+                results, {'a': (states.OK, None), 'b': (states.FAIL, 'differs')}
+            )
+            self.assertEqual(durations, {'a': 1.5})
+            self.assertEqual(missing, [2])
+        finally:
+            shutil.rmtree(path)
+
+
+class TestHistory(unittest.TestCase): # pylint: disable=R0904
+    """
+    History
+    """
+
+    def test_history(self):
+        """
+        history.History orders tests and reports the slowest
+        """
+        from gossamer.data import StepTiming
+        from gossamer.exc import ScreenshotsDiffer
+        from gossamer import history
+        path = tempfile.mkdtemp()
+        try:
+            store = history.History(path, keep=2)
+            store.record(modes.PLAYBACK, {
+                'a': (states.OK, None), 'b': (states.OK, None),
+                'c': (states.FAIL, ScreenshotsDiffer('Screenshot 2 was different.', 2))
+            }, {'a': 1.0, 'b': 10.0, 'c': 3.0}, {
+                'a': [StepTiming(1, 'Click', 0.5, 0.25), StepTiming(2, 'Screenshot', 1.0, 2.0)]
+            })
+            store.record(modes.PLAYBACK, {'a': (states.ERROR, None)}, {'a': 3.0})
+            self.assertEqual(store.durations(), {'a': 2.0, 'b': 10.0, 'c': 3.0})
+            self.assertEqual(store.failing(), set(['a', 'c']))
+            self.assertEqual(store.differed(), {'c': [2]})
+            self.assertEqual(store.slowest_tests(1), [('b', 10.0)])
+            self.assertEqual(store.slowest_steps(1), [('a', 2, 'Screenshot', 1.0, 2.0)])
+            tests = self.__class__._tests()
+            self.assertEqual(
+                history.schedule(tests, store).keys(), ['c', 'a', 'b', 'd']
+            )
+            self.assertEqual(
+                history.schedule(tests, store, failed_first=False).keys(), ['b', 'd', 'c', 'a']
+            )
+            self.assertEqual(
+                history.schedule(tests, store, longest_first=False).keys(), ['a', 'c', 'b', 'd']
+            )
+            store.record(modes.PLAYBACK, {'d': (states.OK, None)}, {'d': 1.0})
+            self.assertEqual(store.durations(), {'a': 3.0, 'd': 1.0})
+            store.close()
+        finally:
+            shutil.rmtree(path)
+
+    @staticmethod
+    def _tests():
+        """
+        Tests a to d, without steps.
+        """
+        from gossamer.data import Test
+        class Settings(object): # pylint: disable=R0903,C0111
+            def __init__(self, name):
+                self.name = name
+        return dict((name, Test(1, Settings(name), [])) for name in 'abcd')
+
+
+class TestImpact(unittest.TestCase): # pylint: disable=R0904
+    """
+    Impact
+    """
+
+    def test_url_index(self):
+        """
+        impact.URLIndex selects tests by the URLs they visit
+        """
+        from gossamer import impact
+        test_dir = os.path.join(os.getcwd(), 'test', 'data')
+        path = tempfile.mkdtemp()
+        try:
+            for test in ('example', 'mdn'):
+                shutil.copytree(os.path.join(test_dir, test), os.path.join(path, test))
+            index = impact.URLIndex(path).update(['example', 'mdn', 'missing'])
+            self.assertEqual(
+                index.urls('example'),
+                ['http://example.com/', 'http://www.iana.org/domains/reserved']
+            )
+            self.assertEqual(index.affected(['/domains']), set(['example']))
+            self.assertEqual(index.affected(['https://developer.mozilla.org/']), set(['mdn']))
+            self.assertEqual(index.affected(['/*/reserved', '/en-US/']), set(['example', 'mdn']))
+            self.assertEqual(index.affected(['/en-US/'], names=['example']), set())
+            self.assertEqual(impact.URLIndex(path).tests, index.tests)
+            with open(os.path.join(path, 'mdn', 'record.json'), 'w') as fp:
+                fp.write('{"half": ')
+            index = impact.URLIndex(path).update(['example', 'mdn'])
+            self.assertEqual(index.tests.keys(), ['example'])
+            self.assertEqual(index.affected(['/nowhere']), set(['mdn']))
+            self.assertEqual(index.affected(['/nowhere'], names=['example']), set())
+            self.assertEqual(impact.URLIndex(path).tests.keys(), ['example'])
+            shutil.copy(
+                os.path.join(test_dir, 'mdn', 'record.json'), os.path.join(path, 'mdn')
+            )
+            index = impact.URLIndex(path).update(['mdn'])
+            self.assertEqual(index.affected(['/nowhere']), set())
+            self.assertEqual(sorted(index.tests), ['example', 'mdn'])
+            os.remove(os.path.join(path, 'mdn', 'record.json'))
+            self.assertEqual(impact.URLIndex(path).update(['mdn']).tests.keys(), ['example'])
+        finally:
+            shutil.rmtree(path)
+
+    def test_changed_names(self):
+        """
+        --changed selects among the tests named, not every test indexed
+        """
+        from gossamer import cli, impact
+        test_dir = os.path.join(os.getcwd(), 'test', 'data')
+        path = tempfile.mkdtemp()
+        try:
+            for test in ('example', 'mdn'):
+                shutil.copytree(os.path.join(test_dir, test), os.path.join(path, test))
+            impact.URLIndex(path).update(['example', 'mdn'])
+            test_files = [os.path.join(test_dir, 'Gossamerfile')]
+            changes = ['/domains', '/en-US/']
+            self.assertEqual(
+                cli._affected(test_files, path, ['example'], changes), ['example'] # pylint: disable=W0212
+            )
+            self.assertEqual(
+                cli._affected(test_files, path, None, changes), ['example', 'mdn'] # pylint: disable=W0212
+            )
+        finally:
+            shutil.rmtree(path)
+
+
+class TestW3C(unittest.TestCase): # pylint: disable=R0904
+    """
+    W3C client
+    """
+
+    def test_remote(self):
+        """
+        w3c.Remote reuses one connection for a session's commands
+        """
+        from gossamer import fake, w3c
+        server = fake.Server(prefix='/wd/hub', screenshot='PNG').start()
+        path = tempfile.mkdtemp()
+        try:
+            connections = w3c.ConnectionPool(server.url)
+            driver = w3c.Remote(server.url, {'browserName': 'firefox'}, pool=connections)
+            self.assertEqual(driver.session_id, '1')
+            driver.get('http://example.com/')
+            self.assertEqual(driver.current_url, 'http://example.com/')
+            self.assertEqual(driver.execute_script('return arguments[0] + 1', 1), None)
+            self.assertEqual(
+                server.drivers[0].last_script, ('return arguments[0] + 1', (1, ))
+            )
+            filename = os.path.join(path, 'screenshot.png')
+            driver.save_screenshot(filename)
+            with open(filename, 'rb') as fp:
+                self.assertEqual(fp.read(), 'PNG')
+            driver.find_element_by_id('name').send_keys('text')
+            driver.find_element_by_class_name('a b').click()
+            driver.quit()
+            self.assertEqual(connections.opened, 1)
+            self.assertEqual(server.requests, [
+                ('POST', '/wd/hub/session'),
+                ('POST', '/wd/hub/session/1/url'),
+                ('GET', '/wd/hub/session/1/url'),
+                ('POST', '/wd/hub/session/1/execute/sync'),
+                ('GET', '/wd/hub/session/1/screenshot'),
+                ('POST', '/wd/hub/session/1/element'),
+                ('POST', '/wd/hub/session/1/element/element-1/value'),
+                ('POST', '/wd/hub/session/1/element'),
+                ('POST', '/wd/hub/session/1/element/element-2/click'),
+                ('DELETE', '/wd/hub/session/1'),
+            ])
+            self.assertEqual(server.elements['element-2'].selector, '[class="a b"]')
+            self.assertEqual(server.drivers[0].commands['sendKeys'], 1)
+            self.assertEqual(server.drivers[0].commands['click'], 1)
+            self.assertEqual(driver.latency['executeScript'][0], 1)
+            self.assertTrue(w3c.latency()['newSession'][0] >= 1)
+            connections.close()
+        finally:
+            server.stop()
+            shutil.rmtree(path)
+
+    def test_retry(self):
+        """
+        w3c.ConnectionPool retries a request which failed on a reused
+        connection only if it's idempotent, and replaces a connection the
+        server closed before sending on it
+        """
+        import socket
+        import threading
+        import time
+        from gossamer import w3c
+        replies = ['reply', 'drop', 'reply', 'drop', 'reply', 'close', 'reply']
+        requests = []
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(5)
+
+        def serve(connection):
+            """
+            Answer requests on a connection as `replies` says, in turn.
+            """
+            stream = connection.makefile('rb')
+            while replies:
+                line = stream.readline()
+                if not line:
+                    break
+                length = 0
+                header = stream.readline()
+                while header.strip():
+                    if header.lower().startswith('content-length:'):
+                        length = int(header.split(':')[1])
+                    header = stream.readline()
+                stream.read(length)
+                requests.append(line.split()[0])
+                reply = replies.pop(0)
+                if reply != 'drop':
+                    connection.sendall(
+                        'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                        'Content-Length: 2\r\n\r\n{}'
+                    )
+                if reply != 'reply':
+                    break
+            connection.close()
+
+        def accept():
+            """
+            Serve each connection on a thread of its own.
+            """
+            while True:
+                try:
+                    connection, _ = listener.accept()
+                except socket.error:
+                    return
+                thread = threading.Thread(target=serve, args=(connection, ))
+                thread.daemon = True
+                thread.start()
+
+        thread = threading.Thread(target=accept)
+        thread.daemon = True
+        thread.start()
+        try:
+            connections = w3c.ConnectionPool('http://127.0.0.1:%d' % listener.getsockname()[1])
+            self.assertEqual(connections.request('GET', '/status'), (200, '{}'))
+            self.assertRaises(
+                Exception, connections.request, 'POST', '/session/1/element/e/click', {}
+            )
+            self.assertEqual(requests, ['GET', 'POST'])
+            self.assertEqual(connections.request('GET', '/status'), (200, '{}'))
+            self.assertEqual(connections.request('GET', '/status'), (200, '{}'))
+            self.assertEqual(requests, ['GET', 'POST', 'GET', 'GET', 'GET'])
+            self.assertEqual(connections.opened, 3)
+            connections.request('DELETE', '/session/1')
+            time.sleep(0.1)
+            self.assertEqual(connections.request('POST', '/session', {}), (200, '{}'))
+            self.assertEqual(requests, ['GET', 'POST', 'GET', 'GET', 'GET', 'DELETE', 'POST'])
+            self.assertEqual(connections.opened, 4)
+            connections.close()
+        finally:
+            listener.close()
+
+
+class _FakeCase(unittest.TestCase): # pylint: disable=R0904
+    """
+    Tests on fake WebDriver sessions, with a data directory of their own
+    """
+
+    def setUp(self):
+        super(_FakeCase, self).setUp()
+        self.path = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.path, 'last'))
+        self._ask = util.ask
+
+    def tearDown(self):
+        util.ask = self._ask
+        shutil.rmtree(self.path)
+
+    def _settings(self, mode, name='fake', path=None, **kwargs):
+        """
+        Settings of a test `name` in `path`, by default the data directory.
+        """
+        from gossamer.data import Settings
+        return Settings(
+            name, 'http://example.com/', mode, path or self.path, 'chrome',
+            (1024, 768), None, (0, 255, 0), False, **kwargs
+        )
+
+    def _write(self, num, png):
+        """
+        Write the original screenshot `num`, returning its bytes.
+        """
+        with open(os.path.join(self.path, 'screenshot%d.png' % num), 'wb') as fp:
+            fp.write(png)
+        return png
+
+    def _answer(self, *answers):
+        """
+        Answer the prompts while recording with `answers`, in turn.
+        """
+        answers = list(answers)
+        util.ask = lambda display, testname=None: answers.pop(0)
+
+
+class TestPlayback(_FakeCase): # pylint: disable=R0904
+    """
+    Playback
+    """
+
+    def test_fake_playback(self):
+        """
+        run.playback plays each kind of step on a fake WebDriver
+        """
+        from gossamer import fake
+        from gossamer.data import Test, Point
+        from gossamer.step import Click, Scroll, Screenshot, Text
+        self._write(1, fake.png())
+        cookie = {'name': 'a', 'value': 'b', 'domain': 'example.com'}
+        test = Test(1, self._settings(modes.PLAYBACK, cookies=[cookie]), [
+            Click(1, Point(10, 10)), Scroll(2, Point(0, 100)),
+            Text(3, 'name', 'id', 'text'), Screenshot(4, 1),
+        ])
+        sessions = fake.SessionPool(1, changing=2)
+        results = pool.run_tests(
+            {'fake': test}, modes.PLAYBACK, sessions, output=util.null_writer
+        )
+        self.assertEqual(results['fake'], (states.OK, None))
+        driver, = sessions.drivers
+        self.assertEqual(driver.window_size, (1024, 768))
+        self.assertEqual(driver.cookies, [cookie])
+        self.assertEqual(driver.commands['addCookie'], 1)
+        self.assertEqual(driver.commands['sendKeys'], 1)
+        self.assertEqual(driver.commands['takeScreenshot'], 1)
+        self.assertTrue(driver.closed)
+
+
+class TestScreenshot(_FakeCase): # pylint: disable=R0904
+    """
+    Screenshots of elements and regions
+    """
+
+    def test_clipped_screenshot(self):
+        """
+        Screenshots of an element are the element's own, and of a region are
+        cropped from the viewport's
+        """
+        from gossamer import fake
+        from gossamer.data import Test
+        from gossamer.step import Screenshot, screenshot_target
+        self.assertEqual(screenshot_target(''), {})
+        self.assertEqual(
+            screenshot_target('#nav'), {'identifier_type': 'id', 'identifier': 'nav'}
+        )
+        self.assertEqual(screenshot_target('0,0,8,4'), {'region': [0, 0, 8, 4]})
+        self.assertRaises(ValueError, screenshot_target, '0,0,8')
+        self._write(1, fake.png(8, 8))
+        self._write(2, fake.png(8, 4))
+        test = Test(1, self._settings(modes.PLAYBACK), [
+            Screenshot(1, 1, **screenshot_target('#nav')),
+            Screenshot(2, 2, **screenshot_target('8,8,8,4')),
+        ])
+        sessions = fake.SessionPool(1)
+        results = pool.run_tests(
+            {'fake': test}, modes.PLAYBACK, sessions, output=util.null_writer
+        )
+        self.assertEqual(results['fake'], (states.OK, None))
+        driver, = sessions.drivers
+        self.assertEqual(driver.commands['takeElementScreenshot'], 1)
+        self.assertEqual(driver.commands['takeScreenshot'], 1)
+
+    def test_cropped_screenshot(self):
+        """
+        Where the driver takes no element screenshots, the recording crops
+        them from the viewport's, and playback then crops them too, but not
+        to nothing
+        """
+        from gossamer import exc, fake
+        from gossamer.step import Screenshot
+        settings = self._settings(modes.RECORD)
+        step = Screenshot(1, 1, identifier='nav', identifier_type='id')
+        driver = fake.Driver(element_screenshots=False)
+        step.capture(driver, settings, modes.RECORD)
+        self.assertEqual(step.method, 'crop')
+        self.assertEqual(driver.commands['takeElementScreenshot'], 1)
+        self.assertEqual(driver.commands['takeScreenshot'], 1)
+
+        driver = fake.Driver()
+        step.capture(driver, settings, modes.PLAYBACK)
+        self.assertNotIn('takeElementScreenshot', driver.commands)
+        self.assertTrue(step.compare(settings))
+
+        step.method = 'element'
+        driver = fake.Driver(element_screenshots=False)
+        self.assertRaises(Exception, step.capture, driver, settings, modes.PLAYBACK)
+
+        step.method = 'crop'
+        driver = fake.Driver()
+        driver.execute_script = lambda script, *args: [0, 0, 0, 16, 1]
+        self.assertRaises(
+            exc.EmptyScreenshot, step.capture, driver, settings, modes.PLAYBACK
+        )
+        step = Screenshot(1, 2, region=[0, 0, 8, 0])
+        self.assertRaises(
+            exc.EmptyScreenshot, step.capture, fake.Driver(), settings, modes.PLAYBACK
+        )
+
+
+class TestRecord(_FakeCase): # pylint: disable=R0904
+    """
+    Recording and verifying recordings
+    """
+
+    def test_record_verify(self):
+        """
+        run.record writes screenshots in the background, and a pool.Verifier
+        verifies the recording on a session of its own
+        """
+        from gossamer import fake
+        from gossamer.data import Test
+        self._answer('', '#nav', 'q')
+        verifier = pool.Verifier(fake.SessionPool(1), output=util.null_writer)
+        results = pool.run_tests(
+            {'fake': Test(1, self._settings(modes.RECORD), None)}, modes.RECORD,
+            fake.SessionPool(1), output=util.null_writer, verify=verifier
+        )
+        record, err = results['fake']
+        self.assertEqual(err, None)
+        self.assertEqual([step.num for step in record.steps], [1, 2])
+        self.assertEqual(record.steps[1].identifier, 'nav')
+        self.assertEqual(record.steps[1].method, 'element')
+        self.assertTrue(os.path.exists(os.path.join(self.path, 'record.json')))
+        self.assertEqual(verifier.wait(), {'fake': (states.OK, None)})
+        driver, = verifier.pool.drivers
+        self.assertEqual(driver.commands['takeScreenshot'], 1)
+        self.assertEqual(driver.commands['takeElementScreenshot'], 1)
+
+    def test_verify_stopped(self):
+        """
+        When a recording raises, pool.Verifier finishes the verifications
+        begun before closing their sessions
+        """
+        from collections import OrderedDict
+        from gossamer import exc, fake
+        from gossamer.data import Test
+        self._answer('', 'q', 'q')
+        tests = OrderedDict()
+        for name in ('first', 'second'):
+            path = os.path.join(self.path, name)
+            os.makedirs(os.path.join(path, 'last'))
+            tests[name] = Test(1, self._settings(modes.RECORD, name, path), None)
+        verifier = pool.Verifier(fake.SessionPool(1, latency=0.01), output=util.null_writer)
+        self.assertRaises(
+            exc.NoScreenshotsRecorded, pool.run_tests, tests, modes.RECORD,
+            fake.SessionPool(1), output=util.null_writer, verify=verifier
+        )
+        self.assertEqual(verifier.close(cancel=True), {'first': (states.OK, None)})
+        driver, = verifier.pool.drivers
+        self.assertTrue(driver.closed)
+
+
+class TestRerecord(_FakeCase): # pylint: disable=R0904
+    """
+    Rerecording
+    """
+
+    def test_rerecord_screenshots(self):
+        """
+        Rerecording selected screenshots takes only those, and stops after
+        the last
+        """
+        from gossamer import cli, fake
+        from gossamer.data import Test
+        from gossamer.step import Screenshot, Text
+        self.assertEqual(
+            cli._select_screenshots('checkout:7,9,login,a:b:2'), # pylint: disable=W0212
+            (['checkout', 'login', 'a:b'], {'checkout': set([7, 9]), 'a:b': set([2])})
+        )
+        test = Test(1, self._settings(modes.RERECORD), [
+            Screenshot(1, 1), Screenshot(2, 2), Text(3, 'name', 'id', 'text'),
+            Screenshot(4, 3),
+        ])
+        baselines = dict((num, self._write(num, fake.png(color=(num, 0, 0)))) for num in (1, 2, 3))
+        self.assertEqual(cli._unknown_screenshots( # pylint: disable=W0212
+            {'fake': test}, {'fake': set([2, 4, 7]), 'other': set([1])}
+        ), ['fake:4', 'fake:7'])
+        sessions = fake.SessionPool(1)
+        results = pool.run_tests(
+            {'fake': test}, modes.RERECORD, sessions, output=util.null_writer,
+            screenshots={'fake': set([2])}
+        )
+        self.assertEqual(results['fake'], (states.OK, None))
+        self.assertEqual(sorted(os.listdir(self.path)), [
+            'last', 'screenshot1.png', 'screenshot2.png', 'screenshot3.png'
+        ])
+        for num in (1, 2, 3):
+            with open(os.path.join(self.path, 'screenshot%d.png' % num), 'rb') as fp:
+                if num == 2:
+                    self.assertNotEqual(fp.read(), baselines[num])
+                else:
+                    self.assertEqual(fp.read(), baselines[num])
+        driver, = sessions.drivers
+        self.assertEqual(driver.commands['takeScreenshot'], 1)
+        self.assertNotIn('sendKeys', driver.commands)
+
+
+class TestFingerprint(_FakeCase): # pylint: disable=R0904
+    """
+    Page fingerprints
+    """
+
+    def test_fingerprint(self):
+        """
+        Screenshots whose page fingerprints match aren't compared, and those
+        which differ report the changed elements
+        """
+        from gossamer import fake, fingerprint
+        from gossamer.data import Test
+        from gossamer.step import Screenshot
+        self._write(1, fake.png(color=(0, 0, 0)))
+        page = {
+            'version': 1, 'viewport': [1024, 768, 2], 'scroll': [0, 0],
+            'resources': [], 'opaque': False, 'elements': [
+                ['/html[1]', '0000000a', [0, 0, 1024, 768]],
+                ['/html[1]/body[1]/div[1]', '0000000b', [10, 20, 30, 40]],
+            ],
+        }
+        settings = self._settings(modes.PLAYBACK, fingerprint=True)
+        test = Test(1, settings, [Screenshot(1, 1)])
+        fingerprint.capture(
+            fake.Driver(fingerprint=page),
+            test.steps[0].get_fingerprint_path(settings)
+        )
+
+        results = pool.run_tests(
+            {'fake': test}, modes.PLAYBACK, fake.SessionPool(1, fingerprint=page),
+            output=util.null_writer
+        )
+        self.assertEqual(results['fake'], (states.OK, None))
+
+        page['elements'][1][1] = '0000000c'
+        results = pool.run_tests(
+            {'fake': test}, modes.PLAYBACK, fake.SessionPool(1, fingerprint=page),
+            output=util.null_writer
+        )
+        self.assertEqual(results['fake'][0], states.FAIL)
+        self.assertIn('(20, 40, 60, 80)', str(results['fake'][1]))
+
+        page['elements'][1][1] = '0000000b'
+        page['opaque'] = True
+        results = pool.run_tests(
+            {'fake': test}, modes.PLAYBACK, fake.SessionPool(1, fingerprint=page),
+            output=util.null_writer
+        )
+        self.assertEqual(results['fake'][0], states.FAIL)